@@ -0,0 +1,51 @@
+from quart import Quart, request
+from quart.sessions import SessionInterface
+import asyncio
+import logging
+import os
+from config import configure_app
+from async_routes import register_routes
+from google_async import create_http_client
+from metrics import instrument_async, start_profiler
+from response_cache import configure_response_cache
+from session_store import ServerSideSessionInterface, create_session_store
+
+# Set up logging
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+
+class AsyncServerSideSessionInterface(SessionInterface):
+    """Quart adapter for the server-side session interface; store calls run on worker threads."""
+
+    def __init__(self, store):
+        self.sessions = ServerSideSessionInterface(store)
+
+    async def open_session(self, app, request):
+        return await asyncio.to_thread(self.sessions.open_session, app, request)
+
+    async def save_session(self, app, session, response):
+        await asyncio.to_thread(self.sessions.save_session, app, session, response)
+
+def create_app():
+    app = Quart(__name__)
+    configure_app(app)
+    configure_response_cache(app.config)
+    app.session_interface = AsyncServerSideSessionInterface(create_session_store(app.config))
+    register_routes(app)
+    instrument_async(app, request)
+    start_profiler(app.config['PROFILE_INTERVAL_MS'])
+
+    # One pooled HTTP client to Google APIs for the whole process
+    @app.before_serving
+    async def open_http_client():
+        app.http_client = create_http_client()
+
+    @app.after_serving
+    async def close_http_client():
+        await app.http_client.close()
+
+    return app
+
+if __name__ == '__main__':
+    # For production, serve with an ASGI server: uvicorn --factory asgi:create_app
+    app = create_app()
+    app.run(host='0.0.0.0', port=5000)
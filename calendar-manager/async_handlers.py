@@ -0,0 +1,312 @@
+import asyncio
+import itertools
+import logging
+from datetime import datetime
+
+from google_auth_oauthlib.flow import Flow
+from oauthlib.oauth2.rfc6749.errors import OAuth2Error
+from quart import Response, current_app, jsonify, redirect, render_template, request, session, url_for
+
+from async_response_cache import invalidate
+from availability import collect_busy, free_slots, freebusy_queries
+from contacts_index import get_contacts_index
+from credential_manager import get_credentials
+from event_store import QUERY_BATCH, EventOrder, get_event_store, range_params
+from gmail import METADATA_HEADERS, get_header
+from google_async import AsyncGoogleClient, GoogleAPIError
+from handlers import LineFormatter, availability_query, event_range, wants_ndjson
+import metrics
+from response_cache import response_cache
+from services import get_service
+from utils import create_message, credentials_to_dict, get_credentials_from_session
+
+REDIRECT_URI = 'http://127.0.0.1:5000/oauth2callback'
+
+
+def google_client():
+    # Expired tokens are refreshed by the client, off the event loop
+    credentials = get_credentials_from_session(session, refresh=False)
+    return AsyncGoogleClient(current_app.http_client, credentials)
+
+async def session_account(client):
+    """Async utils.session_account()."""
+    if 'account' not in session:
+        profile = await client.request('GET', 'gmail', '/users/me/profile')
+        session['account'] = profile['emailAddress'].lower()
+    return session['account']
+
+
+async def index():
+    return await render_template('index.html')
+
+async def check_login():
+    return jsonify({'logged_in': 'credentials' in session})
+
+async def login(app):
+    flow = Flow.from_client_config(
+        client_config=app.config['CLIENT_CONFIG'],
+        scopes=app.config['SCOPES']
+    )
+    flow.redirect_uri = REDIRECT_URI
+    authorization_url, state = flow.authorization_url(
+        access_type='offline',
+        include_granted_scopes='false',
+        prompt='consent'
+    )
+    session['state'] = state
+    return redirect(authorization_url)
+
+async def oauth2callback(app):
+    if 'error' in request.args:
+        logging.error("Error in OAuth callback: %s", request.args['error'])
+        return jsonify({'error': request.args['error']}), 400
+
+    if 'state' not in session:
+        logging.error("No state found in session")
+        return jsonify({'error': 'No state found in session'}), 400
+
+    try:
+        flow = Flow.from_client_config(
+            client_config=app.config['CLIENT_CONFIG'],
+            scopes=app.config['SCOPES'],
+            state=session['state']
+        )
+        flow.redirect_uri = REDIRECT_URI
+
+        # The token exchange is a blocking HTTP call
+        await asyncio.to_thread(flow.fetch_token, authorization_response=request.url)
+
+        # Credentials go under a new session ID, so one set before login can't be reused
+        credentials = flow.credentials
+        session.regenerate()
+        session['credentials'] = credentials_to_dict(credentials)
+        session.pop('account', None)
+
+        missing_scopes = set(app.config['SCOPES']) - set(credentials.scopes)
+        if missing_scopes:
+            logging.error("Missing required scopes: %s", missing_scopes)
+            return jsonify({'error': 'Insufficient permissions granted. Please try logging in again.'}), 400
+
+        return redirect(url_for('main.calendar_events'))
+
+    except OAuth2Error as e:
+        logging.error("OAuth2 error in oauth2callback: %s", e)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.error("Error in oauth2callback: %s", e)
+        return jsonify({'error': 'An unexpected error occurred. Please try again.'}), 500
+
+async def calendar_events():
+    if 'credentials' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    try:
+        start, end = event_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date range: {e}'}), 400
+
+    client = google_client()
+    user = await session_account(client)
+    store = get_event_store(current_app.config['EVENTS_DB'])
+    lines = LineFormatter(wants_ndjson(request))
+
+    # The store is SQLite, so its calls run on worker threads to keep the event loop free.
+    # Until a user's first full sync has finished, and for ranges starting before
+    # the local copy does, the window is listed from Google page by page instead.
+    if not await asyncio.to_thread(store.covers, user, start) or not await sync_events(client, store, user):
+        # Without a local copy it is built once the response is out
+        current_app.add_background_task(backfill_events, client, store, user)
+        async def live():
+            order = EventOrder()
+            for line in lines.head():
+                yield line
+            async for page in client.pages('calendar', '/calendars/primary/events', range_params(start, end)):
+                for line in lines.lines(order.add(page)):
+                    yield line
+            for line in lines.lines(order.finish()):
+                yield line
+            for line in lines.tail():
+                yield line
+        return Response(live(), mimetype=lines.mimetype)
+
+    async def body():
+        # Lines are pulled a query batch at a time on a worker thread
+        chunks = lines.body(store.iter_query(user, start, end))
+        while batch := await asyncio.to_thread(lambda: list(itertools.islice(chunks, QUERY_BATCH))):
+            for chunk in batch:
+                yield chunk
+
+    return Response(body(), mimetype=lines.mimetype)
+
+async def backfill_events(client, store, user):
+    if not await asyncio.to_thread(store.begin_backfill, user):
+        return
+    try:
+        await pull_events(client, store, user, None)
+    except Exception:
+        logging.exception("Initial event sync failed")
+    finally:
+        store.end_backfill(user)
+
+async def sync_events(client, store, user):
+    """Async EventStore.sync()."""
+    ready, sync_token = await asyncio.to_thread(store.pending_sync, user)
+    if sync_token is None:
+        return ready
+    try:
+        await pull_events(client, store, user, sync_token)
+    except GoogleAPIError as error:
+        if error.status != 410:
+            raise
+        await asyncio.to_thread(store.expire, user)
+        return False
+    return True
+
+async def pull_events(client, store, user, sync_token):
+    params, synced_from = await asyncio.to_thread(store.sync_params, user, sync_token)
+    async for page in client.pages('calendar', '/calendars/primary/events', params):
+        await asyncio.to_thread(store.apply_page, user, page, synced_from)
+
+async def availabilities():
+    if 'credentials' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    try:
+        query = availability_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid availability query: {e}'}), 400
+
+    client = google_client()
+    calendar_ids = query.pop('calendar_ids')
+    bodies = freebusy_queries(calendar_ids, query['window_start'], query['window_end'], query['tz'].zone)
+
+    # All freebusy chunks are requested concurrently
+    results = await client.gather([('POST', 'calendar', '/freeBusy', None, body) for body in bodies])
+    slots = free_slots(
+        collect_busy(results, calendar_ids),
+        vectorized=current_app.config.get('AVAILABILITY_VECTORIZED', False),
+        **query
+    )
+    return jsonify([{'start': start.isoformat(), 'end': end.isoformat()} for start, end in slots])
+
+async def todays_emails():
+    if 'credentials' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    try:
+        client = google_client()
+
+        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        now = datetime.now()
+        query = f'after:{int(today_start.timestamp())} before:{int(now.timestamp())}'
+
+        results = await client.request('GET', 'gmail', '/users/me/messages', params={'q': query})
+        messages = await client.batch_get('gmail', [
+            (f"/users/me/messages/{message['id']}", {'format': 'metadata', 'metadataHeaders': METADATA_HEADERS})
+            for message in results.get('messages', [])
+        ])
+
+        emails = []
+        for msg in messages:
+            headers = msg['payload']['headers']
+            emails.append({
+                'id': msg['id'],
+                'subject': get_header(headers, 'subject', 'No Subject'),
+                'sender': get_header(headers, 'from', 'Unknown Sender'),
+                'date': get_header(headers, 'date', 'Unknown Date'),
+                'internal_date': datetime.fromtimestamp(int(msg['internalDate']) / 1000).isoformat(),
+                'snippet': msg['snippet']
+            })
+
+        return jsonify({
+            'query': query,
+            'total_results': results['resultSizeEstimate'],
+            'emails': emails
+        })
+
+    except GoogleAPIError as error:
+        logging.error("An HTTP error occurred: %s", error)
+        return jsonify({'error': str(error)}), 500
+
+async def contacts():
+    if 'credentials' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    # The contacts index keeps its own SQLite sync state, so it runs on a worker thread
+    info = session['credentials']
+    user = await session_account(google_client())
+    index = get_contacts_index(current_app.config['CONTACTS_DB'])
+
+    def ranked_contacts():
+        credentials = get_credentials(info)
+        return index.contacts(user, get_service('gmail', 'v1', credentials))
+
+    return jsonify(await asyncio.to_thread(ranked_contacts))
+
+async def send_email():
+    if 'credentials' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    data = await request.get_json()
+    to = data.get('to')
+    subject = data.get('subject')
+    body = data.get('body')
+
+    if not all([to, subject, body]):
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    try:
+        message = create_message('me', to, subject, body)
+        sent_message = await google_client().request('POST', 'gmail', '/users/me/messages/send', json=message)
+        await invalidate(['todays_emails', 'contacts'])
+        return jsonify({'message': 'Email sent successfully', 'id': sent_message['id']})
+    except GoogleAPIError as error:
+        logging.error("An HTTP error occurred: %s", error)
+        return jsonify({'error': str(error)}), 500
+
+async def create_event():
+    if 'credentials' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    data = await request.get_json()
+    summary = data.get('summary', '').strip()
+    start = data.get('start')
+    end = data.get('end')
+    time_zone = data.get('timeZone', 'UTC')
+
+    if not all([summary, start, end]):
+        return jsonify({'error': 'Missing required fields: summary, start, end.'}), 400
+
+    event = {
+        'summary': summary,
+        'location': data.get('location', '').strip(),
+        'description': data.get('description', '').strip(),
+        'start': {'dateTime': start, 'timeZone': time_zone},
+        'end': {'dateTime': end, 'timeZone': time_zone},
+    }
+
+    client = google_client()
+    try:
+        created_event = await client.request('POST', 'calendar', '/calendars/primary/events', json=event)
+    except GoogleAPIError as error:
+        logging.error("Google Calendar API error: %s", error.content)
+        return jsonify({'error': error.content}), error.status
+
+    store = get_event_store(current_app.config['EVENTS_DB'])
+    await asyncio.to_thread(store.mark_stale, await session_account(client))
+    await invalidate(['calendar_events', 'availabilities'])
+    logging.info("Event created successfully: %s", created_event['id'])
+    return jsonify({'message': 'Event created successfully', 'id': created_event['id']}), 200
+
+async def cache_stats():
+    return jsonify(response_cache.stats())
+
+async def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+async def profile():
+    if metrics.profiler is None:
+        return jsonify({'error': 'Profiler is off; set PROFILE_INTERVAL_MS to enable it'}), 404
+    if request.args.get('reset'):
+        metrics.profiler.reset()
+    return Response(metrics.profiler.collapsed(), mimetype='text/plain')
@@ -0,0 +1,88 @@
+import asyncio
+from functools import wraps
+
+from quart import Response, current_app, request, session
+from quart.wrappers.response import IterableBody
+
+from metrics import upstream_calls
+from response_cache import (
+    MAX_ENTRY_BYTES, Recorder, _Entry, cache_key, mark_streamed, response_cache, session_user, validators
+)
+
+
+async def invalidate(endpoints=None):
+    user = session_user(session)
+    if user is not None:
+        await asyncio.to_thread(response_cache.invalidate, user, endpoints)
+
+
+def cached(endpoint):
+    """response_cache.cached() for Quart handlers, sharing the same cache and invalidation store.
+
+    Generation lookups may read SQLite, so cache calls run on worker threads.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(*args, **kwargs):
+            ttl = current_app.config['CACHE_TTLS'].get(endpoint, 0)
+            user = session_user(session)
+            if request.method != 'GET' or user is None or ttl <= 0:
+                return await handler(*args, **kwargs)
+
+            key = cache_key(user, endpoint, request)
+            entry = await asyncio.to_thread(response_cache.get, key)
+            if entry is not None:
+                response = Response(entry.body, status=entry.status, mimetype=entry.mimetype)
+                return await conditional(response, entry, endpoint, 'HIT')
+
+            generation = await asyncio.to_thread(response_cache.generation, user)
+            before = upstream_calls()
+            response = await current_app.make_response(await handler(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            if isinstance(response.response, IterableBody):
+                # Keep streaming to the client; the entry is stored once the body is complete
+                response.response = _recording(response.response, Recorder(key, response, ttl, before, generation))
+                mark_streamed(response)
+                return response
+
+            body = await response.get_data()
+            entry = _Entry(body, response.status_code, response.mimetype, upstream_calls() - before, ttl)
+            if len(body) <= MAX_ENTRY_BYTES:
+                await asyncio.to_thread(response_cache.put, key, entry, generation)
+            return await conditional(response, entry, endpoint, 'MISS')
+        return wrapper
+    return decorator
+
+
+async def conditional(response, entry, endpoint, status):
+    validators(response, entry, status)
+    await response.make_conditional(request)
+    if response.status_code == 304:
+        response_cache.count_not_modified(endpoint)
+    return response
+
+
+class _recording:
+    """Response body passing the chunks of `body` through to the client and to `recorder`."""
+
+    def __init__(self, body, recorder):
+        self.body = body
+        self.recorder = recorder
+
+    async def __aenter__(self):
+        self._chunks = await self.body.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.body.__aexit__(exc_type, exc_value, tb)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        async for chunk in self._chunks:
+            yield chunk
+            self.recorder.add(chunk)
+        await asyncio.to_thread(self.recorder.finish)
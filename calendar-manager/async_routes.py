@@ -0,0 +1,22 @@
+from quart import Blueprint
+import async_handlers as handlers
+from async_response_cache import cached
+
+bp = Blueprint('main', __name__)
+
+def register_routes(app):
+    bp.route('/', endpoint='index')(handlers.index)
+    bp.route('/check_login', endpoint='check_login')(handlers.check_login)
+    bp.route('/login', endpoint='login')(lambda: handlers.login(app))
+    bp.route('/oauth2callback', endpoint='oauth2callback')(lambda: handlers.oauth2callback(app))
+    bp.route('/calendar_events', endpoint='calendar_events')(cached('calendar_events')(handlers.calendar_events))
+    bp.route('/availabilities', endpoint='availabilities')(cached('availabilities')(handlers.availabilities))
+    bp.route('/todays_emails', endpoint='todays_emails')(cached('todays_emails')(handlers.todays_emails))
+    bp.route('/contacts', endpoint='contacts')(cached('contacts')(handlers.contacts))
+    bp.route('/cache_stats', endpoint='cache_stats')(handlers.cache_stats)
+    bp.route('/metrics', endpoint='metrics')(handlers.prometheus_metrics)
+    bp.route('/debug/profile', endpoint='profile')(handlers.profile)
+    bp.route('/send_email', methods=['POST'], endpoint='send_email')(handlers.send_email)
+    bp.route('/create_event', methods=['POST'], endpoint='create_event')(handlers.create_event)
+
+    app.register_blueprint(bp)
@@ -0,0 +1,269 @@
+import logging
+from array import array
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+
+import pytz
+
+try:
+    import numpy as np
+except ImportError:  # The vectorized path is optional
+    np = None
+
+# freebusy.query limits: calendars per request, and we keep each request's span modest
+MAX_CALENDARS_PER_QUERY = 50
+MAX_QUERY_SPAN = timedelta(days=60)
+
+
+def to_timestamp(value):
+    return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+
+
+def parse_periods(periods):
+    return [(to_timestamp(start), to_timestamp(end)) for start, end in periods]
+
+
+def parse_periods_np(periods):
+    """Parse (start, end) RFC 3339 strings into int64 epoch-second arrays."""
+    starts = [start for start, _ in periods]
+    ends = [end for _, end in periods]
+    if all(value.endswith('Z') for value in starts + ends):
+        # numpy parses naive ISO strings natively, so drop the UTC designator
+        starts = np.array([value[:-1] for value in starts], dtype='datetime64[s]')
+        ends = np.array([value[:-1] for value in ends], dtype='datetime64[s]')
+        return starts.astype(np.int64), ends.astype(np.int64)
+    # Offsets other than Z fall back to the standard library parser
+    return (np.array([to_timestamp(value) for value in starts], dtype=np.int64),
+            np.array([to_timestamp(value) for value in ends], dtype=np.int64))
+
+
+def merge_intervals(intervals):
+    """Sort (start, end) pairs and merge the overlapping ones."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        elif end > start:
+            merged.append([start, end])
+    return merged
+
+
+def complement(merged, window_start, window_end):
+    """Gaps between merged busy intervals, clipped to [window_start, window_end)."""
+    gaps = []
+    current = window_start
+    for start, end in merged:
+        if end <= current:
+            continue
+        if start >= window_end:
+            break
+        if current < start:
+            gaps.append((current, start))
+        current = max(current, end)
+    if current < window_end:
+        gaps.append((current, window_end))
+    return gaps
+
+
+def free_gaps(intervals, window_start, window_end):
+    gaps = complement(merge_intervals(intervals), window_start, window_end)
+    return [start for start, _ in gaps], [end for _, end in gaps]
+
+
+def free_gaps_np(starts, ends, window_start, window_end):
+    """Vectorized merge + complement: sort, take the running max of ends, emit the gaps."""
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    running_end = np.maximum.accumulate(ends) if len(ends) else ends
+
+    # A new busy block begins wherever an interval starts after everything before it ended
+    new_block = np.ones(len(starts), dtype=bool)
+    new_block[1:] = starts[1:] > running_end[:-1]
+    block_starts = starts[new_block]
+    block_ends = running_end[np.r_[np.flatnonzero(new_block)[1:] - 1, len(starts) - 1]] if len(starts) else ends
+
+    gap_starts = np.maximum(np.r_[window_start, block_ends], window_start)
+    gap_ends = np.minimum(np.r_[block_starts, window_end], window_end)
+    keep = gap_ends > gap_starts
+    return gap_starts[keep], gap_ends[keep]
+
+
+def off_hours(window_start, window_end, tz, work_start, work_end, workdays=range(5)):
+    """Busy intervals covering everything outside working hours in `tz`."""
+    working = []
+    day = datetime.fromtimestamp(window_start, tz).date() - timedelta(days=1)
+    last_day = datetime.fromtimestamp(window_end, tz).date() + timedelta(days=1)
+    while day <= last_day:
+        if day.weekday() in workdays:
+            opens = tz.localize(datetime.combine(day, work_start))
+            closes = tz.localize(datetime.combine(day, work_end))
+            working.append([int(opens.timestamp()), int(closes.timestamp())])
+        day += timedelta(days=1)
+    return complement(working, window_start, window_end)
+
+
+class BusyIndex:
+    """Array-backed free/busy index over one window.
+
+    Busy intervals from any number of calendars are merged once and the free
+    gaps are stored in parallel sorted arrays. first_slot() searches a max
+    tree over gap lengths, built in linear time on its first call (merging
+    the intervals already cost more), so each query is O(log n) however much
+    of the window is booked solid.
+    """
+
+    def __init__(self, gap_starts, gap_ends, window_start, window_end):
+        self.window_start = window_start
+        self.window_end = window_end
+        self.starts = array('q', gap_starts)
+        self.ends = array('q', gap_ends)
+        self._longest = None
+
+    @classmethod
+    def from_intervals(cls, intervals, window_start, window_end):
+        return cls(*free_gaps(intervals, window_start, window_end), window_start, window_end)
+
+    @classmethod
+    def from_arrays(cls, starts, ends, window_start, window_end):
+        gap_starts, gap_ends = free_gaps_np(starts, ends, window_start, window_end)
+        return cls(gap_starts.tolist(), gap_ends.tolist(), window_start, window_end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def free_slots(self, min_duration=0, start=None, end=None):
+        start = self.window_start if start is None else start
+        end = self.window_end if end is None else end
+        slots = []
+        i = bisect_right(self.ends, start)
+        while i < len(self.starts) and self.starts[i] < end:
+            slot_start, slot_end = max(self.starts[i], start), min(self.ends[i], end)
+            if slot_end > slot_start and slot_end - slot_start >= min_duration:
+                slots.append((slot_start, slot_end))
+            i += 1
+        return slots
+
+    def first_slot(self, duration, after=None):
+        """First (start, start + duration) that is free for everyone, or None."""
+        after = self.window_start if after is None else after
+        i = bisect_right(self.ends, after)
+        if i == len(self.starts):
+            return None
+        # The gap containing `after` may be cut short
+        start = max(self.starts[i], after)
+        if self.ends[i] - start >= duration:
+            return start, start + duration
+        i = self._first_gap(i + 1, duration)
+        return None if i is None else (self.starts[i], self.starts[i] + duration)
+
+    def _first_gap(self, lo, duration):
+        """Index of the first gap from `lo` on lasting at least `duration`, or None."""
+        if self._longest is None:
+            self._build_tree()
+        tree, size = self._longest, self._size
+        if lo >= len(self.starts):
+            return None
+        # Climb until the subtree at k (which starts at or after lo) holds a long enough gap
+        k = lo + size
+        while tree[k] < duration:
+            while k & 1:
+                k >>= 1
+            if k == 0:
+                return None
+            k += 1
+        # Then descend to its leftmost such leaf
+        while k < size:
+            k = 2 * k if tree[2 * k] >= duration else 2 * k + 1
+        return k - size if k - size < len(self.starts) else None
+
+    def _build_tree(self):
+        # Leaves are gap lengths (padded with zeros), inner nodes the max of their children
+        size = 1
+        while size < len(self.starts):
+            size *= 2
+        tree = array('q', bytes(16 * size))
+        tree[size:size + len(self.starts)] = array('q', map(int.__sub__, self.ends, self.starts))
+        for k in range(size - 1, 0, -1):
+            tree[k] = max(tree[2 * k], tree[2 * k + 1])
+        self._longest, self._size = tree, size
+
+
+def freebusy_queries(calendar_ids, time_min, time_max, time_zone='UTC'):
+    """Request bodies for freebusy.query, chunked by calendars and time span."""
+    chunk_start = time_min
+    while chunk_start < time_max:
+        chunk_end = min(chunk_start + MAX_QUERY_SPAN, time_max)
+        for i in range(0, len(calendar_ids), MAX_CALENDARS_PER_QUERY):
+            yield {
+                'timeMin': chunk_start.isoformat(),
+                'timeMax': chunk_end.isoformat(),
+                'timeZone': time_zone,
+                'items': [{'id': calendar_id} for calendar_id in calendar_ids[i:i + MAX_CALENDARS_PER_QUERY]]
+            }
+        chunk_start = chunk_end
+
+
+def collect_busy(results, calendar_ids=()):
+    """Busy (start, end) strings per calendar from freebusy.query responses."""
+    busy = {calendar_id: [] for calendar_id in calendar_ids}
+    for result in results:
+        for calendar_id, calendar in result.get('calendars', {}).items():
+            if calendar.get('errors'):
+                logging.warning("Free/busy unavailable for %s: %s", calendar_id, calendar['errors'])
+            busy.setdefault(calendar_id, []).extend(
+                (period['start'], period['end']) for period in calendar.get('busy', [])
+            )
+    return busy
+
+
+def query_busy(service, calendar_ids, time_min, time_max, time_zone='UTC'):
+    results = (
+        service.freebusy().query(body=body).execute()
+        for body in freebusy_queries(calendar_ids, time_min, time_max, time_zone)
+    )
+    return collect_busy(results, calendar_ids)
+
+
+def parse_working_hours(value):
+    """Parse 'HH:MM-HH:MM' into a pair of times."""
+    opens, closes = value.split('-')
+    return time.fromisoformat(opens.strip()), time.fromisoformat(closes.strip())
+
+
+def find_availability(service, calendar_ids, window_start, window_end, tz=pytz.UTC, **options):
+    """Common free slots across calendars, as (start, end) datetimes in `tz`."""
+    busy = query_busy(service, calendar_ids, window_start, window_end, tz.zone)
+    return free_slots(busy, window_start, window_end, tz, **options)
+
+
+def free_slots(busy, window_start, window_end, tz=pytz.UTC, min_duration=timedelta(0),
+               working_hours=None, first_only=False, vectorized=False):
+    """Free slots given the busy periods of every calendar."""
+    start_ts, end_ts = int(window_start.timestamp()), int(window_end.timestamp())
+
+    periods = [period for calendar in busy.values() for period in calendar]
+    masked = off_hours(start_ts, end_ts, tz, *working_hours) if working_hours else []
+
+    if vectorized and np is not None:
+        starts, ends = parse_periods_np(periods)
+        if masked:
+            starts = np.concatenate([starts, np.array([start for start, _ in masked], dtype=np.int64)])
+            ends = np.concatenate([ends, np.array([end for _, end in masked], dtype=np.int64)])
+        index = BusyIndex.from_arrays(starts, ends, start_ts, end_ts)
+    else:
+        index = BusyIndex.from_intervals(parse_periods(periods) + masked, start_ts, end_ts)
+
+    duration = int(min_duration.total_seconds())
+    if first_only:
+        slot = index.first_slot(max(duration, 1))
+        slots = [slot] if slot else []
+    else:
+        slots = index.free_slots(duration)
+
+    return [
+        (datetime.fromtimestamp(start, tz), datetime.fromtimestamp(end, tz))
+        for start, end in slots
+    ]
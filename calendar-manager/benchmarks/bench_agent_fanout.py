@@ -0,0 +1,83 @@
+"""End-to-end latency of multi-intent commands through the calendar agent graph.
+
+Compares the graph, which fans independent actions out in one step, with running
+the same action nodes one after another. The in-memory backend sleeps `--latency`
+seconds per API call. Run from the calendar-manager directory:
+
+    python benchmarks/bench_agent_fanout.py --latency 0.1
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, '..'))
+from calendar_backends import InMemoryCalendarBackend  # noqa: E402
+
+# The agent module name has a hyphen, so load it by path
+spec = importlib.util.spec_from_file_location('calendar_agent', os.path.join(HERE, '..', 'callendar_manager-agent.py'))
+agent = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(agent)
+
+COMMANDS = [
+    'check availability and send reminders',
+    'accept the invitation, check availability and send reminders',
+    'reschedule the meeting, accept it, send reminders and check availability',
+]
+
+
+def backend(latency):
+    now = datetime.now(timezone.utc)
+    event = {
+        'id': 'standup', 'summary': 'Standup',
+        'start': {'dateTime': (now + timedelta(hours=1)).isoformat()},
+        'end': {'dateTime': (now + timedelta(hours=2)).isoformat()},
+        'attendees': [{'email': 'me@example.com', 'self': True, 'responseStatus': 'needsAction'},
+                      {'email': 'team@example.com', 'responseStatus': 'accepted'}],
+    }
+    return InMemoryCalendarBackend([event], latency=latency)
+
+
+def sequential(state, config):
+    state = dict(state, **agent.decide_next_action(state))
+    details = {}
+    for action in state['actions']:
+        details.update(getattr(agent, action)(state, config)['event_details'])
+    return details
+
+
+def parallel(state, config):
+    return agent.calendar_manager.invoke(state, config)['event_details']
+
+
+def timed(run, state, latency, repeat):
+    times = []
+    for _ in range(repeat):
+        # A fresh calendar each run, since reminders already sent are skipped
+        config = {'configurable': {'backend': backend(latency)}}
+        start = time.perf_counter()
+        run(state, config)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for command in COMMANDS:
+        state = {'user_input': command, 'event': {'id': 'standup'}}
+        seq = timed(sequential, state, args.latency, args.repeat)
+        par = timed(parallel, state, args.latency, args.repeat)
+        n_actions = len(agent.parse_actions(command))
+        print(f"{n_actions} actions  sequential={seq:7.1f} ms  graph={par:7.1f} ms  ({seq / par:.1f}x)  {command!r}")
+
+
+if __name__ == '__main__':
+    main()
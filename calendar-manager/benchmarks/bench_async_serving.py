@@ -0,0 +1,144 @@
+"""Load test the sync (Flask) and async (Quart) apps against a local fake Google API.
+
+The fake API and both apps run in separate local processes; a pool of concurrent clients hits one
+endpoint and we report throughput and p50/p99 latency. Run from the
+calendar-manager directory:
+
+    python benchmarks/bench_async_serving.py --endpoint /todays_emails --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from fake_google import FakeGoogle  # noqa: E402
+
+CREDENTIALS = {
+    'token': 'fake-token',
+    'refresh_token': None,
+    'token_uri': 'https://oauth2.googleapis.com/token',
+    'client_id': 'bench',
+    'client_secret': 'bench',
+    'scopes': ['https://www.googleapis.com/auth/calendar'],
+}
+
+
+def run_fake(latency, urls):
+    with FakeGoogle(n_messages=10, n_events=50, latency=latency) as fake:
+        urls.put(fake.url)
+        threading.Event().wait()
+
+
+def run_app(mode, port):
+    # Quiet the DEBUG logging, which would otherwise dominate the measurement
+    logging.disable(logging.INFO)
+    if mode == 'sync':
+        from werkzeug.serving import make_server
+        import main
+
+        make_server('127.0.0.1', port, main.create_app(), threaded=True).serve_forever()
+    else:
+        import uvicorn
+        import asgi
+
+        uvicorn.run(asgi.create_app(), host='127.0.0.1', port=port, log_level='warning')
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+async def load(url, cookie, n_requests, concurrency):
+    import aiohttp
+
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, headers={'Cookie': f'session={cookie}'},
+                                     timeout=aiohttp.ClientTimeout(total=120)) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                async with client.get(url) as response:
+                    await response.read()
+                latencies.append(time.perf_counter() - start)
+                errors += response.status != 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n_requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'throughput': n_requests / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--endpoint', default='/todays_emails')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    # The fake API and each app get their own process, so they don't share a GIL with the load client
+    urls = multiprocessing.Queue()
+    fake = multiprocessing.Process(target=run_fake, args=(args.latency, urls), daemon=True)
+    fake.start()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['GOOGLE_API_ROOT'] = urls.get()
+    os.environ['EVENTS_DB'] = os.path.join(workdir, 'events.db')
+    os.environ['CONTACTS_DB'] = os.path.join(workdir, 'contacts.db')
+    os.environ['SESSIONS_DB'] = os.path.join(workdir, 'sessions.db')
+    # Only the Flask routes have the response cache, so turn it off to compare the serving paths
+    for endpoint in ('calendar_events', 'availabilities', 'todays_emails', 'contacts'):
+        os.environ[f'CACHE_TTL_{endpoint.upper()}'] = '0'
+    with open(os.path.join(workdir, 'client_secret.json'), 'w') as f:
+        json.dump({'web': {'client_id': 'bench', 'client_secret': 'bench',
+                           'auth_uri': 'https://accounts.google.com/o/oauth2/auth',
+                           'token_uri': 'https://oauth2.googleapis.com/token'}}, f)
+    os.chdir(workdir)
+
+    from session_store import SqliteSessionStore, new_session_id
+
+    # Both apps read the logged-in session from the same SQLite store
+    cookie = new_session_id()
+    SqliteSessionStore(os.environ['SESSIONS_DB']).save(cookie, {'credentials': CREDENTIALS})
+
+    for mode, port in [('sync', 5101), ('async', 5102)]:
+        server = multiprocessing.Process(target=run_app, args=(mode, port), daemon=True)
+        server.start()
+        wait_for_port(port)
+        stats = asyncio.run(load(f'http://127.0.0.1:{port}{args.endpoint}', cookie,
+                                 args.requests, args.concurrency))
+        server.terminate()
+        print(f"{mode:<6} {stats['throughput']:8.1f} req/s  p50={stats['p50']:8.1f} ms  "
+              f"p99={stats['p99']:8.1f} ms  errors={stats['errors']}")
+
+    fake.terminate()
+
+
+if __name__ == '__main__':
+    main()
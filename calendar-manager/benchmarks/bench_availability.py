@@ -0,0 +1,74 @@
+"""Build and query times for the free/busy index on synthetic calendars.
+
+Run from the calendar-manager directory:
+
+    python benchmarks/bench_availability.py --calendars 20 --events 100000
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from availability import BusyIndex, complement, merge_intervals  # noqa: E402
+
+QUARTER = 91 * 24 * 3600
+SLOT = 30 * 60
+
+
+def synthetic_calendars(n_calendars, n_events, coverage, seed=0):
+    """Random events whose mean length leaves roughly `1 - coverage` of the quarter free."""
+    rng = random.Random(seed)
+    mean_length = -math.log(1 - coverage) * QUARTER / n_events
+    intervals = []
+    for _ in range(n_calendars):
+        for _ in range(n_events // n_calendars):
+            start = rng.randrange(0, QUARTER, 60)
+            intervals.append((start, start + int(rng.expovariate(1 / mean_length)) + 60))
+    return intervals
+
+
+def linear_first_slot(gaps, duration, after):
+    for start, end in gaps:
+        start = max(start, after)
+        if end - start >= duration:
+            return start, start + duration
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calendars', type=int, default=20)
+    parser.add_argument('--events', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--coverage', type=float, default=0.9)
+    args = parser.parse_args()
+
+    intervals = synthetic_calendars(args.calendars, args.events, args.coverage)
+    rng = random.Random(1)
+    queries = [(rng.choice([SLOT, 2 * SLOT, 4 * SLOT]), rng.randrange(0, QUARTER)) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    index = BusyIndex.from_intervals(intervals, 0, QUARTER)
+    print(f"build      {len(intervals)} events -> {len(index)} gaps in {time.perf_counter() - start:.3f} s")
+
+    gaps = complement(merge_intervals(intervals), 0, QUARTER)
+    expected = [linear_first_slot(gaps, duration, after) for duration, after in queries]
+
+    start = time.perf_counter()
+    found = [index.first_slot(duration, after) for duration, after in queries]
+    first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for duration, after in queries:
+        index.free_slots(duration, after, after + 7 * 24 * 3600)
+    week = time.perf_counter() - start
+
+    assert found == expected
+    print(f"first slot {first / len(queries) * 1e6:9.1f} us/query")
+    print(f"week slots {week / len(queries) * 1e6:9.1f} us/query")
+
+if __name__ == '__main__':
+    main()
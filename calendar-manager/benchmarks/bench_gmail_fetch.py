@@ -0,0 +1,44 @@
+"""Wall-clock time to fetch N Gmail messages serially versus in batches.
+
+Run from the calendar-manager directory:
+
+    python benchmarks/bench_gmail_fetch.py --messages 500 --latency 0.02
+"""
+import argparse
+import os
+import sys
+import time
+
+import httplib2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from fake_google import FakeGoogle, fake_service  # noqa: E402
+from gmail import fetch_messages  # noqa: E402
+
+
+def serial(service, ids):
+    return [service.users().messages().get(userId='me', id=message_id).execute() for message_id in ids]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    with FakeGoogle(n_messages=args.messages, latency=args.latency) as fake:
+        service = fake_service('gmail', 'v1', fake, httplib2.Http())
+        listing = service.users().messages().list(userId='me', maxResults=args.messages).execute()
+        ids = [message['id'] for message in listing['messages']]
+
+        for label, fetch in [('serial', serial), ('batched', fetch_messages)]:
+            fake.reset()
+            start = time.perf_counter()
+            messages = fetch(service, ids)
+            elapsed = time.perf_counter() - start
+            assert len(messages) == len(ids)
+            print(f"{label:<8} {len(ids)} messages in {elapsed:7.3f} s  ({fake.round_trips} round trips)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""The original per-event availability loop versus the Python and NumPy merge paths.
+
+All three produce the same JSON for the same busy periods. Run from the
+calendar-manager directory:
+
+    python benchmarks/bench_interval_merge.py
+"""
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from availability import BusyIndex, parse_periods, parse_periods_np  # noqa: E402
+
+WINDOW_START = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+WINDOW_END = datetime(2024, 2, 1, tzinfo=pytz.UTC) - timedelta(seconds=1)
+
+
+def synthetic_periods(n_events, seed=0):
+    rng = random.Random(seed)
+    span = int((WINDOW_END - WINDOW_START).total_seconds())
+    periods = []
+    for _ in range(n_events):
+        start = WINDOW_START + timedelta(seconds=rng.randrange(0, span, 60))
+        end = start + timedelta(minutes=rng.choice([5, 15, 30, 60]))
+        periods.append((start.strftime('%Y-%m-%dT%H:%M:%SZ'), end.strftime('%Y-%m-%dT%H:%M:%SZ')))
+    return periods
+
+
+def original_loop(periods):
+    # The per-event loop previously inlined in handlers.availabilities
+    busy_times = []
+    for start, end in periods:
+        start = datetime.fromisoformat(start.replace('Z', '+00:00'))
+        end = datetime.fromisoformat(end.replace('Z', '+00:00'))
+        busy_times.append((start, end))
+    busy_times.sort(key=lambda x: x[0])
+    available_times = []
+    current_time = WINDOW_START
+    for busy_start, busy_end in busy_times:
+        if current_time < busy_start:
+            available_times.append({'start': current_time.isoformat(), 'end': busy_start.isoformat()})
+        current_time = max(current_time, busy_end)
+    if current_time < WINDOW_END:
+        available_times.append({'start': current_time.isoformat(), 'end': WINDOW_END.isoformat()})
+    return available_times
+
+
+def to_json(index):
+    return [
+        {'start': datetime.fromtimestamp(start, pytz.UTC).isoformat(),
+         'end': datetime.fromtimestamp(end, pytz.UTC).isoformat()}
+        for start, end in index.free_slots()
+    ]
+
+
+def python_path(periods):
+    start, end = int(WINDOW_START.timestamp()), int(WINDOW_END.timestamp())
+    return to_json(BusyIndex.from_intervals(parse_periods(periods), start, end))
+
+
+def numpy_path(periods):
+    start, end = int(WINDOW_START.timestamp()), int(WINDOW_END.timestamp())
+    return to_json(BusyIndex.from_arrays(*parse_periods_np(periods), start, end))
+
+
+def timed(fn, periods, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(periods)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    for n_events in (1_000, 10_000, 100_000):
+        periods = synthetic_periods(n_events)
+        results = {}
+        for label, fn in [('loop', original_loop), ('python', python_path), ('numpy', numpy_path)]:
+            elapsed, results[label] = timed(fn, periods)
+            print(f"{n_events:>7} events  {label:<7} {elapsed * 1000:9.2f} ms")
+        assert json.dumps(results['loop']) == json.dumps(results['python']) == json.dumps(results['numpy'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Per-request latency of building Google API clients with and without the service cache.
+
+Run from the calendar-manager directory:
+
+    python benchmarks/bench_service_cache.py --requests 500
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import httplib2
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services import ServiceCache  # noqa: E402
+
+EVENTS = json.dumps({'items': [
+    {'id': str(i), 'start': {'dateTime': '2024-01-01T10:00:00Z'}, 'end': {'dateTime': '2024-01-01T11:00:00Z'}}
+    for i in range(20)
+]}).encode('utf-8')
+
+
+class StubHttp:
+    """Local transport that answers every call with a canned events page."""
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=None, connection_type=None):
+        return httplib2.Response({'status': '200', 'content-type': 'application/json'}), EVENTS
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return p50 * 1000, p99 * 1000
+
+
+def run(label, get_service, n_requests, n_users):
+    users = [Credentials(token=f'token-{i}', refresh_token=f'refresh-{i}', client_id='bench')
+             for i in range(n_users)]
+    samples = []
+    for i in range(n_requests):
+        credentials = users[i % n_users]
+        start = time.perf_counter()
+        service = get_service('calendar', 'v3', credentials)
+        service.events().list(calendarId='primary').execute()
+        samples.append(time.perf_counter() - start)
+    p50, p99 = percentiles(samples)
+    print(f"{label:<10} p50={p50:8.3f} ms  p99={p99:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--users', type=int, default=10)
+    args = parser.parse_args()
+
+    def uncached(api, version, credentials):
+        return build(api, version, http=StubHttp(), static_discovery=True)
+
+    cache = ServiceCache(http_factory=lambda credentials: StubHttp())
+
+    run('uncached', uncached, args.requests, args.users)
+    run('cached', cache.get, args.requests, args.users)
+
+
+if __name__ == '__main__':
+    main()
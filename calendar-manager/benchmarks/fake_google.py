@@ -0,0 +1,185 @@
+"""A small local stand-in for the Gmail and Calendar REST APIs used by the benchmarks.
+
+Every request sleeps for `latency` seconds to model the network round trip,
+so the benchmarks measure how many round trips a code path makes.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MESSAGE_PATH = re.compile(r'^/gmail/v1/users/me/messages/([^/?]+)$')
+
+
+def fake_message(message_id):
+    return {
+        'id': message_id,
+        'threadId': message_id,
+        'historyId': '1',
+        'internalDate': '1700000000000',
+        'snippet': f'Snippet for {message_id}',
+        'payload': {'headers': [
+            {'name': 'From', 'value': f'Sender {message_id} <sender{message_id}@example.com>'},
+            {'name': 'To', 'value': 'me@example.com, "Doe, Jane" <jane@example.com>'},
+            {'name': 'Subject', 'value': f'Subject {message_id}'},
+            {'name': 'Date', 'value': 'Tue, 14 Nov 2023 22:13:20 +0000'},
+        ]},
+    }
+
+
+def fake_event(i):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(hours=3 * i)
+    return {
+        'id': f'event{i}',
+        'summary': f'Event {i}',
+        'start': {'dateTime': start.strftime('%Y-%m-%dT%H:%M:%SZ')},
+        'end': {'dateTime': (start + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%SZ')},
+    }
+
+
+class FakeGoogle:
+    def __init__(self, n_messages=500, n_events=50, latency=0.02, error_rate=0.0):
+        self.n_messages = n_messages
+        self.n_events = n_events
+        self.latency = latency
+        # Fraction of sends rejected with 429, to exercise retries
+        self.error_rate = error_rate
+        self._random = random.Random(0)
+        self.round_trips = 0
+        self.calls = 0
+        self.sent = []
+        self._lock = threading.Lock()
+        # The default listen backlog of 5 would drop connections under load
+        ThreadingHTTPServer.request_queue_size = 1024
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.round_trips = 0
+            self.calls = 0
+
+    def dispatch(self, method, path, body=b''):
+        """Answer a single API call, returning (status, payload)."""
+        with self._lock:
+            self.calls += 1
+        parsed = urlparse(path)
+        query = parse_qs(parsed.query)
+
+        if parsed.path == '/gmail/v1/users/me/messages' and method == 'GET':
+            limit = int(query.get('maxResults', ['100'])[0])
+            ids = [str(i) for i in range(min(limit, self.n_messages))]
+            return 200, {'messages': [{'id': i, 'threadId': i} for i in ids],
+                         'resultSizeEstimate': len(ids)}
+        if parsed.path == '/gmail/v1/users/me/messages/send' and method == 'POST':
+            with self._lock:
+                if self._random.random() < self.error_rate:
+                    return 429, {'error': {'code': 429, 'message': 'Rate limit exceeded'}}
+                self.sent.append(body)
+            return 200, {'id': uuid.uuid4().hex, 'threadId': 't'}
+        if parsed.path == '/calendar/v3/calendars/primary/events' and method == 'GET':
+            return 200, {'items': [fake_event(i) for i in range(self.n_events)], 'nextSyncToken': 'sync'}
+        if parsed.path == '/calendar/v3/calendars/primary/events' and method == 'POST':
+            return 200, dict(json.loads(body or b'{}'), id=uuid.uuid4().hex)
+        if parsed.path == '/calendar/v3/freeBusy' and method == 'POST':
+            request = json.loads(body or b'{}')
+            busy = [{'start': event['start']['dateTime'], 'end': event['end']['dateTime']}
+                    for event in map(fake_event, range(self.n_events))]
+            return 200, {'calendars': {item['id']: {'busy': busy} for item in request.get('items', [])}}
+        match = MESSAGE_PATH.match(parsed.path)
+        if match and method == 'GET':
+            return 200, fake_message(match.group(1))
+        return 404, {'error': {'code': 404, 'message': f'No fake for {method} {parsed.path}'}}
+
+    def _handle_batch(self, handler, body):
+        boundary = handler.headers.get_param('boundary')
+        message = BytesParser(policy=HTTP).parsebytes(
+            f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n\r\n'.encode() + body
+        )
+        response_boundary = uuid.uuid4().hex
+        parts = []
+        for part in message.iter_parts():
+            content_id = part['Content-ID'].strip('<>')
+            payload = part.get_payload(decode=True)
+            text = payload.decode() if isinstance(payload, bytes) else payload
+            request_line, _, rest = text.replace('\r\n', '\n').partition('\n')
+            method, path, _ = request_line.split(' ', 2)
+            inner_body = rest.partition('\n\n')[2].encode()
+            status, payload = self.dispatch(method, path, inner_body)
+            parts.append(
+                f'--{response_boundary}\r\n'
+                'Content-Type: application/http\r\n'
+                f'Content-ID: <response-{content_id}>\r\n\r\n'
+                f'HTTP/1.1 {status} OK\r\n'
+                'Content-Type: application/json\r\n\r\n'
+                f'{json.dumps(payload)}\r\n'
+            )
+        parts.append(f'--{response_boundary}--\r\n')
+        return 200, ''.join(parts).encode(), f'multipart/mixed; boundary={response_boundary}'
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; don't let Nagle delay the second
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                with fake._lock:
+                    fake.round_trips += 1
+                time.sleep(fake.latency)
+
+                if self.path.split('/')[1] == 'batch':
+                    status, content, content_type = fake._handle_batch(self, body)
+                else:
+                    status, payload = fake.dispatch(method, self.path, body)
+                    content, content_type = json.dumps(payload).encode(), 'application/json'
+
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self._serve('GET')
+
+            def do_POST(self):
+                self._serve('POST')
+
+        return Handler
+
+
+def fake_service(api, version, fake, http):
+    """Build a client for `api` whose root URL points at the fake server."""
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+
+    doc = json.loads(get_static_doc(api, version))
+    doc['rootUrl'] = fake.url
+    return build_from_document(doc, http=http)
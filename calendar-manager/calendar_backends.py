@@ -0,0 +1,192 @@
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import pytz
+
+from availability import find_availability, free_slots
+from gmail import account_id
+from reminders import ReminderDispatcher, ReminderLog, build_reminders, get_reminder_log, gmail_sender
+from services import get_service
+
+
+def slot_dicts(slots):
+    return [{'start': start.isoformat(), 'end': end.isoformat()} for start, end in slots]
+
+
+class CalendarBackend(ABC):
+    """Calendar operations used by the agent graph.
+
+    Methods take and return Google Calendar API shaped dicts, so nodes don't
+    care which backend they run against.
+    """
+
+    # Whose reminders these are, and where sent reminders are recorded
+    user = 'me'
+    reminder_log = None
+
+    @abstractmethod
+    def create_event(self, event):
+        ...
+
+    @abstractmethod
+    def update_event(self, event_id, changes):
+        ...
+
+    @abstractmethod
+    def delete_event(self, event_id):
+        ...
+
+    @abstractmethod
+    def accept_invitation(self, event_id):
+        ...
+
+    @abstractmethod
+    def upcoming_events(self, start, end):
+        ...
+
+    @abstractmethod
+    def availability(self, calendar_ids, start, end):
+        ...
+
+    def send_reminders(self, start, end):
+        """Remind the attendees of every event starting in [start, end), skipping ones already reminded."""
+        reminders = build_reminders(self.upcoming_events(start, end))
+        dispatcher = ReminderDispatcher(self.send_message, self.reminder_log or get_reminder_log())
+        return dispatcher.dispatch(self.user, reminders)
+
+    @abstractmethod
+    def send_message(self, message):
+        """Send one MIME message built by utils.create_message, returning its id."""
+
+
+class GoogleCalendarBackend(CalendarBackend):
+    def __init__(self, calendar, gmail=None, calendar_id='primary', user='me', reminder_log=None):
+        self.calendar = calendar
+        self.gmail = gmail
+        self.calendar_id = calendar_id
+        self.user = user
+        self.reminder_log = reminder_log
+        self._send = gmail_sender(gmail) if gmail is not None else None
+
+    @classmethod
+    def from_credentials(cls, credentials, **kwargs):
+        gmail = get_service('gmail', 'v1', credentials)
+        return cls(get_service('calendar', 'v3', credentials), gmail, user=account_id(gmail), **kwargs)
+
+    def create_event(self, event):
+        return self.calendar.events().insert(calendarId=self.calendar_id, body=event).execute()
+
+    def update_event(self, event_id, changes):
+        return self.calendar.events().patch(calendarId=self.calendar_id, eventId=event_id, body=changes).execute()
+
+    def delete_event(self, event_id):
+        self.calendar.events().delete(calendarId=self.calendar_id, eventId=event_id).execute()
+
+    def accept_invitation(self, event_id):
+        event = self.calendar.events().get(calendarId=self.calendar_id, eventId=event_id).execute()
+        attendees = event.get('attendees', [])
+        for attendee in attendees:
+            if attendee.get('self'):
+                attendee['responseStatus'] = 'accepted'
+        return self.update_event(event_id, {'attendees': attendees})
+
+    def upcoming_events(self, start, end):
+        events = []
+        page_token = None
+        while True:
+            page = self.calendar.events().list(
+                calendarId=self.calendar_id, timeMin=start.isoformat(), timeMax=end.isoformat(),
+                singleEvents=True, orderBy='startTime', pageToken=page_token
+            ).execute()
+            events.extend(page.get('items', []))
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return events
+
+    def availability(self, calendar_ids, start, end):
+        return slot_dicts(find_availability(self.calendar, calendar_ids, start, end))
+
+    def send_message(self, message):
+        return self._send(message)
+
+
+class InMemoryCalendarBackend(CalendarBackend):
+    """Local stand-in for tests and benchmarks; `latency` simulates an API round trip."""
+
+    def __init__(self, events=(), latency=0.0):
+        self.latency = latency
+        self.events = {event['id']: dict(event) for event in events}
+        self.sent = []
+        self.reminder_log = ReminderLog(':memory:')
+        self._lock = threading.Lock()
+
+    def _call(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def create_event(self, event):
+        self._call()
+        event = dict(event, id=event.get('id') or uuid.uuid4().hex, status='confirmed')
+        with self._lock:
+            if event['id'] in self.events:
+                raise ValueError(f"Event {event['id']} already exists")
+            self.events[event['id']] = event
+        return event
+
+    def update_event(self, event_id, changes):
+        self._call()
+        with self._lock:
+            if event_id not in self.events:
+                raise KeyError(event_id)
+            self.events[event_id].update(changes)
+            return dict(self.events[event_id])
+
+    def delete_event(self, event_id):
+        self._call()
+        with self._lock:
+            del self.events[event_id]
+
+    def accept_invitation(self, event_id):
+        with self._lock:
+            attendees = [dict(attendee) for attendee in self.events[event_id].get('attendees', [])]
+        for attendee in attendees:
+            if attendee.get('self'):
+                attendee['responseStatus'] = 'accepted'
+        return self.update_event(event_id, {'attendees': attendees})
+
+    def upcoming_events(self, start, end):
+        self._call()
+        with self._lock:
+            events = list(self.events.values())
+        return sorted(
+            (event for event in events if start <= _start_of(event) < end),
+            key=_start_of
+        )
+
+    def availability(self, calendar_ids, start, end):
+        self._call()
+        with self._lock:
+            busy = {
+                calendar_id: [(_iso(event['start']), _iso(event['end'])) for event in self.events.values()
+                              if event.get('transparency') != 'transparent']
+                for calendar_id in calendar_ids
+            }
+        return slot_dicts(free_slots(busy, start, end))
+
+    def send_message(self, message):
+        self._call()
+        with self._lock:
+            self.sent.append(message)
+            return str(len(self.sent))
+
+
+def _iso(value):
+    return value.get('dateTime') or value['date'] + 'T00:00:00+00:00'
+
+
+def _start_of(event):
+    start = datetime.fromisoformat(_iso(event['start']).replace('Z', '+00:00'))
+    return start if start.tzinfo else pytz.UTC.localize(start)
@@ -1,38 +1,136 @@
-from typing import Optional, TypedDict
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, Optional, TypedDict
+
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END, START
 
+from calendar_backends import InMemoryCalendarBackend
+
+# Whole words that select each action node, checked in order for every clause of the input
+ACTION_KEYWORDS = [
+    ("accept_invitation", ("accept", "accept_invitation")),
+    ("send_reminders", ("remind", "reminder", "reminders", "send_reminders")),
+    ("retrieve_availability", ("availability", "available", "free", "retrieve_availability")),
+    ("create_event", ("create", "schedule", "add", "book")),
+    ("update_event", ("update", "reschedule", "move", "change")),
+    ("delete_event", ("delete", "cancel", "remove")),
+]
+ACTIONS = [action for action, _ in ACTION_KEYWORDS]
+CLAUSE_SEPARATORS = re.compile(r"\band\b|\bthen\b|[,;]")
+
+
+def merge_details(left: dict, right: dict) -> dict:
+    # Actions run in parallel, each writing its own key
+    return {**(left or {}), **(right or {})}
+
+
 # Define the state for the graph
-class CalendarState(TypedDict):
+class CalendarState(TypedDict, total=False):
     user_input: str
-    event_details: Optional[dict] = None
+    actions: list[str]
+    # Arguments for the actions: the event to create/update (with 'id' to update,
+    # delete or accept), and the calendars/window to check or send reminders for
+    event: Optional[dict]
+    calendar_ids: Optional[list[str]]
+    window: Optional[dict]
+    event_details: Annotated[dict, merge_details]
+
+
+def parse_actions(user_input: str) -> list[str]:
+    """Actions requested by the input, in order, e.g. "check availability and send reminders"."""
+    actions = []
+    for clause in CLAUSE_SEPARATORS.split(user_input.lower()):
+        for action, keywords in ACTION_KEYWORDS:
+            if any(re.search(r"\b" + re.escape(keyword) + r"\b", clause) for keyword in keywords) and action not in actions:
+                actions.append(action)
+                break
+    return actions
 
-# Define the logic for each node
-def create_event(state: CalendarState) -> CalendarState:
-    # Logic to create a calendar event
-    return {"event_details": {"status": "created"}}
 
-def update_event(state: CalendarState) -> CalendarState:
-    # Logic to update a calendar event
-    return {"event_details": {"status": "updated"}}
+def get_backend(config: RunnableConfig):
+    backend = config.get("configurable", {}).get("backend")
+    if backend is None:
+        raise ValueError('Pass a calendar backend as config["configurable"]["backend"]')
+    return backend
 
-def delete_event(state: CalendarState) -> CalendarState:
-    # Logic to delete a calendar event
-    return {"event_details": {"status": "deleted"}}
 
-def send_reminders(state: CalendarState) -> CalendarState:
-    # Logic to send reminders for events
-    return {"event_details": {"status": "reminder sent"}}
+def get_window(state: CalendarState):
+    window = state.get("window") or {}
+    start = datetime.fromisoformat(window["start"]) if window.get("start") else datetime.now(timezone.utc)
+    end = datetime.fromisoformat(window["end"]) if window.get("end") else start + timedelta(days=1)
+    return start, end
 
-def accept_invitation(start: CalendarState) -> CalendarState:
-    return {"event_details": {"status": "invitation accepted"}}
 
-def retrieve_availability(state: CalendarState) -> CalendarState:
-    # Logic to retrieve availability
-    return {"event_details": {"status": "availability retrieved"}}
+def get_event(state: CalendarState, with_id=False) -> dict:
+    event = state.get("event")
+    if not event or (with_id and "id" not in event):
+        raise ValueError("No event id given" if with_id else "No event given")
+    return event
+
+
+def run_action(name, state: CalendarState, action) -> CalendarState:
+    # One failing action shouldn't discard the results of the ones running beside it
+    try:
+        result = action()
+    except Exception as e:
+        result = {"status": "failed", "error": str(e)}
+    return {"event_details": {name: result}}
+
+
+# Define the logic for each node
+def create_event(state: CalendarState, config: RunnableConfig) -> CalendarState:
+    backend = get_backend(config)
+    return run_action("create_event", state, lambda: {
+        "status": "created", "event": backend.create_event(get_event(state))
+    })
+
+def update_event(state: CalendarState, config: RunnableConfig) -> CalendarState:
+    backend = get_backend(config)
+
+    def update():
+        event = get_event(state, with_id=True)
+        changes = {key: value for key, value in event.items() if key != "id"}
+        return {"status": "updated", "event": backend.update_event(event["id"], changes)}
+
+    return run_action("update_event", state, update)
+
+def delete_event(state: CalendarState, config: RunnableConfig) -> CalendarState:
+    backend = get_backend(config)
+
+    def delete():
+        event_id = get_event(state, with_id=True)["id"]
+        backend.delete_event(event_id)
+        return {"status": "deleted", "id": event_id}
+
+    return run_action("delete_event", state, delete)
+
+def send_reminders(state: CalendarState, config: RunnableConfig) -> CalendarState:
+    backend = get_backend(config)
+    return run_action("send_reminders", state, lambda: {
+        "status": "reminder sent", "reminders": backend.send_reminders(*get_window(state))
+    })
+
+def accept_invitation(state: CalendarState, config: RunnableConfig) -> CalendarState:
+    backend = get_backend(config)
+    return run_action("accept_invitation", state, lambda: {
+        "status": "invitation accepted", "event": backend.accept_invitation(get_event(state, with_id=True)["id"])
+    })
+
+def retrieve_availability(state: CalendarState, config: RunnableConfig) -> CalendarState:
+    backend = get_backend(config)
+    calendar_ids = state.get("calendar_ids") or ["primary"]
+    return run_action("retrieve_availability", state, lambda: {
+        "status": "availability retrieved", "slots": backend.availability(calendar_ids, *get_window(state))
+    })
 
 def decide_next_action(state: CalendarState) -> CalendarState:
-    # Return the user_input as part of the state
-    return {"user_input": state["user_input"]}
+    return {"actions": parse_actions(state["user_input"])}
+
+def route_actions(state: CalendarState):
+    # Independent actions fan out and run in the same step, in parallel
+    return state["actions"] or END
+
 
 # Create the graph
 graph = StateGraph(CalendarState)
@@ -47,36 +145,24 @@ graph.add_node("retrieve_availability", retrieve_availability)
 graph.add_node("accept_invitation", accept_invitation)
 
 # Set entry point
-# graph.set_entry_point("decide_next_action")
 graph.add_edge(START, "decide_next_action")
 
 # Add edges
-graph.add_conditional_edges(
-    "decide_next_action",
-    lambda x: x["user_input"],
-    {
-        "create": "create_event",
-        "update": "update_event",
-        "delete": "delete_event",
-        "send_reminders": "send_reminders",
-        "retrieve_availability": "retrieve_availability",
-        "accept_invitation": "accept_invitation",
-        "end": END
-    },
-)
-
+graph.add_conditional_edges("decide_next_action", route_actions, ACTIONS + [END])
 
 # Add edges from action nodes to END
-for action in ["create_event", "update_event", "delete_event", "send_reminders", "retrieve_availability", "accept_invitation"]:
+for action in ACTIONS:
     graph.add_edge(action, END)
 
 # Compile the graph
 calendar_manager = graph.compile()
 
 if __name__ == "__main__":
+    # Runs against a local in-memory calendar; use GoogleCalendarBackend.from_credentials for the real one
+    config = {"configurable": {"backend": InMemoryCalendarBackend()}}
     while True:
         user_input = input("Enter action (create/update/delete/send_reminders/retrieve_availability/end): ").strip().lower()
-        result = calendar_manager.invoke({"user_input": user_input})
+        result = calendar_manager.invoke({"user_input": user_input}, config)
         print(f"Result: {result}")
         if user_input == "end":
             break
@@ -30,3 +30,27 @@ def configure_app(app):
     app.config['SCOPES'] = SCOPES
     app.config['CLIENT'] = client
 
+    # Local SQLite index of Gmail contacts and copy of the primary calendar
+    app.config['CONTACTS_DB'] = os.environ.get('CONTACTS_DB', 'contacts.db')
+    app.config['EVENTS_DB'] = os.environ.get('EVENTS_DB', 'events.db')
+
+    # Server-side sessions: 'sqlite' is shared by every worker, 'memory' is per process
+    app.config['SESSION_STORE'] = os.environ.get('SESSION_STORE', 'sqlite')
+    app.config['SESSIONS_DB'] = os.environ.get('SESSIONS_DB', 'sessions.db')
+
+    # Response cache invalidations go through this SQLite file, so a write through one worker
+    # invalidates every worker's cached responses; empty keeps them per process
+    app.config['CACHE_DB'] = os.environ.get('CACHE_DB', 'cache.db')
+
+    # Response cache lifetime per endpoint, in seconds (0 disables caching), e.g. CACHE_TTL_CONTACTS=600
+    app.config['CACHE_TTLS'] = {
+        endpoint: int(os.environ.get(f'CACHE_TTL_{endpoint.upper()}', ttl))
+        for endpoint, ttl in [('calendar_events', 30), ('availabilities', 60), ('todays_emails', 60), ('contacts', 300)]
+    }
+
+    # Sample every thread's stack this often for /debug/profile (milliseconds); off when unset
+    app.config['PROFILE_INTERVAL_MS'] = int(os.environ.get('PROFILE_INTERVAL_MS', 0))
+
+    # Merge busy intervals with NumPy instead of the pure Python loop
+    app.config['AVAILABILITY_VECTORIZED'] = os.environ.get('AVAILABILITY_VECTORIZED') == '1'
+
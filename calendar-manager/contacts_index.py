@@ -0,0 +1,175 @@
+import logging
+import sqlite3
+import threading
+import time
+from email.utils import formataddr, getaddresses
+
+from googleapiclient.errors import HttpError
+
+from gmail import ADDRESS_HEADERS, fetch_messages
+
+# Number of recent messages used to seed a new index
+SEED_MESSAGES = 500
+# Skip the history check if the index was synced this recently (seconds)
+MIN_SYNC_INTERVAL = 60
+# Contacts last seen RECENCY_HALF_LIFE seconds ago weigh half as much as current ones
+RECENCY_HALF_LIFE = 30 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    user TEXT NOT NULL,
+    address TEXT NOT NULL,
+    name TEXT,
+    count INTEGER NOT NULL DEFAULT 0,
+    last_seen INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user, address)
+);
+CREATE TABLE IF NOT EXISTS seen_messages (
+    user TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    PRIMARY KEY (user, message_id)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    user TEXT PRIMARY KEY,
+    history_id TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+def parse_addresses(headers):
+    """Parse address headers with the RFC 5322 parser, returning (name, address) pairs."""
+    values = [header['value'] for header in headers if header['name'].title() in ADDRESS_HEADERS]
+    for name, address in getaddresses(values):
+        address = address.strip().lower()
+        if '@' in address:
+            yield name.strip(), address
+
+
+class ContactsIndex:
+    """Per-user contacts index in SQLite, kept fresh with Gmail history IDs."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def contacts(self, user, service, limit=None):
+        self.sync(user, service)
+        return self.ranked(user, limit)
+
+    def ranked(self, user, limit=None, now=None):
+        now = int(now or time.time())
+        # Frequency weighted by a hyperbolic recency decay
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT name, address FROM contacts
+                WHERE user = ?
+                ORDER BY count * 1.0 / (1 + (? - last_seen) * 1.0 / ?) DESC, last_seen DESC
+                LIMIT ?
+                """,
+                (user, now, RECENCY_HALF_LIFE, -1 if limit is None else limit)
+            ).fetchall()
+        return [formataddr((name, address)) if name else address for name, address in rows]
+
+    def sync(self, user, service):
+        with self._lock:
+            state = self._conn.execute(
+                'SELECT history_id, synced_at FROM sync_state WHERE user = ?', (user,)
+            ).fetchone()
+
+        if state is None:
+            self._seed(user, service)
+            return
+
+        history_id, synced_at = state
+        if time.time() - synced_at < MIN_SYNC_INTERVAL:
+            return
+
+        try:
+            message_ids, latest_history_id = self._history(service, history_id)
+        except HttpError as error:
+            if error.resp.status != 404:
+                raise
+            # The start history ID is too old to be served, so rebuild from scratch
+            logging.info("History %s expired for contacts index, reseeding", history_id)
+            self._seed(user, service)
+            return
+
+        self._record(user, fetch_messages(service, message_ids, headers=ADDRESS_HEADERS) if message_ids else [])
+        self._save_state(user, latest_history_id)
+
+    def _seed(self, user, service):
+        # Read the current history ID first, so nothing added during seeding is missed
+        history_id = service.users().getProfile(userId='me').execute()['historyId']
+        results = service.users().messages().list(userId='me', maxResults=SEED_MESSAGES).execute()
+        message_ids = [message['id'] for message in results.get('messages', [])]
+        messages = fetch_messages(service, message_ids, headers=ADDRESS_HEADERS)
+
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM contacts WHERE user = ?', (user,))
+            self._conn.execute('DELETE FROM seen_messages WHERE user = ?', (user,))
+        self._record(user, messages)
+        self._save_state(user, history_id)
+
+    def _history(self, service, start_history_id):
+        message_ids = []
+        latest_history_id = start_history_id
+        page_token = None
+        while True:
+            response = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes='messageAdded',
+                pageToken=page_token
+            ).execute()
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message_ids.append(added['message']['id'])
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return message_ids, latest_history_id
+
+    def _record(self, user, messages):
+        with self._lock, self._conn:
+            for msg in messages:
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO seen_messages (user, message_id) VALUES (?, ?)',
+                    (user, msg['id'])
+                )
+                if cursor.rowcount == 0:
+                    continue
+                seen = int(msg.get('internalDate', 0)) // 1000
+                for name, address in parse_addresses(msg['payload']['headers']):
+                    self._conn.execute(
+                        """
+                        INSERT INTO contacts (user, address, name, count, last_seen) VALUES (?, ?, ?, 1, ?)
+                        ON CONFLICT (user, address) DO UPDATE SET
+                            count = count + 1,
+                            name = CASE WHEN excluded.name != '' THEN excluded.name ELSE name END,
+                            last_seen = MAX(last_seen, excluded.last_seen)
+                        """,
+                        (user, address, name, seen)
+                    )
+
+    def _save_state(self, user, history_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sync_state (user, history_id, synced_at) VALUES (?, ?, ?)',
+                (user, str(history_id), time.time())
+            )
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_contacts_index(path):
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = ContactsIndex(path)
+        return _indexes[path]
@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from google.auth.exceptions import RefreshError, TransportError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+from services import credentials_key, user_key
+
+# Refresh tokens this long before they expire (seconds)
+REFRESH_AHEAD = 5 * 60
+# Drop users that have not made a request for this long (seconds)
+IDLE_TTL = 2 * 60 * 60
+DEFAULT_MAXSIZE = 1024
+# Wait this long before retrying a failed background refresh (seconds)
+RETRY_DELAY = 30
+# Longest sleep of the background refresher when nothing is due (seconds)
+MAX_SLEEP = 60
+
+CREDENTIAL_FIELDS = ('token', 'refresh_token', 'token_uri', 'client_id', 'client_secret', 'scopes')
+
+
+def credentials_from_dict(info):
+    kwargs = {field: info.get(field) for field in CREDENTIAL_FIELDS}
+    if isinstance(kwargs['scopes'], str):
+        kwargs['scopes'] = kwargs['scopes'].split()
+    credentials = Credentials(**kwargs)
+    if info.get('expiry'):
+        # google-auth keeps expiry as a naive UTC datetime
+        credentials.expiry = datetime.fromisoformat(info['expiry'])
+    return credentials
+
+
+def info_key(info):
+    """credentials_key() for a session credentials dict, without building Credentials."""
+    return user_key(info.get('client_id'), info.get('refresh_token') or info.get('token'))
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def expires_within(credentials, seconds):
+    if credentials.expiry is None:
+        return not credentials.token
+    return credentials.expiry - timedelta(seconds=seconds) <= utcnow()
+
+
+class _Entry:
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.refresh_lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.retry_at = 0
+
+
+class CredentialManager:
+    """Per-user cache of parsed Credentials, refreshed shortly before they expire.
+
+    Refreshes are single-flight: concurrent requests for the same user wait for
+    one token call instead of each making their own.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, refresh_ahead=REFRESH_AHEAD, idle_ttl=IDLE_TTL,
+                 request_factory=Request, background=True):
+        self.maxsize = maxsize
+        self.refresh_ahead = refresh_ahead
+        self.idle_ttl = idle_ttl
+        self.request_factory = request_factory
+        self.background = background
+        self.refreshes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+
+    def get(self, info, refresh=True):
+        """Cached Credentials for a session credentials dict.
+
+        With refresh=False an expired token is returned as is, for callers that
+        refresh off their own thread (see refresh()).
+        """
+        key = info_key(info)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(credentials_from_dict(info))
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+            entry.last_used = time.monotonic()
+            if self.background:
+                self._start_refresher()
+                self._wakeup.notify()
+
+        if refresh and not entry.credentials.valid:
+            self._refresh(entry, entry.credentials.token)
+        return entry.credentials
+
+    def refresh(self, credentials, stale_token=None):
+        """Refresh credentials, unless another caller already replaced `stale_token`.
+
+        Without a stale token this only refreshes credentials that are no longer valid.
+        """
+        with self._lock:
+            entry = self._entries.get(credentials_key(credentials))
+        if entry is None or entry.credentials is not credentials:
+            entry = _Entry(credentials)
+        if stale_token is None:
+            if credentials.valid:
+                return credentials
+            stale_token = credentials.token
+        self._refresh(entry, stale_token)
+        return credentials
+
+    def _refresh(self, entry, stale_token, blocking=True, ahead=0):
+        credentials = entry.credentials
+        if not credentials.refresh_token:
+            return False
+        if not entry.refresh_lock.acquire(blocking):
+            return False
+        try:
+            # Whoever held the lock before us may already have fetched a new token
+            if credentials.token != stale_token and credentials.valid and not expires_within(credentials, ahead):
+                return True
+            credentials.refresh(self.request_factory())
+            self.refreshes += 1
+            return True
+        finally:
+            entry.refresh_lock.release()
+
+    def _start_refresher(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='credential-refresher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                due, sleep = self._due()
+                if not due:
+                    self._wakeup.wait(sleep)
+                    continue
+
+            for entry in due:
+                try:
+                    # A request already refreshing this user inline wins; skip it here
+                    self._refresh(entry, None, blocking=False, ahead=self.refresh_ahead)
+                except (RefreshError, TransportError) as error:
+                    logging.warning("Background token refresh failed: %s", error)
+                # Also covers tokens that are issued with less than refresh_ahead to live
+                entry.retry_at = time.monotonic() + RETRY_DELAY
+
+    def _due(self):
+        # Called with the lock held: evict idle users, collect the ones close to expiry
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if now - entry.last_used > self.idle_ttl]:
+            del self._entries[key]
+
+        due = []
+        sleep = MAX_SLEEP
+        for entry in self._entries.values():
+            credentials = entry.credentials
+            if not credentials.refresh_token or credentials.expiry is None or entry.retry_at > now:
+                continue
+            if expires_within(credentials, self.refresh_ahead):
+                due.append(entry)
+            else:
+                until = (credentials.expiry - utcnow()).total_seconds() - self.refresh_ahead
+                sleep = min(sleep, until)
+        return due, max(sleep, 1)
+
+    def invalidate(self, info):
+        with self._lock:
+            self._entries.pop(info_key(info), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+credential_manager = CredentialManager()
+
+
+def get_credentials(info, refresh=True):
+    return credential_manager.get(info, refresh)
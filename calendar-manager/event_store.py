@@ -0,0 +1,319 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from googleapiclient.errors import HttpError
+
+# Skip the delta sync if the store was synced this recently (seconds)
+MIN_SYNC_INTERVAL = 30
+# How far back the initial full sync reaches; older ranges are read from Google directly
+FULL_SYNC_PAST = timedelta(days=365)
+PAGE_SIZE = 2500
+# Rows read per local query batch when streaming
+QUERY_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    user TEXT NOT NULL,
+    id TEXT NOT NULL,
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user, id)
+);
+CREATE INDEX IF NOT EXISTS events_by_start ON events (user, start_ts);
+CREATE TABLE IF NOT EXISTS event_sync_state (
+    user TEXT PRIMARY KEY,
+    sync_token TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    synced_from INTEGER
+);
+"""
+
+
+def format_event(event):
+    return {
+        'id': event.get('id'),
+        'start': event['start'].get('dateTime', event['start'].get('date')),
+        'end': event['end'].get('dateTime', event['end'].get('date')),
+        'organizer': event.get('organizer', {}).get('displayName'),
+        'description': event.get('description', 'No description'),
+        'location': event.get('location', 'No location specified'),
+        'status': event.get('status', 'unknown'),
+        'summary': event.get('summary', 'No summary')
+    }
+
+
+def to_timestamp(value):
+    # All-day events only carry a date, which we read as midnight UTC
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+class EventStore:
+    """Per-user local copy of the primary calendar, kept fresh with sync tokens."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._backfills = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(event_sync_state)')]
+        if 'synced_from' not in columns:
+            # Stores from before the column existed get a fresh full sync
+            self._conn.execute('ALTER TABLE event_sync_state ADD COLUMN synced_from INTEGER')
+
+    def events(self, user, service, start, end):
+        """Formatted events overlapping [start, end), synced first if stale."""
+        return [json.loads(data) for data in self.stream(user, service, start, end)]
+
+    def query(self, user, start, end):
+        return [json.loads(data) for data in self.iter_query(user, start, end)]
+
+    def iter_query(self, user, start, end, batch_size=QUERY_BATCH):
+        """Serialized events overlapping [start, end), read in keyset-paginated batches."""
+        last = (-1, '')
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    """
+                    SELECT start_ts, id, data FROM events
+                    WHERE user = ? AND start_ts < ? AND end_ts > ? AND (start_ts, id) > (?, ?)
+                    ORDER BY start_ts, id
+                    LIMIT ?
+                    """,
+                    (user, int(end.timestamp()), int(start.timestamp()), *last, batch_size)
+                ).fetchall()
+            for _, _, data in rows:
+                yield data
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][:2]
+
+    def stream(self, user, service, start, end):
+        """Like events(), but yields serialized events without building the full list.
+
+        Until a full sync has finished, and for ranges starting before it,
+        events are listed from Google instead and yielded as each page arrives,
+        in the same (start, id) order. Run the full sync with backfill(), e.g.
+        once the response is out.
+        """
+        if self.covers(user, start) and self.sync(user, service):
+            yield from self.iter_query(user, start, end)
+            return
+        yield from ordered_events(self._pages(service, range_params(start, end)))
+
+    def covers(self, user, start):
+        """Whether the local copy holds every event of ranges starting at `start`."""
+        state = self.sync_state(user)
+        return state is not None and state[2] <= int(start.timestamp())
+
+    def begin_backfill(self, user):
+        """True if the user has no local copy yet and no other caller is building it; pair with end_backfill()."""
+        with self._lock:
+            if user in self._backfills:
+                return False
+            self._backfills.add(user)
+        if self.sync_state(user) is None:
+            return True
+        self.end_backfill(user)
+        return False
+
+    def end_backfill(self, user):
+        with self._lock:
+            self._backfills.discard(user)
+
+    def backfill(self, user, service):
+        """Run the user's first full sync, unless it is done or under way. Errors are logged, not raised."""
+        if not self.begin_backfill(user):
+            return
+        try:
+            self._full_sync(user, service)
+        except Exception:
+            logging.exception("Initial event sync failed")
+        finally:
+            self.end_backfill(user)
+
+    def sync(self, user, service):
+        """Pull deltas into the local copy; False if it needs a full sync first (see backfill())."""
+        ready, sync_token = self.pending_sync(user)
+        if sync_token is None:
+            return ready
+        try:
+            self._sync(user, service, sync_token)
+        except HttpError as error:
+            if error.resp.status != 410:
+                raise
+            self.expire(user)
+            return False
+        return True
+
+    def pending_sync(self, user):
+        """(ready, sync_token): whether the local copy can serve reads, and the token to pull deltas with first."""
+        state = self.sync_state(user)
+        if state is None:
+            return False, None
+        return True, state[0] if self.is_stale(state) else None
+
+    def expire(self, user):
+        """Drop a local copy whose sync token Google invalidated (410), so it is built again."""
+        logging.info("Sync token expired for event store, running a full sync")
+        self.reset(user)
+
+    def sync_params(self, user, sync_token):
+        """(events.list params, synced_from) for a sync; a full sync (no token) resets the local copy first."""
+        if sync_token is not None:
+            return list_params(sync_token), None
+        self.reset(user)
+        synced_from = full_sync_start()
+        return list_params(None, synced_from), synced_from
+
+    def sync_state(self, user):
+        """(sync_token, synced_at, synced_from) for the user, or None before the first full sync."""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT sync_token, synced_at, synced_from FROM event_sync_state '
+                'WHERE user = ? AND synced_from IS NOT NULL',
+                (user,)
+            ).fetchone()
+
+    @staticmethod
+    def is_stale(state):
+        return time.time() - state[1] >= MIN_SYNC_INTERVAL
+
+    def mark_stale(self, user):
+        """Force a delta sync on the next read, e.g. after a local write."""
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE event_sync_state SET synced_at = 0 WHERE user = ?', (user,))
+
+    def reset(self, user):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM events WHERE user = ?', (user,))
+            self._conn.execute('DELETE FROM event_sync_state WHERE user = ?', (user,))
+
+    def apply_page(self, user, page, synced_from=None):
+        """Store one events.list page, returning the stored (start_ts, end_ts, data) rows.
+
+        Pages of a full sync pass the sync's `timeMin` as `synced_from`.
+        """
+        rows = self._apply(user, page.get('items', []))
+        if 'nextSyncToken' in page:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    """
+                    INSERT INTO event_sync_state (user, sync_token, synced_at, synced_from) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user) DO UPDATE SET
+                        sync_token = excluded.sync_token,
+                        synced_at = excluded.synced_at,
+                        synced_from = COALESCE(excluded.synced_from, synced_from)
+                    """,
+                    (user, page['nextSyncToken'], time.time(), synced_from)
+                )
+        return rows
+
+    def _full_sync(self, user, service):
+        self._sync(user, service, None)
+
+    def _sync(self, user, service, sync_token):
+        params, synced_from = self.sync_params(user, sync_token)
+        for page in self._pages(service, params):
+            self.apply_page(user, page, synced_from)
+
+    def _pages(self, service, params):
+        page_token = None
+        while True:
+            page = service.events().list(calendarId='primary', pageToken=page_token, **params).execute()
+            yield page
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return
+
+    def _apply(self, user, items):
+        rows = []
+        with self._lock, self._conn:
+            for event in items:
+                if event.get('status') == 'cancelled':
+                    self._conn.execute('DELETE FROM events WHERE user = ? AND id = ?', (user, event['id']))
+                    continue
+                formatted = format_event(event)
+                row = (to_timestamp(formatted['start']), to_timestamp(formatted['end']), json.dumps(formatted))
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO events (user, id, start_ts, end_ts, data) VALUES (?, ?, ?, ?, ?)',
+                    (user, event['id'], *row)
+                )
+                rows.append(row)
+        return rows
+
+
+def full_sync_start():
+    return int((datetime.now(timezone.utc) - FULL_SYNC_PAST).timestamp())
+
+
+def list_params(sync_token, synced_from=None):
+    """events.list parameters for a delta sync, or for a full sync from `synced_from` when there is no token."""
+    params = {'singleEvents': True, 'maxResults': PAGE_SIZE}
+    if sync_token:
+        params['syncToken'] = sync_token
+    else:
+        params['timeMin'] = datetime.fromtimestamp(synced_from, timezone.utc).isoformat()
+    return params
+
+
+def range_params(start, end):
+    """events.list parameters for the events overlapping [start, end), without syncing."""
+    return {'singleEvents': True, 'maxResults': PAGE_SIZE, 'orderBy': 'startTime',
+            'timeMin': start.isoformat(), 'timeMax': end.isoformat()}
+
+
+class EventOrder:
+    """Puts events.list pages ordered by start time into the local store's (start, id) order.
+
+    Events are released as soon as no later page can hold one sorting before
+    them: all but those sharing the page's latest start time.
+    """
+
+    def __init__(self):
+        self._held = []
+
+    def add(self, page):
+        rows = self._held
+        for event in page.get('items', []):
+            if event.get('status') == 'cancelled':
+                continue
+            formatted = format_event(event)
+            rows.append((to_timestamp(formatted['start']), formatted['id'] or '', json.dumps(formatted)))
+        rows.sort(key=lambda row: row[:2])
+        latest = rows[-1][0] if rows else None
+        ready = [data for start, _, data in rows if start != latest]
+        self._held = [row for row in rows if row[0] == latest]
+        return ready
+
+    def finish(self):
+        held, self._held = self._held, []
+        return [data for _, _, data in held]
+
+
+def ordered_events(pages):
+    """Serialized events from events.list pages ordered by start time, yielded page by page."""
+    order = EventOrder()
+    for page in pages:
+        yield from order.add(page)
+    yield from order.finish()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_event_store(path):
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = EventStore(path)
+        return _stores[path]
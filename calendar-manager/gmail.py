@@ -0,0 +1,89 @@
+import logging
+import time
+
+import httplib2
+from google.auth.exceptions import TransportError
+from googleapiclient.errors import HttpError
+
+# Gmail accepts up to 100 calls per batch, but recommends 50 to avoid rate limiting
+BATCH_SIZE = 50
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+
+ADDRESS_HEADERS = ['From', 'To', 'Cc', 'Bcc']
+METADATA_HEADERS = ADDRESS_HEADERS + ['Subject', 'Date']
+
+RETRYABLE_STATUSES = {429, 500, 503}
+# Connection failures and timeouts (requests' errors are OSErrors)
+TRANSPORT_ERRORS = (OSError, httplib2.HttpLib2Error, TransportError)
+
+
+def get_header(headers, name, default=None):
+    name = name.lower()
+    return next((header['value'] for header in headers if header['name'].lower() == name), default)
+
+
+def is_retryable(error):
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUSES
+    return isinstance(error, TRANSPORT_ERRORS)
+
+
+def account_id(service):
+    """The signed-in account's Gmail address.
+
+    Per-user local data is keyed on it: keys derived from the refresh token
+    change whenever the user consents again.
+    """
+    return service.users().getProfile(userId='me').execute()['emailAddress'].lower()
+
+
+def fetch_messages(service, message_ids, headers=METADATA_HEADERS, batch_size=BATCH_SIZE):
+    """Fetch message metadata in batched requests, returned in the order of message_ids."""
+    results = {}
+    pending = list(dict.fromkeys(message_ids))
+
+    for attempt in range(MAX_RETRIES + 1):
+        failed = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                results[request_id] = response
+            elif is_retryable(exception):
+                failed.append(request_id)
+            else:
+                logging.error("Failed to fetch message %s: %s", request_id, exception)
+
+        for i in range(0, len(pending), batch_size):
+            chunk = pending[i:i + batch_size]
+            batch = service.new_batch_http_request(callback=callback)
+            for message_id in chunk:
+                batch.add(
+                    service.users().messages().get(
+                        userId='me',
+                        id=message_id,
+                        format='metadata',
+                        metadataHeaders=headers
+                    ),
+                    request_id=message_id
+                )
+            try:
+                batch.execute()
+            except Exception as error:
+                if not is_retryable(error):
+                    raise
+                # The batch request itself failed, so retry every call in it
+                logging.warning("Batch of %d message fetches failed: %r", len(chunk), error)
+                failed.extend(message_id for message_id in chunk if message_id not in results)
+
+        if not failed:
+            break
+        if attempt == MAX_RETRIES:
+            logging.error("Giving up on %d messages after %d retries", len(failed), MAX_RETRIES)
+            break
+
+        # Back off before retrying the calls that were rate limited or lost
+        time.sleep(RETRY_BACKOFF * (2 ** attempt))
+        pending = failed
+
+    return [results[message_id] for message_id in message_ids if message_id in results]
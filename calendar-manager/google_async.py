@@ -0,0 +1,211 @@
+import asyncio
+import json as _json
+import logging
+import os
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import urlencode
+
+import aiohttp
+
+from credential_manager import credential_manager
+from gmail import MAX_RETRIES, RETRY_BACKOFF, RETRYABLE_STATUSES
+from metrics import record_upstream
+
+# REST roots for the APIs we call; GOOGLE_API_ROOT points them all at another host
+API_ROOTS = {
+    'calendar': 'https://www.googleapis.com/calendar/v3',
+    'gmail': 'https://gmail.googleapis.com/gmail/v1',
+}
+API_ROOT = os.environ.get('GOOGLE_API_ROOT')
+BATCH_URLS = {
+    'calendar': 'https://www.googleapis.com/batch/calendar/v3',
+    'gmail': 'https://gmail.googleapis.com/batch/gmail/v1',
+}
+BATCH_SIZE = 50
+
+# Concurrent calls per request when fanning out, e.g. freebusy chunks
+MAX_CONCURRENCY = 20
+
+
+class GoogleAPIError(Exception):
+    def __init__(self, status, content):
+        super().__init__(f"Google API returned {status}: {content}")
+        self.status = status
+        self.content = content
+
+
+def create_http_client(max_connections=100, timeout=30):
+    """One pooled HTTP client per process, shared by every user."""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=max_connections),
+        timeout=aiohttp.ClientTimeout(total=timeout)
+    )
+
+
+def api_url(api, path):
+    if API_ROOT:
+        return API_ROOT.rstrip('/') + '/' + api_path(api, path)
+    return API_ROOTS[api] + path
+
+
+def api_path(api, path):
+    # e.g. 'gmail/v1/users/me/messages'
+    return API_ROOTS[api].split('/', 3)[3] + path
+
+
+def batch_url(api):
+    if API_ROOT:
+        return API_ROOT.rstrip('/') + '/batch'
+    return BATCH_URLS[api]
+
+
+def query_params(params):
+    # aiohttp only takes str/int/float query values, so spell out booleans and repeated keys
+    items = []
+    for key, value in (params or {}).items():
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            items.append((key, str(item).lower() if isinstance(item, bool) else item))
+    return items
+
+
+def encode_batch(api, calls):
+    """multipart/mixed body for a batch of (path, params) GET calls."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for i, (path, params) in enumerate(calls):
+        query = '?' + urlencode(params, doseq=True) if params else ''
+        parts.append(
+            f'--{boundary}\r\n'
+            'Content-Type: application/http\r\n'
+            f'Content-ID: <item+{i}>\r\n\r\n'
+            f'GET /{api_path(api, path)}{query} HTTP/1.1\r\n\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n')
+    return boundary, ''.join(parts).encode('utf-8')
+
+
+def decode_batch(content_type, content, n_calls):
+    """Responses of a batch call, in request order, as (status, payload) pairs."""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + content
+    )
+    results = [None] * n_calls
+    for part in message.iter_parts():
+        index = int(part['Content-ID'].strip('<>').rsplit('+', 1)[1])
+        payload = part.get_payload(decode=True)
+        text = payload.decode('utf-8') if isinstance(payload, bytes) else payload
+        status_line, _, rest = text.replace('\r\n', '\n').partition('\n')
+        body = rest.partition('\n\n')[2]
+        results[index] = (int(status_line.split(' ')[1]), _json.loads(body) if body.strip() else None)
+    return results
+
+
+class AsyncGoogleClient:
+    """Minimal async client for the Calendar and Gmail REST APIs."""
+
+    def __init__(self, http, credentials):
+        self.http = http
+        self.credentials = credentials
+
+    async def request(self, method, api, path, params=None, json=None):
+        if not self.credentials.valid and self.credentials.refresh_token:
+            await self._refresh()
+
+        token = self.credentials.token
+        status, content = await self._send(method, api, path, params, json)
+        if status == 401 and self.credentials.refresh_token:
+            await self._refresh(token)
+            status, content = await self._send(method, api, path, params, json)
+
+        if status >= 400:
+            raise GoogleAPIError(status, content.decode('utf-8', 'replace'))
+        return _json.loads(content)
+
+    async def _send(self, method, api, path, params, json):
+        headers = {'Authorization': f'Bearer {self.credentials.token}'}
+        started = time.perf_counter()
+        async with self.http.request(method, api_url(api, path), params=query_params(params),
+                                     json=json, headers=headers) as response:
+            content = await response.read()
+        record_upstream(api, time.perf_counter() - started)
+        return response.status, content
+
+    async def _refresh(self, stale_token=None):
+        # google-auth only refreshes synchronously, so keep it off the event loop.
+        # The credential manager makes concurrent refreshes for one user share a single token call.
+        await asyncio.to_thread(credential_manager.refresh, self.credentials, stale_token)
+
+    async def pages(self, api, path, params):
+        """Yield every page of a list call, following nextPageToken."""
+        params = dict(params)
+        while True:
+            page = await self.request('GET', api, path, params=params)
+            yield page
+            if not page.get('nextPageToken'):
+                return
+            params['pageToken'] = page['nextPageToken']
+
+    async def batch_get(self, api, calls, batch_size=BATCH_SIZE):
+        """GET many (path, params) calls through the batch endpoint, in request order.
+
+        Like gmail.fetch_messages, calls that are rate limited or hit a server
+        error are retried with backoff, and calls that still fail are logged and
+        left out of the results.
+        """
+        if not self.credentials.valid and self.credentials.refresh_token:
+            await self._refresh()
+
+        results = {}
+        pending = list(range(len(calls)))
+
+        async def run(indexes):
+            boundary, body = encode_batch(api, [calls[i] for i in indexes])
+            started = time.perf_counter()
+            async with self.http.post(batch_url(api), data=body, headers={
+                'Authorization': f'Bearer {self.credentials.token}',
+                'Content-Type': f'multipart/mixed; boundary={boundary}',
+            }) as response:
+                content = await response.read()
+                record_upstream('batch', time.perf_counter() - started)
+                if response.status in RETRYABLE_STATUSES:
+                    return [(response.status, None)] * len(indexes)
+                if response.status >= 400:
+                    raise GoogleAPIError(response.status, content.decode('utf-8', 'replace'))
+                return decode_batch(response.headers['Content-Type'], content, len(indexes))
+
+        for attempt in range(MAX_RETRIES + 1):
+            chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+            failed = []
+            for indexes, chunk_results in zip(chunks, await asyncio.gather(*(run(chunk) for chunk in chunks))):
+                for i, (status, payload) in zip(indexes, chunk_results):
+                    if status < 400:
+                        results[i] = payload
+                    elif status in RETRYABLE_STATUSES:
+                        failed.append(i)
+                    else:
+                        logging.error("Failed to fetch %s: %s %s", calls[i][0], status, payload)
+
+            if not failed:
+                break
+            if attempt == MAX_RETRIES:
+                logging.error("Giving up on %d calls after %d retries", len(failed), MAX_RETRIES)
+                break
+
+            # Back off before retrying the calls that were rate limited
+            await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+            pending = failed
+
+        return [results[i] for i in range(len(calls)) if i in results]
+
+    async def gather(self, calls, limit=MAX_CONCURRENCY):
+        """Run (method, api, path, params, json) calls concurrently, at most `limit` at a time."""
+        semaphore = asyncio.Semaphore(limit)
+
+        async def run(call):
+            async with semaphore:
+                return await self.request(*call)
+
+        return await asyncio.gather(*(run(call) for call in calls))
@@ -1,15 +1,19 @@
-from flask import request, redirect, session, jsonify, render_template, url_for, abort
+from flask import Response, current_app, request, redirect, session, jsonify, render_template, stream_with_context, url_for, abort
 from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import logging
 from datetime import datetime, timedelta
 import pytz
 from oauthlib.oauth2.rfc6749.errors import OAuth2Error
-from utils import create_message, credentials_to_dict, get_credentials_from_session
-import json
+from utils import create_message, credentials_to_dict, get_credentials_from_session, session_account
+from services import get_service
+from gmail import fetch_messages, get_header
+from contacts_index import get_contacts_index
+from availability import find_availability, parse_working_hours
+from event_store import get_event_store
+from response_cache import invalidate, response_cache
+import metrics
 
 def index():
     return render_template('index.html')
@@ -32,10 +36,10 @@ def login(app):
     return redirect(authorization_url)
 
 def oauth2callback(app):
-    logging.debug(f"Received callback at URL: {request.url}")
+    logging.debug("Received callback at URL: %s", request.url)
 
     if 'error' in request.args:
-        logging.error(f"Error in OAuth callback: {request.args['error']}")
+        logging.error("Error in OAuth callback: %s", request.args['error'])
         return jsonify({'error': request.args['error']}), 400
 
     if 'state' not in session:
@@ -54,12 +58,14 @@ def oauth2callback(app):
         # Fetch the token
         flow.fetch_token(authorization_response=request.url)
 
-        # Get credentials and store in session
+        # Get credentials and store them under a new session ID, so one set before login can't be reused
         credentials = flow.credentials
+        session.regenerate()
         session['credentials'] = credentials_to_dict(credentials)
-        
-        # Log the credentials for debugging
-        logging.debug(f"Stored credentials: {session['credentials']}")
+        session.pop('account', None)
+
+        # Never log the credentials themselves
+        logging.debug("Stored credentials for client %s", credentials.client_id)
 
         # Check if all required scopes are present
         granted_scopes = set(credentials.scopes)
@@ -67,129 +73,170 @@ def oauth2callback(app):
         
         if not required_scopes.issubset(granted_scopes):
             missing_scopes = required_scopes - granted_scopes
-            logging.error(f"Missing required scopes: {missing_scopes}")
+            logging.error("Missing required scopes: %s", missing_scopes)
             return jsonify({'error': 'Insufficient permissions granted. Please try logging in again.'}), 400
 
         # Redirect to calendar_events page
         return redirect(url_for('main.calendar_events'))
 
     except OAuth2Error as e:
-        logging.error(f"OAuth2 error in oauth2callback: {str(e)}")
+        logging.error("OAuth2 error in oauth2callback: %s", e)
         return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logging.error(f"Error in oauth2callback: {str(e)}")
+        logging.error("Error in oauth2callback: %s", e)
         return jsonify({'error': 'An unexpected error occurred. Please try again.'}), 500
 
 def calendar_events():
     if 'credentials' not in session:
         return jsonify({'error': 'Not logged in'}), 401
 
-    # Get month and year from query parameters, default to current month if not provided
-    month = request.args.get('month', datetime.now().month)
-    year = request.args.get('year', datetime.now().year)
-
-    # Convert to integers
-    month = int(month)
-    year = int(year)
+    try:
+        start, end = event_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date range: {e}'}), 400
 
-    # Calculate start and end of the month
-    start_of_month = datetime(year, month, 1).isoformat() + 'Z'
-    if month == 12:
-        end_of_month = datetime(year + 1, 1, 1) - timedelta(seconds=1)
+    credentials = get_credentials_from_session(session)
+    service = get_service('calendar', 'v3', credentials)
+
+    # Served from the local store, which only pulls deltas from Google.
+    # Events are streamed, so memory and time to first byte stay flat as calendars grow.
+    user = session_account(session, credentials)
+    store = get_event_store(current_app.config['EVENTS_DB'])
+    events = store.stream(user, service, start, end)
+
+    lines = LineFormatter(wants_ndjson(request))
+    response = Response(stream_with_context(lines.body(events)), mimetype=lines.mimetype)
+
+    # Without a local copy the window is listed live; the copy is built once the response is out
+    response.call_on_close(lambda: store.backfill(user, service))
+    return response
+
+def wants_ndjson(req):
+    return (req.args.get('format') == 'ndjson'
+            or req.accept_mimetypes.best == 'application/x-ndjson')
+
+class LineFormatter:
+    """Response body for serialized items, as NDJSON or a JSON array emitted one element at a time.
+
+    Views that get items in pieces (e.g. async ones) call head(), lines() and tail() themselves.
+    """
+
+    def __init__(self, ndjson):
+        self.ndjson = ndjson
+        self.mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+        self._sent = False
+
+    def head(self):
+        return [] if self.ndjson else ['[']
+
+    def lines(self, serialized):
+        for item in serialized:
+            if self.ndjson:
+                yield item + '\n'
+            else:
+                yield ',' + item if self._sent else item
+                self._sent = True
+
+    def tail(self):
+        return [] if self.ndjson else [']']
+
+    def body(self, serialized):
+        yield from self.head()
+        yield from self.lines(serialized)
+        yield from self.tail()
+
+def event_range(args):
+    """Resolve start/end, week or month/year query parameters to a UTC range."""
+    if args.get('start') and args.get('end'):
+        start = datetime.fromisoformat(args['start'].replace('Z', '+00:00'))
+        end = datetime.fromisoformat(args['end'].replace('Z', '+00:00'))
+    elif args.get('week'):
+        # Monday to Monday around the given date
+        day = datetime.fromisoformat(args['week'])
+        start = datetime(day.year, day.month, day.day) - timedelta(days=day.weekday())
+        end = start + timedelta(days=7)
     else:
-        end_of_month = datetime(year, month + 1, 1) - timedelta(seconds=1)
-    end_of_month = end_of_month.isoformat() + 'Z'
-
-    credentials = Credentials(**session['credentials'])
-    service = build('calendar', 'v3', credentials=credentials)
-
-    events_result = service.events().list(calendarId='primary', 
-                                          timeMin=start_of_month,
-                                          timeMax=end_of_month,
-                                          maxResults=1000,  # Increased to ensure all month's events are retrieved
-                                          singleEvents=True, 
-                                          orderBy='startTime').execute()
-    events = events_result.get('items', [])
-
-    formatted_events = [
-        {
-            'id': event.get('id'),
-            'start': event['start'].get('dateTime', event['start'].get('date')),
-            'end': event['end'].get('dateTime', event['end'].get('date')),
-            'organizer': event.get('organizer', {}).get('displayName'),
-            'description': event.get('description', 'No description'),
-            'location': event.get('location', 'No location specified'),
-            'status': event.get('status', 'unknown'),
-            'summary': event.get('summary', 'No summary')
-        }
-        for event in events
-    ]
-
-    return jsonify(formatted_events)
+        # Get month and year from query parameters, default to current month if not provided
+        month = int(args.get('month', datetime.now().month))
+        year = int(args.get('year', datetime.now().year))
+        start = datetime(year, month, 1)
+        end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=pytz.UTC)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=pytz.UTC)
+    return start, end
 
 def availabilities():
     if 'credentials' not in session:
         return jsonify({'error': 'Not logged in'}), 401
 
-    # Get the current month and year
-    now = datetime.now()
-    year = now.year
-    month = now.month
+    try:
+        query = availability_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid availability query: {e}'}), 400
+
+    credentials = get_credentials_from_session(session)
+    service = get_service('calendar', 'v3', credentials)
+
+    slots = find_availability(
+        service,
+        vectorized=current_app.config.get('AVAILABILITY_VECTORIZED', False),
+        **query
+    )
+    return jsonify([{'start': start.isoformat(), 'end': end.isoformat()} for start, end in slots])
 
-    # Calculate start and end of the month
-    start_of_month = datetime(year, month, 1, tzinfo=pytz.UTC)
-    if month == 12:
-        end_of_month = datetime(year + 1, 1, 1, tzinfo=pytz.UTC) - timedelta(seconds=1)
+def availability_query(args):
+    """Parse the availabilities query parameters, raising ValueError if they are invalid."""
+    try:
+        tz = pytz.timezone(args.get('timeZone', 'UTC'))
+    except pytz.UnknownTimeZoneError as e:
+        raise ValueError(f'Unknown time zone: {e}')
+
+    # Default to the current month in the requested time zone, up to its last second
+    now = datetime.now(tz)
+    start_of_month = tz.localize(datetime(now.year, now.month, 1))
+    if now.month == 12:
+        end_of_month = tz.localize(datetime(now.year + 1, 1, 1)) - timedelta(seconds=1)
     else:
-        end_of_month = datetime(year, month + 1, 1, tzinfo=pytz.UTC) - timedelta(seconds=1)
-
-    credentials = Credentials(**session['credentials'])
-    service = build('calendar', 'v3', credentials=credentials)
-
-    events_result = service.events().list(calendarId='primary', 
-                                          timeMin=start_of_month.isoformat(),
-                                          timeMax=end_of_month.isoformat(),
-                                          singleEvents=True, 
-                                          orderBy='startTime').execute()
-    events = events_result.get('items', [])
-
-    # Convert events to datetime objects
-    busy_times = []
-    for event in events:
-        start = event['start'].get('dateTime', event['start'].get('date'))
-        end = event['end'].get('dateTime', event['end'].get('date'))
-        start = datetime.fromisoformat(start.replace('Z', '+00:00'))
-        end = datetime.fromisoformat(end.replace('Z', '+00:00'))
-        busy_times.append((start, end))
-    # Sort busy times
-    busy_times.sort(key=lambda x: x[0])
-    # Calculate available times
-    available_times = []
-    current_time = start_of_month
-    for busy_start, busy_end in busy_times:
-        if current_time < busy_start:
-            available_times.append({
-                'start': current_time.isoformat(),
-                'end': busy_start.isoformat()
-            })
-        current_time = max(current_time, busy_end)
-    if current_time < end_of_month:
-        available_times.append({
-            'start': current_time.isoformat(),
-            'end': end_of_month.isoformat()
-          })
-    return jsonify(available_times)
+        end_of_month = tz.localize(datetime(now.year, now.month + 1, 1)) - timedelta(seconds=1)
+
+    start = args.get('start')
+    end = args.get('end')
+    window_start = datetime.fromisoformat(start.replace('Z', '+00:00')) if start else start_of_month
+    window_end = datetime.fromisoformat(end.replace('Z', '+00:00')) if end else end_of_month
+    if window_start.tzinfo is None:
+        window_start = tz.localize(window_start)
+    if window_end.tzinfo is None:
+        window_end = tz.localize(window_end)
+    if window_end <= window_start:
+        raise ValueError('end must be after start')
+
+    working_hours = args.get('workingHours')
+
+    # Calendars and attendees are both looked up by ID through freebusy.query
+    calendar_ids = args.get('calendars', 'primary').split(',')
+    calendar_ids += [a for a in args.get('attendees', '').split(',') if a]
+
+    return {
+        'calendar_ids': list(dict.fromkeys(c.strip() for c in calendar_ids if c.strip())),
+        'window_start': window_start,
+        'window_end': window_end,
+        'tz': tz,
+        'min_duration': timedelta(minutes=int(args.get('minDuration', 0))),
+        'working_hours': parse_working_hours(working_hours) if working_hours else None,
+        'first_only': args.get('first', '').lower() in ('1', 'true')
+    }
 
 def todays_emails():
     if 'credentials' not in session:
         return jsonify({'error': 'Not logged in'}), 401
 
     try:
-        # Convert credentials dict to JSON string, then back to dict
-        credentials_dict = json.loads(json.dumps(session['credentials']))
-        credentials = Credentials(**credentials_dict)
+        credentials = get_credentials_from_session(session)
 
-        service = build('gmail', 'v1', credentials=credentials)
+        service = get_service('gmail', 'v1', credentials)
 
         today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         now = datetime.now()
@@ -203,12 +250,11 @@ def todays_emails():
         messages = results.get('messages', [])
         
         emails = []
-        for message in messages:
-            msg = service.users().messages().get(userId='me', id=message['id']).execute()
+        for msg in fetch_messages(service, [message['id'] for message in messages]):
             headers = msg['payload']['headers']
-            subject = next((header['value'] for header in headers if header['name'].lower() == 'subject'), 'No Subject')
-            sender = next((header['value'] for header in headers if header['name'].lower() == 'from'), 'Unknown Sender')
-            date = next((header['value'] for header in headers if header['name'].lower() == 'date'), 'Unknown Date')
+            subject = get_header(headers, 'subject', 'No Subject')
+            sender = get_header(headers, 'from', 'Unknown Sender')
+            date = get_header(headers, 'date', 'Unknown Date')
             internal_date = datetime.fromtimestamp(int(msg['internalDate']) / 1000).isoformat()
             emails.append({
                 'id': msg['id'],
@@ -226,40 +272,28 @@ def todays_emails():
         })
 
     except HttpError as error:
-        logging.error(f"An HTTP error occurred: {error}")
+        logging.error("An HTTP error occurred: %s", error)
         return jsonify({'error': str(error)}), 500
     except Exception as e:
-        logging.error(f"Error fetching emails: {str(e)}")
+        logging.error("Error fetching emails: %s", e)
         return jsonify({'error': str(e)}), 500
     
 def contacts():
     if 'credentials' not in session:
         return jsonify({'error': 'Not logged in'}), 401
-    credentials = Credentials(session['credentials'])
-    service = build('gmail', 'v1', credentials=credentials)
-    results = service.users().messages().list(userId='me', maxResults=500).execute()
-    messages = results.get('messages', [])
-    contacts = set()
-    for message in messages:
-        msg = service.users().messages().get(userId='me', id=message['id']).execute()
-        headers = msg['payload']['headers']
-        for header in headers:
-            if header['name'] in ['From', 'To', 'Cc', 'Bcc']:
-                emails = header['value'].split(',')
-                for email in emails:
-                    contacts.add(email.strip())
-    return jsonify(list(contacts))
+    credentials = get_credentials_from_session(session)
+    service = get_service('gmail', 'v1', credentials)
+    index = get_contacts_index(current_app.config['CONTACTS_DB'])
+    return jsonify(index.contacts(session_account(session, credentials), service))
 
 def send_email():
     if 'credentials' not in session:
         return jsonify({'error': 'Not logged in'}), 401
 
     try:
-        # Convert credentials dict to JSON string, then back to dict
-        credentials_dict = json.loads(json.dumps(session['credentials']))
-        credentials = Credentials(**credentials_dict)
+        credentials = get_credentials_from_session(session)
 
-        service = build('gmail', 'v1', credentials=credentials)
+        service = get_service('gmail', 'v1', credentials)
 
         data = request.json
         to = data.get('to')
@@ -271,13 +305,14 @@ def send_email():
 
         message = create_message('me', to, subject, body)
         sent_message = service.users().messages().send(userId='me', body=message).execute()
+        invalidate(['todays_emails', 'contacts'])
         return jsonify({'message': 'Email sent successfully', 'id': sent_message['id']})
 
     except HttpError as error:
-        logging.error(f"An HTTP error occurred: {error}")
+        logging.error("An HTTP error occurred: %s", error)
         return jsonify({'error': str(error)}), 500
     except Exception as e:
-        logging.error(f"Error sending email: {str(e)}")
+        logging.error("Error sending email: %s", e)
         return jsonify({'error': str(e)}), 500
     
 def create_event():
@@ -287,7 +322,7 @@ def create_event():
         return jsonify({'error': 'Not logged in'}), 401
 
     try:
-        service = build('calendar', 'v3', credentials=credentials)
+        service = get_service('calendar', 'v3', credentials)
 
         data = request.json
         summary = data.get('summary', '').strip()
@@ -298,7 +333,7 @@ def create_event():
         time_zone = data.get('timeZone', 'UTC')
 
         if not all([summary, start, end]):
-            logging.error(f"Missing required fields. Received: summary={summary}, start={start}, end={end}")
+            logging.error("Missing required fields. Received: summary=%s, start=%s, end=%s", summary, start, end)
             return jsonify({'error': 'Missing required fields: summary, start, end.'}), 400
 
         event = {
@@ -309,16 +344,32 @@ def create_event():
             'end': {'dateTime': end, 'timeZone': time_zone},
         }
 
-        logging.debug(f"Attempting to create event with payload: {event}")
+        logging.debug("Attempting to create event with payload: %s", event)
         created_event = service.events().insert(calendarId='primary', body=event).execute()
-        logging.info(f"Event created successfully: {created_event['id']}")
+        get_event_store(current_app.config['EVENTS_DB']).mark_stale(session_account(session, credentials))
+        invalidate(['calendar_events', 'availabilities'])
+        logging.info("Event created successfully: %s", created_event['id'])
         return jsonify({'message': 'Event created successfully', 'id': created_event['id']}), 200
 
     except HttpError as error:
         error_content = error.content.decode()
-        logging.error(f"Google Calendar API error: {error_content}")
+        logging.error("Google Calendar API error: %s", error_content)
         return jsonify({'error': error_content}), error.resp.status
 
     except Exception as e:
-        logging.error(f"Unexpected error in create_event: {str(e)}")
+        logging.error("Unexpected error in create_event: %s", e)
         return jsonify({'error': 'An unexpected error occurred.'}), 500
+
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def profile():
+    if metrics.profiler is None:
+        return jsonify({'error': 'Profiler is off; set PROFILE_INTERVAL_MS to enable it'}), 404
+    if request.args.get('reset'):
+        metrics.profiler.reset()
+    # Collapsed stacks, ready for flamegraph.pl or speedscope
+    return Response(metrics.profiler.collapsed(), mimetype='text/plain')
@@ -1,15 +1,24 @@
-from flask import Flask
+from flask import Flask, request
 import logging
+import os
 from config import configure_app
+from response_cache import configure_response_cache
 from routes import register_routes
+from metrics import instrument, start_profiler
+from session_store import ServerSideSessionInterface, create_session_store
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging; DEBUG logs request details, so keep it for local debugging
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
 
 def create_app():
     app = Flask(__name__)
     configure_app(app)
+    configure_response_cache(app.config)
+    # The session cookie only holds an ID; credentials stay on the server
+    app.session_interface = ServerSideSessionInterface(create_session_store(app.config))
     register_routes(app)
+    instrument(app, request)
+    start_profiler(app.config['PROFILE_INTERVAL_MS'])
     return app
 
 if __name__ == '__main__':
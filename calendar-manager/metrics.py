@@ -0,0 +1,282 @@
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextvars import ContextVar
+
+# Latency buckets in seconds, shared by the request and upstream histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CALL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket..., +Inf count], sum
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, [('le', bound)])
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {total}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REGISTRY = []
+
+REQUEST_LATENCY = Histogram(
+    'calendar_manager_request_duration_seconds', 'Time to serve a request, including streamed bodies.',
+    ['route', 'method', 'status']
+)
+REQUEST_UPSTREAM_CALLS = Histogram(
+    'calendar_manager_request_google_calls', 'Google API round trips made while serving a request.',
+    ['route'], buckets=CALL_COUNT_BUCKETS
+)
+REQUEST_UPSTREAM_SECONDS = Histogram(
+    'calendar_manager_request_google_seconds', 'Time a request spent waiting on Google API calls.', ['route']
+)
+UPSTREAM_LATENCY = Histogram(
+    'calendar_manager_google_call_duration_seconds', 'Duration of single Google API round trips.', ['api']
+)
+CACHE_LOOKUPS = Counter(
+    'calendar_manager_response_cache_lookups_total', 'Response cache lookups.', ['endpoint', 'result']
+)
+CACHE_NOT_MODIFIED = Counter(
+    'calendar_manager_response_cache_not_modified_total', 'Responses answered with 304 Not Modified.', ['endpoint']
+)
+CACHE_SAVED_CALLS = Counter(
+    'calendar_manager_response_cache_saved_google_calls_total',
+    'Google API calls avoided by serving cached responses.', ['endpoint']
+)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        self.status = None
+        # Set while a streamed body is being sent; the request is finished once it is done
+        self.streaming = False
+
+
+_request_stats = ContextVar('request_stats', default=None)
+
+
+def start_request():
+    _request_stats.set(RequestStats())
+
+
+def finish_request(route, method, stats=None):
+    stats = stats or _request_stats.get()
+    if stats is None:
+        return
+    _request_stats.set(None)
+    REQUEST_LATENCY.observe(time.perf_counter() - stats.started, route=route, method=method,
+                            status=stats.status or 500)
+    REQUEST_UPSTREAM_CALLS.observe(stats.upstream_calls, route=route)
+    REQUEST_UPSTREAM_SECONDS.observe(stats.upstream_seconds, route=route)
+
+
+def record_status(status):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.status = status
+
+
+def record_upstream(api, seconds):
+    UPSTREAM_LATENCY.observe(seconds, api=api)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.upstream_calls += 1
+        stats.upstream_seconds += seconds
+
+
+def _finish_when_sent(chunks, stats, route, method):
+    try:
+        yield from chunks
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        finish_request(route, method, stats)
+
+
+def upstream_calls():
+    """Google API round trips made so far by the current request."""
+    stats = _request_stats.get()
+    return stats.upstream_calls if stats is not None else 0
+
+
+def api_name(uri):
+    # e.g. 'https://gmail.googleapis.com/gmail/v1/users/me/messages' -> 'gmail'
+    path = uri.split('://', 1)[-1].split('/', 1)[-1]
+    return path.split('/', 1)[0].split('?', 1)[0] or 'unknown'
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def instrument(app, request):
+    """Time every request of a Flask app; `request` is the framework's request proxy."""
+    @app.before_request
+    def start_timer():
+        start_request()
+
+    @app.after_request
+    def keep_status(response):
+        record_status(response.status_code)
+        stats = _request_stats.get()
+        if response.is_streamed and stats is not None:
+            # Teardown runs before the body is sent, so Google calls made while
+            # streaming would be missed; finish the request when the body is done
+            stats.streaming = True
+            response.response = _finish_when_sent(response.response, stats,
+                                                  request.endpoint or 'unmatched', request.method)
+        return response
+
+    @app.teardown_request
+    def stop_timer(exc):
+        stats = _request_stats.get()
+        if stats is not None and not stats.streaming:
+            finish_request(request.endpoint or 'unmatched', request.method)
+
+
+def instrument_async(app, request):
+    """instrument() for Quart, whose sync hooks would run on a worker thread with their own context."""
+    @app.before_request
+    async def start_timer():
+        start_request()
+
+    @app.after_request
+    async def keep_status(response):
+        record_status(response.status_code)
+        return response
+
+    @app.teardown_request
+    async def stop_timer(exc):
+        finish_request(request.endpoint or 'unmatched', request.method)
+
+
+def start_profiler(interval_ms):
+    global profiler
+    if interval_ms and profiler is None:
+        profiler = StackSampler(interval_ms / 1000)
+        profiler.start()
+    return profiler
+
+
+profiler = None
+
+
+class StackSampler:
+    """Statistical profiler: samples every thread's stack at a fixed interval.
+
+    Stacks are kept in the collapsed format that flamegraph.pl and speedscope read.
+    Sampling costs one sys._current_frames() call per interval, so it can stay on
+    under load, but it is off unless PROFILE_INTERVAL_MS is set.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = 0
+        self._stacks = _Tally()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                self.samples += 1
+                for thread_id, frame in frames.items():
+                    if thread_id == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+                        frame = frame.f_back
+                    self._stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self, skip_idle=True):
+        with self._lock:
+            stacks = list(self._stacks.items())
+        # Threads parked waiting for work or I/O dominate the raw samples
+        idle = ('wait (threading.py', 'select (selectors.py', '_worker (thread.py', 'serve_forever (socketserver.py')
+        lines = [f'{stack} {count}' for stack, count in stacks
+                 if not (skip_idle and stack.rsplit(';', 1)[-1].startswith(idle))]
+        return '\n'.join(sorted(lines)) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
@@ -0,0 +1,186 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.errors import HttpError
+
+from gmail import RETRYABLE_STATUSES
+from utils import create_message
+
+REMINDERS_DB = os.environ.get('REMINDERS_DB', 'reminders.db')
+# Messages in flight at once, and the sustained send rate (messages per second)
+CONCURRENCY = 16
+RATE_LIMIT = 50
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5
+# A claimed reminder that was never marked sent (e.g. the process died) can be retried after this long
+CLAIM_TIMEOUT = 10 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminders (
+    user TEXT NOT NULL,
+    reminder_key TEXT NOT NULL,
+    claimed_at REAL NOT NULL,
+    sent_at REAL,
+    message_id TEXT,
+    PRIMARY KEY (user, reminder_key)
+);
+"""
+
+
+def reminder_key(event, to):
+    # The start time is part of the key, so a rescheduled event is reminded again
+    start = event['start'].get('dateTime', event['start'].get('date'))
+    return f"{event['id']}:{start}:{to}"
+
+
+def build_reminders(events, sender='me'):
+    """(key, message) pairs for every attendee of `events` who hasn't declined."""
+    reminders = []
+    for event in events:
+        summary = event.get('summary', 'Upcoming event')
+        start = event['start'].get('dateTime', event['start'].get('date'))
+        body = f"{summary} starts at {start}."
+        if event.get('location'):
+            body += f"\nLocation: {event['location']}"
+        for attendee in event.get('attendees', []):
+            if attendee.get('responseStatus') == 'declined' or attendee.get('resource'):
+                continue
+            reminders.append((
+                reminder_key(event, attendee['email']),
+                create_message(sender, attendee['email'], f"Reminder: {summary}", body)
+            ))
+    return reminders
+
+
+def gmail_sender(service):
+    def send(message):
+        return service.users().messages().send(userId='me', body=message).execute()['id']
+    return send
+
+
+class RateLimiter:
+    """Token bucket shared by the sender threads."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now; if the bucket is empty, wait until it would have refilled
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class ReminderLog:
+    """Which reminders were already sent, so a rerun never sends one twice."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def claim(self, user, keys):
+        """Claim the keys that aren't sent or being sent, returning the claimed ones."""
+        now = time.time()
+        claimed = []
+        with self._lock, self._conn:
+            for key in keys:
+                cursor = self._conn.execute(
+                    """
+                    INSERT INTO reminders (user, reminder_key, claimed_at) VALUES (?, ?, ?)
+                    ON CONFLICT (user, reminder_key) DO UPDATE SET claimed_at = excluded.claimed_at
+                    WHERE sent_at IS NULL AND claimed_at < ?
+                    """,
+                    (user, key, now, now - CLAIM_TIMEOUT)
+                )
+                if cursor.rowcount:
+                    claimed.append(key)
+        return claimed
+
+    def mark_sent(self, user, key, message_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE reminders SET sent_at = ?, message_id = ? WHERE user = ? AND reminder_key = ?',
+                (time.time(), message_id, user, key)
+            )
+
+    def release(self, user, key):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM reminders WHERE user = ? AND reminder_key = ? AND sent_at IS NULL', (user, key)
+            )
+
+
+class ReminderDispatcher:
+    """Sends reminder messages with bounded concurrency, a rate limit and retries."""
+
+    def __init__(self, send, log, concurrency=CONCURRENCY, rate=RATE_LIMIT,
+                 max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+        self.send = send
+        self.log = log
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate, burst=concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def dispatch(self, user, reminders):
+        """Send the reminders not sent before; returns sent/skipped/failed counts."""
+        messages = dict(reminders)
+        claimed = self.log.claim(user, list(messages))
+        summary = {'sent': 0, 'skipped': len(messages) - len(claimed), 'failed': 0}
+        if not claimed:
+            return summary
+
+        def deliver(key):
+            try:
+                message_id = self._send_with_retry(messages[key])
+            except Exception as e:
+                logging.error("Failed to send reminder %s: %s", key, e)
+                self.log.release(user, key)
+                return False
+            self.log.mark_sent(user, key, message_id)
+            return True
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(claimed))) as executor:
+            for ok in executor.map(deliver, claimed):
+                summary['sent' if ok else 'failed'] += 1
+        return summary
+
+    def _send_with_retry(self, message):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                return self.send(message)
+            except HttpError as error:
+                if error.resp.status not in RETRYABLE_STATUSES or attempt == self.max_retries:
+                    raise
+            # Exponential backoff with jitter, so throttled senders don't retry in lockstep
+            time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_reminder_log(path=REMINDERS_DB):
+    with _logs_lock:
+        if path not in _logs:
+            _logs[path] = ReminderLog(path)
+        return _logs[path]
@@ -0,0 +1,281 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, current_app, request, session
+
+from credential_manager import info_key
+from metrics import CACHE_LOOKUPS, CACHE_NOT_MODIFIED, CACHE_SAVED_CALLS, upstream_calls
+
+DEFAULT_MAXSIZE = 2048
+# Responses larger than this are served but not kept (bytes)
+MAX_ENTRY_BYTES = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_generations (
+    user TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+"""
+
+
+class _Entry:
+    def __init__(self, body, status, mimetype, upstream, ttl):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        # Google API calls it took to build this response, i.e. what each hit saves
+        self.upstream = upstream
+        self.expires_at = time.monotonic() + ttl
+        self.generation = None
+
+
+class MemoryGenerations:
+    """Invalidation counters kept in this process. Not shared between workers."""
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, user):
+        with self._lock:
+            return self._counters.get(user, 0)
+
+    def bump(self, user):
+        with self._lock:
+            self._counters[user] = self._counters.get(user, 0) + 1
+
+
+class SqliteGenerations:
+    """Invalidation counters in SQLite, so a write through one worker invalidates every worker's entries."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def get(self, user):
+        with self._lock:
+            row = self._conn.execute('SELECT generation FROM cache_generations WHERE user = ?', (user,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def bump(self, user):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO cache_generations (user, generation) VALUES (?, 1)
+                ON CONFLICT (user) DO UPDATE SET generation = generation + 1
+                """,
+                (user,)
+            )
+
+
+def create_generations(config):
+    return SqliteGenerations(config['CACHE_DB']) if config.get('CACHE_DB') else MemoryGenerations()
+
+
+class ResponseCache:
+    """Per-user cache of rendered GET responses, keyed by endpoint and query string.
+
+    Entries live in each process, but the per-user generation they were
+    rendered at is checked against `generations` on every hit, so with
+    SqliteGenerations an invalidation reaches every worker.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, generations=None):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.saved_upstream_calls = 0
+        self._entries = OrderedDict()
+        # Bumped on invalidation, so a response computed before a write is neither stored nor served after it
+        self.generations = generations or MemoryGenerations()
+        self._lock = threading.Lock()
+
+    def generation(self, user):
+        return self.generations.get(user)
+
+    def get(self, key):
+        generation = self.generation(key[0])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic() or entry.generation != generation:
+                self._entries.pop(key, None)
+                self.misses += 1
+                CACHE_LOOKUPS.inc(endpoint=key[1], result='miss')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_upstream_calls += entry.upstream
+        CACHE_LOOKUPS.inc(endpoint=key[1], result='hit')
+        CACHE_SAVED_CALLS.inc(entry.upstream, endpoint=key[1])
+        return entry
+
+    def put(self, key, entry, generation):
+        if generation != self.generation(key[0]):
+            return
+        entry.generation = generation
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user, endpoints=None):
+        """Drop a user's entries, for all endpoints or only the given ones."""
+        self.generations.bump(user)
+        with self._lock:
+            for key in [key for key in self._entries
+                        if key[0] == user and (endpoints is None or key[1] in endpoints)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'not_modified': self.not_modified,
+                'saved_upstream_calls': self.saved_upstream_calls,
+            }
+
+    def count_not_modified(self, endpoint):
+        with self._lock:
+            self.not_modified += 1
+        CACHE_NOT_MODIFIED.inc(endpoint=endpoint)
+
+
+response_cache = ResponseCache()
+
+
+def configure_response_cache(config):
+    """Point the shared cache at the app's invalidation store; call once per process."""
+    response_cache.generations = create_generations(config)
+
+
+def session_user(sess=session):
+    return info_key(sess['credentials']) if 'credentials' in sess else None
+
+
+def cache_key(user, endpoint, req):
+    return user, endpoint, tuple(sorted(req.args.items(multi=True))), req.accept_mimetypes.best
+
+
+def invalidate(endpoints=None):
+    user = session_user()
+    if user is not None:
+        response_cache.invalidate(user, endpoints)
+
+
+def cached(endpoint):
+    """Cache a GET handler's 200 responses per user for CACHE_TTLS[endpoint] seconds.
+
+    Responses carry an ETag and Last-Modified, so browsers revalidate and get a
+    304 when nothing changed.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            ttl = current_app.config['CACHE_TTLS'].get(endpoint, 0)
+            user = session_user()
+            if request.method != 'GET' or user is None or ttl <= 0:
+                return handler(*args, **kwargs)
+
+            key = cache_key(user, endpoint, request)
+            entry = response_cache.get(key)
+            if entry is not None:
+                response = Response(entry.body, status=entry.status, mimetype=entry.mimetype)
+                return conditional(response, entry, endpoint, 'HIT')
+
+            generation = response_cache.generation(user)
+            before = upstream_calls()
+            response = current_app.make_response(handler(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            if response.is_streamed:
+                # Keep streaming to the client; the entry is stored once the body is complete
+                response.response = _recording(response.response, key, response, ttl, before, generation)
+                mark_streamed(response)
+                return response
+
+            body = response.get_data()
+            entry = _Entry(body, response.status_code, response.mimetype, upstream_calls() - before, ttl)
+            if len(body) <= MAX_ENTRY_BYTES:
+                response_cache.put(key, entry, generation)
+            return conditional(response, entry, endpoint, 'MISS')
+        return wrapper
+    return decorator
+
+
+def validators(response, entry, status):
+    """Headers that let the client revalidate `entry`; the caller then makes the response conditional."""
+    response.set_etag(entry.etag)
+    response.last_modified = entry.last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['X-Cache'] = status
+
+
+def mark_streamed(response):
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['X-Cache'] = 'MISS'
+
+
+def conditional(response, entry, endpoint, status):
+    validators(response, entry, status)
+    response.make_conditional(request)
+    if response.status_code == 304:
+        response_cache.count_not_modified(endpoint)
+    return response
+
+
+class Recorder:
+    """Keeps a copy of a streamed body as it goes out, until it outgrows MAX_ENTRY_BYTES."""
+
+    def __init__(self, key, response, ttl, before, generation):
+        self.key = key
+        self.status = response.status_code
+        self.mimetype = response.mimetype
+        self.ttl = ttl
+        self.before = before
+        self.generation = generation
+        self._parts = []
+        self._size = 0
+
+    def add(self, chunk):
+        if self._parts is not None:
+            data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+            self._size += len(data)
+            if self._size > MAX_ENTRY_BYTES:
+                self._parts = None
+            else:
+                self._parts.append(data)
+
+    def finish(self):
+        """Store the body, if it was kept, once the last chunk is out."""
+        if self._parts is not None:
+            response_cache.put(self.key, _Entry(b''.join(self._parts), self.status, self.mimetype,
+                                                upstream_calls() - self.before, self.ttl), self.generation)
+
+
+def _recording(chunks, *args):
+    recorder = Recorder(*args)
+    for chunk in chunks:
+        yield chunk
+        recorder.add(chunk)
+    recorder.finish()
@@ -1,5 +1,6 @@
 from flask import Blueprint
 import handlers
+from response_cache import cached
 
 bp = Blueprint('main', __name__)
 
@@ -8,10 +9,13 @@ def register_routes(app):
     bp.route('/check_login', endpoint='check_login')(handlers.check_login)
     bp.route('/login', endpoint='login')(lambda: handlers.login(app))
     bp.route('/oauth2callback', endpoint='oauth2callback')(lambda: handlers.oauth2callback(app))
-    bp.route('/calendar_events', endpoint='calendar_events')(handlers.calendar_events)
-    bp.route('/availabilities', endpoint='availabilities')(handlers.availabilities)
-    bp.route('/todays_emails', endpoint='todays_emails')(handlers.todays_emails)
-    bp.route('/contacts', endpoint='contacts')(handlers.contacts)
+    bp.route('/calendar_events', endpoint='calendar_events')(cached('calendar_events')(handlers.calendar_events))
+    bp.route('/availabilities', endpoint='availabilities')(cached('availabilities')(handlers.availabilities))
+    bp.route('/todays_emails', endpoint='todays_emails')(cached('todays_emails')(handlers.todays_emails))
+    bp.route('/contacts', endpoint='contacts')(cached('contacts')(handlers.contacts))
+    bp.route('/cache_stats', endpoint='cache_stats')(handlers.cache_stats)
+    bp.route('/metrics', endpoint='metrics')(handlers.prometheus_metrics)
+    bp.route('/debug/profile', endpoint='profile')(handlers.profile)
     bp.route('/send_email', methods=['POST'], endpoint='send_email')(handlers.send_email)
     bp.route('/create_event', methods=['POST'], endpoint='create_event')(handlers.create_event)
 
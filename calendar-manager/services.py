@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import httplib2
+from google.auth.transport.requests import AuthorizedSession
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from requests.adapters import HTTPAdapter
+
+from metrics import api_name, record_upstream
+
+# Defaults for the per-user service cache
+DEFAULT_MAXSIZE = 256
+DEFAULT_TTL = 30 * 60
+DEFAULT_TIMEOUT = 30
+
+# One connection pool shared by every user session, so keep-alive
+# connections to googleapis.com survive across requests
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64)
+
+# Point every API at another host, e.g. a local fake for load tests
+API_ROOT = os.environ.get('GOOGLE_API_ROOT')
+
+# Parsed discovery documents, keyed by (api, version)
+_discovery_docs = {}
+_discovery_lock = threading.Lock()
+
+
+class PooledHttp:
+    """httplib2-compatible transport backed by a pooled requests session."""
+
+    def __init__(self, session, timeout=DEFAULT_TIMEOUT):
+        self.session = session
+        self.timeout = timeout
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=None, connection_type=None):
+        started = time.perf_counter()
+        response = self.session.request(method, uri, data=body, headers=headers,
+                                        timeout=self.timeout)
+        record_upstream(api_name(uri), time.perf_counter() - started)
+        info = dict(response.headers)
+        info['status'] = str(response.status_code)
+        return httplib2.Response(info), response.content
+
+
+def authorized_http(credentials):
+    session = AuthorizedSession(credentials)
+    session.mount('https://', _adapter)
+    session.mount('http://', _adapter)
+    return PooledHttp(session)
+
+
+def get_discovery_doc(api, version):
+    doc = _discovery_docs.get((api, version))
+    if doc is None:
+        with _discovery_lock:
+            doc = _discovery_docs.get((api, version))
+            if doc is None:
+                content = get_static_doc(api, version)
+                doc = json.loads(content) if content else None
+                if doc is not None and API_ROOT:
+                    doc['rootUrl'] = API_ROOT
+                _discovery_docs[(api, version)] = doc
+    return doc
+
+
+def credentials_key(credentials):
+    # Tie cache entries to the login: a new refresh token means a new entry
+    return user_key(credentials.client_id, credentials.refresh_token or credentials.token)
+
+
+def user_key(client_id, secret):
+    raw = f"{client_id}:{secret or ''}".encode('utf-8')
+    return hashlib.sha256(raw).hexdigest()
+
+
+class ServiceCache:
+    """LRU/TTL cache of built Google API service objects per user."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL, http_factory=authorized_http):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.http_factory = http_factory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, api, version, credentials):
+        key = (credentials_key(credentials), api, version)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        service = self._build(api, version, credentials)
+
+        with self._lock:
+            self._entries[key] = (service, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return service
+
+    def _build(self, api, version, credentials):
+        http = self.http_factory(credentials)
+        doc = get_discovery_doc(api, version)
+        if doc is None:
+            logging.warning("No static discovery document for %s %s, fetching it", api, version)
+            return build(api, version, http=http, cache_discovery=False)
+        return build_from_document(doc, http=http)
+
+    def invalidate(self, credentials):
+        user = credentials_key(credentials)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+service_cache = ServiceCache()
+
+
+def get_service(api, version, credentials):
+    return service_cache.get(api, version, credentials)
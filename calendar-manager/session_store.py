@@ -0,0 +1,192 @@
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SecureCookieSession, SessionInterface
+
+DEFAULT_MAXSIZE = 10000
+# Sessions not written for this long are dropped (seconds)
+DEFAULT_TTL = 31 * 24 * 3600
+# Run the SQLite expiry sweep at most this often (seconds)
+PURGE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def new_session_id():
+    return secrets.token_urlsafe(32)
+
+
+class MemorySessionStore:
+    """Session data kept in this process, LRU evicted. Not shared between workers."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None or entry[1] < time.time():
+                self._entries.pop(sid, None)
+                return None
+            self._entries.move_to_end(sid)
+            return dict(entry[0])
+
+    def save(self, sid, data):
+        with self._lock:
+            self._entries[sid] = (dict(data), time.time() + self.ttl)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+
+class SqliteSessionStore:
+    """Session data in SQLite, shared by every worker using the same file.
+
+    Parsed session dicts are cached per process and only re-read from JSON
+    when another worker has written a newer version.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, cache_size=DEFAULT_MAXSIZE):
+        self.path = path
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._purged_at = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def load(self, sid):
+        with self._lock:
+            cached = self._cache.get(sid)
+            if cached is not None:
+                row = self._conn.execute(
+                    'SELECT version, expires_at FROM sessions WHERE sid = ?', (sid,)
+                ).fetchone()
+                if row is not None and row[0] == cached[0] and row[1] >= time.time():
+                    self._cache.move_to_end(sid)
+                    return dict(cached[1])
+
+            row = self._conn.execute(
+                'SELECT version, expires_at, data FROM sessions WHERE sid = ?', (sid,)
+            ).fetchone()
+            if row is None or row[1] < time.time():
+                self._cache.pop(sid, None)
+                return None
+            data = json.loads(row[2])
+            self._remember(sid, row[0], data)
+            return dict(data)
+
+    def save(self, sid, data):
+        now = time.time()
+        with self._lock, self._conn:
+            version = self._conn.execute(
+                """
+                INSERT INTO sessions (sid, data, version, expires_at) VALUES (?, ?, 1, ?)
+                ON CONFLICT (sid) DO UPDATE SET
+                    data = excluded.data, version = version + 1, expires_at = excluded.expires_at
+                RETURNING version
+                """,
+                (sid, json.dumps(data), now + self.ttl)
+            ).fetchone()[0]
+            self._remember(sid, version, dict(data))
+            if now - self._purged_at > PURGE_INTERVAL:
+                self._conn.execute('DELETE FROM sessions WHERE expires_at < ?', (now,))
+                self._purged_at = now
+
+    def delete(self, sid):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+            self._cache.pop(sid, None)
+
+    def _remember(self, sid, version, data):
+        self._cache[sid] = (version, data)
+        self._cache.move_to_end(sid)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+def create_session_store(config):
+    if config.get('SESSION_STORE') == 'memory':
+        return MemorySessionStore()
+    return SqliteSessionStore(config['SESSIONS_DB'])
+
+
+class ServerSideSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, new=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.new = new
+        self.replaced_sid = None
+
+    def regenerate(self):
+        """Move the session to a fresh ID, e.g. on login, so an ID fixed before it is worthless.
+
+        The record under the old ID is deleted when the session is saved.
+        """
+        if not self.new and self.replaced_sid is None:
+            self.replaced_sid = self.sid
+        self.sid = new_session_id()
+        self.new = True
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask sessions kept in a session store; the cookie only carries an opaque session ID."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        data = self.store.load(sid) if sid else None
+        if data is None:
+            return ServerSideSession(sid=new_session_id(), new=True)
+        return ServerSideSession(data, sid=sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.replaced_sid is not None:
+            self.store.delete(session.replaced_sid)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.modified:
+            return
+        self.store.save(session.sid, dict(session))
+        if session.new or session.permanent:
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
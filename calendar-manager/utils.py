@@ -2,8 +2,9 @@ from datetime import datetime
 import logging
 import base64
 from email.mime.text import MIMEText
-import json
-from google.oauth2.credentials import Credentials
+from credential_manager import get_credentials
+from gmail import account_id
+from services import get_service
 
 def create_message(sender, to, subject, message_text):
     message = MIMEText(message_text)
@@ -22,7 +23,7 @@ def to_rfc3339(datetime_str):
             dt = datetime.strptime(datetime_str, "%Y-%m-%dT%H:%M:%S")
             return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
         except ValueError as ve:
-            logging.error(f"Invalid datetime format: {ve}")
+            logging.error("Invalid datetime format: %s", ve)
             return None
 
 def credentials_to_dict(credentials):
@@ -32,26 +33,22 @@ def credentials_to_dict(credentials):
         'token_uri': credentials.token_uri,
         'client_id': credentials.client_id,
         'client_secret': credentials.client_secret,
-        'scopes': credentials.scopes
+        'scopes': credentials.scopes,
+        'expiry': credentials.expiry.isoformat() if credentials.expiry else None
     }
 
-def get_credentials_from_session(session):
+def get_credentials_from_session(session, refresh=True):
     if 'credentials' not in session:
         return None
-    
-    credentials_dict = session['credentials']
-    
-    # Ensure all values are strings
-    credentials_dict = {k: str(v) if v is not None else None for k, v in credentials_dict.items()}
-    
-    # Handle 'scopes' conversion
-    if 'scopes' in credentials_dict:
-        try:
-            if isinstance(credentials_dict['scopes'], str):
-                credentials_dict['scopes'] = json.loads(credentials_dict['scopes'])
-        except json.JSONDecodeError:
-            # If 'scopes' is not a valid JSON string, assume it's already a list
-            if isinstance(credentials_dict['scopes'], str):
-                credentials_dict['scopes'] = [s.strip() for s in credentials_dict['scopes'].split(',')]
-    
-    return Credentials(**credentials_dict)
+    # Parsed once per user and kept fresh by the credential manager
+    credentials = get_credentials(session['credentials'], refresh)
+    if credentials.token != session['credentials'].get('token'):
+        # Write refreshed tokens back, so other workers sharing the session store pick them up
+        session['credentials'] = credentials_to_dict(credentials)
+    return credentials
+
+def session_account(session, credentials):
+    """account_id() of the session's user, looked up once per login."""
+    if 'account' not in session:
+        session['account'] = account_id(get_service('gmail', 'v1', credentials))
+    return session['account']
@@ -1,9 +1,14 @@
-from langchain_core.messages import SystemMessage
+from typing import Annotated
+
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 
-from langgraph.graph import START, StateGraph, MessagesState
+from langgraph.graph import START, StateGraph
 from langgraph.prebuilt import tools_condition, ToolNode
 
+from checkpointer import DeltaMessagesState, shared_checkpointer
+from turns import add_turns, turn, turn_count
+
 def add(a: int, b: int) -> int:
     """Adds a and b.
 
@@ -40,12 +45,21 @@ llm_with_tools = llm.bind_tools(tools)
 # System message
 sys_msg = SystemMessage(content="You are a helpful assistant tasked with writing performing arithmetic on a set of inputs.")
 
+# Model calls allowed per user message; the last one answers without tools
+MAX_ITERATIONS = 10
+
+class AgentState(DeltaMessagesState):
+    turns: Annotated[dict, add_turns]
+
 # Node
-def assistant(state: MessagesState):
-   return {"messages": [llm_with_tools.invoke([sys_msg] + state["messages"])]}
+def assistant(state: AgentState):
+   # A new user message starts a new count
+   new = isinstance(state["messages"][-1], HumanMessage)
+   model = llm if not new and turn_count(state) + 1 >= MAX_ITERATIONS else llm_with_tools
+   return {"messages": [model.invoke([sys_msg] + state["messages"])], "turns": turn(new=new)}
 
 # Build graph
-builder = StateGraph(MessagesState)
+builder = StateGraph(AgentState)
 builder.add_node("assistant", assistant)
 builder.add_node("tools", ToolNode(tools))
 builder.add_edge(START, "assistant")
@@ -58,4 +72,4 @@ builder.add_conditional_edges(
 builder.add_edge("tools", "assistant")
 
 # Compile graph
-graph = builder.compile()
+graph = builder.compile(checkpointer=shared_checkpointer())
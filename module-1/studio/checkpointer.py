@@ -0,0 +1,321 @@
+import asyncio
+import functools
+import itertools
+import json
+import operator
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import closing, contextmanager, nullcontext
+from typing import Annotated
+
+from langchain_core.messages import AnyMessage
+from langgraph.channels.delta import DeltaChannel
+from langgraph.checkpoint.base import WRITES_IDX_MAP, get_checkpoint_metadata
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import add_messages
+from typing_extensions import TypedDict
+
+# Queued rows committed together in one transaction
+DEFAULT_BATCH_SIZE = 64
+# Longest a queued row waits before it is committed (seconds)
+DEFAULT_FLUSH_INTERVAL = 0.05
+# Blobs smaller than this are stored as they are (bytes)
+COMPRESS_MIN_BYTES = 512
+# Updates to a delta channel between full snapshots of its value; loading a checkpoint replays at most this many
+DEFAULT_SNAPSHOT_FREQUENCY = 50
+
+INSERT_CHECKPOINT = """
+INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+# Special writes (errors, interrupts, ...) replace an earlier attempt, regular writes keep the first one
+REPLACE_WRITE = """
+INSERT OR REPLACE INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, channel, type, value)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+INSERT_WRITE = """
+INSERT OR IGNORE INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, channel, type, value)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class CompressedSerializer:
+    """Wraps a checkpoint serializer, zlib-compressing blobs of at least `min_bytes`.
+
+    Compressed blobs get "+zlib" appended to their type, so databases can mix
+    compressed and plain rows. With `min_bytes=None` nothing new is compressed,
+    but compressed rows still load.
+    """
+
+    def __init__(self, serde=None, min_bytes=COMPRESS_MIN_BYTES, level=6):
+        self.serde = serde or JsonPlusSerializer()
+        self.min_bytes = min_bytes
+        self.level = level
+
+    def dumps_typed(self, obj):
+        type_, data = self.serde.dumps_typed(obj)
+        if self.min_bytes is None or len(data) < self.min_bytes:
+            return type_, data
+        packed = zlib.compress(data, self.level)
+        if len(packed) >= len(data):
+            return type_, data
+        return f"{type_}+zlib", packed
+
+    def loads_typed(self, data):
+        type_, blob = data
+        if type_ and type_.endswith("+zlib"):
+            return self.serde.loads_typed((type_.removesuffix("+zlib"), zlib.decompress(blob)))
+        return self.serde.loads_typed(data)
+
+
+def connect(path):
+    # Statements are constant strings, so each connection prepares them once and reuses them from its cache
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30, cached_statements=256)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class BatchedSqliteSaver(SqliteSaver):
+    """SqliteSaver for many runs at once against one database file.
+
+    Checkpoints and task writes are queued and committed together by a single
+    writer connection: once `batch_size` rows are waiting, `flush_interval`
+    seconds after the first of them, or before this saver reads. Reads use one
+    connection per thread, so in WAL mode they run next to the writer and each
+    other instead of queueing behind one lock. Blobs are zlib-compressed unless
+    `compress=False`.
+
+    Rows still queued when the process dies are lost, at most `flush_interval`
+    seconds of work; call flush() or close() before exiting.
+    """
+
+    def __init__(self, path, *, serde=None, compress=True, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._readers = []
+        self._queue = []
+        self._queue_lock = threading.Lock()
+        self._pending = threading.Event()
+        self._closed = False
+        self._flusher = None
+        super().__init__(connect(path), serde=CompressedSerializer(serde, COMPRESS_MIN_BYTES if compress else None))
+
+    @classmethod
+    @contextmanager
+    def from_conn_string(cls, conn_string, **kwargs):
+        saver = cls(conn_string, **kwargs)
+        try:
+            yield saver
+        finally:
+            saver.close()
+
+    @property
+    def conn(self):
+        # SqliteSaver creates the schema and, in list(), reads pending writes through self.conn:
+        # that is the writer until the schema exists, this thread's reader after
+        if not self.is_setup or self.path == ':memory:':
+            return self._writer
+        reader = getattr(self._local, 'conn', None)
+        if reader is None:
+            reader = self._local.conn = connect(self.path)
+            reader.execute('PRAGMA query_only=ON')
+            with self._queue_lock:
+                self._readers.append(reader)
+        return reader
+
+    @conn.setter
+    def conn(self, conn):
+        self._writer = conn
+
+    def setup(self):
+        if self.is_setup:
+            return
+        with self.lock:
+            super().setup()
+
+    @contextmanager
+    def cursor(self, transaction=True):
+        self.setup()
+        # Reads and direct writes see everything this saver has queued so far
+        self.flush()
+        if transaction:
+            with self.lock, self._writer, closing(self._writer.cursor()) as cur:
+                yield cur
+            return
+        # An in-memory database has no separate readers; share the writer under the lock instead
+        with self.lock if self.path == ':memory:' else nullcontext():
+            with closing(self.conn.cursor()) as cur:
+                yield cur
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"]
+        self._enqueue([(INSERT_CHECKPOINT, (
+            str(configurable["thread_id"]),
+            configurable["checkpoint_ns"],
+            checkpoint["id"],
+            configurable.get("checkpoint_id"),
+            *self.serde.dumps_typed(checkpoint),
+            json.dumps(get_checkpoint_metadata(config, metadata), ensure_ascii=False).encode("utf-8", "ignore"),
+        ))])
+        return {
+            "configurable": {
+                "thread_id": configurable["thread_id"],
+                "checkpoint_ns": configurable["checkpoint_ns"],
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        configurable = config["configurable"]
+        query = REPLACE_WRITE if all(channel in WRITES_IDX_MAP for channel, _ in writes) else INSERT_WRITE
+        self._enqueue([
+            (query, (
+                str(configurable["thread_id"]),
+                str(configurable["checkpoint_ns"]),
+                str(configurable["checkpoint_id"]),
+                task_id,
+                task_path,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                *self.serde.dumps_typed(value),
+            ))
+            for idx, (channel, value) in enumerate(writes)
+        ])
+
+    def _enqueue(self, rows):
+        if self._closed:
+            raise RuntimeError("BatchedSqliteSaver is closed")
+        self.setup()
+        with self._queue_lock:
+            self._queue.extend(rows)
+            full = len(self._queue) >= self.batch_size
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, name='checkpoint-flusher',
+                                                 daemon=True)
+                self._flusher.start()
+        if full:
+            self.flush()
+        else:
+            self._pending.set()
+
+    def _flush_periodically(self):
+        while not self._closed:
+            self._pending.wait()
+            self._pending.clear()
+            if not self._closed:
+                # Let the rows of the next few steps join the batch
+                time.sleep(self.flush_interval)
+                self.flush()
+
+    def flush(self):
+        """Commit every queued row in one transaction."""
+        # Holding the writer lock across the swap makes a concurrent reader wait for this commit
+        with self.lock:
+            with self._queue_lock:
+                rows, self._queue = self._queue, []
+            if not rows:
+                return
+            with self._writer:
+                for query, group in itertools.groupby(rows, key=operator.itemgetter(0)):
+                    self._writer.executemany(query, [params for _, params in group])
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._pending.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        with self._queue_lock:
+            readers, self._readers = self._readers, []
+        for reader in readers:
+            reader.close()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # SQLite calls block, so the async API runs them on worker threads
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def aget_delta_channel_history(self, *, config, channels):
+        return await asyncio.to_thread(lambda: self.get_delta_channel_history(config=config, channels=channels))
+
+
+@functools.cache
+def _folding(reducer):
+    def fold(value, writes):
+        return functools.reduce(reducer, writes, value)
+
+    # DeltaChannel compares reducers by identity, so every channel built on `reducer` shares one fold
+    fold.__name__ = f"fold_{getattr(reducer, '__name__', 'reducer')}"
+    return fold
+
+
+def delta_channel(reducer=operator.add, snapshot_frequency=DEFAULT_SNAPSHOT_FREQUENCY):
+    """Channel that checkpoints a state key's updates instead of its value: Annotated[list, delta_channel()].
+
+    Each step stores only what was written to the key (appended items, or added
+    and removed messages with add_messages); the full value is stored every
+    `snapshot_frequency` updates, and loading a checkpoint replays the writes
+    since the last one through `reducer`, one write at a time as they were
+    first applied. Time travel and forks work as usual, since every checkpoint
+    can still be rebuilt from its own ancestors.
+    """
+    return DeltaChannel(_folding(reducer), snapshot_frequency=snapshot_frequency)
+
+
+class DeltaMessagesState(TypedDict):
+    """MessagesState whose checkpoints keep each step's new and removed messages, not the whole list."""
+    messages: Annotated[list[AnyMessage], delta_channel(add_messages)]
+
+
+_saver = None
+_saver_lock = threading.Lock()
+
+
+def shared_checkpointer():
+    """BatchedSqliteSaver on CHECKPOINT_DB, or None (the platform's own checkpointer) if it is not set."""
+    global _saver
+    path = os.environ.get('CHECKPOINT_DB')
+    if not path:
+        return None
+    with _saver_lock:
+        if _saver is None:
+            if path != ':memory:':
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            _saver = BatchedSqliteSaver(
+                path,
+                compress=os.environ.get('CHECKPOINT_COMPRESS', '1') != '0',
+                batch_size=int(os.environ.get('CHECKPOINT_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+                flush_interval=float(os.environ.get('CHECKPOINT_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)),
+            )
+        return _saver
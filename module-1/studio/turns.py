@@ -0,0 +1,24 @@
+def turn(done=False, new=False):
+    """Update for a turns key: one more turn, optionally ending the loop or starting a new count."""
+    return {"count": 1, "done": done, "new": new}
+
+
+def add_turns(left, right):
+    """Reducer for a {"count": int, "done": bool} turn counter.
+
+    Nodes return turn() once per loop iteration, so routers can check the count
+    and the termination flag without scanning the message list.
+    """
+    if not right:
+        return left or {"count": 0, "done": False}
+    if right.get("new") or not left:
+        return {"count": right["count"], "done": right["done"]}
+    return {"count": left["count"] + right["count"], "done": left["done"] or right["done"]}
+
+
+def turn_count(state, key="turns"):
+    return (state.get(key) or {}).get("count", 0)
+
+
+def loop_done(state, key="turns"):
+    return (state.get(key) or {}).get("done", False)
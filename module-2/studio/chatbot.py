@@ -1,15 +1,109 @@
-from langchain_core.messages import HumanMessage, SystemMessage, RemoveMessage
-from langgraph.graph import MessagesState
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage, SystemMessage, RemoveMessage, get_buffer_string
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 
 # We will use this model for both the conversation and the summarization
 from langchain_openai import ChatOpenAI
-model = ChatOpenAI(model="gpt-4o", temperature=0) 
+from checkpointer import DeltaMessagesState, shared_checkpointer
+from llm_cache import shared_llm_cache
+from tokens import count_tokens
+model = ChatOpenAI(model="gpt-4o", temperature=0, cache=shared_llm_cache())
+
+logger = logging.getLogger(__name__)
+
+# Tokens of conversation kept in the prompt before older messages are folded into the summary
+SUMMARY_TOKEN_BUDGET = 2000
+# Most recent messages kept as they are when the rest is summarized
+KEEP_MESSAGES = 2
 
 # State class to store messages and summary
-class State(MessagesState):
+class State(DeltaMessagesState):
     summary: str
-    
+
+def summarize(messages, summary):
+
+    """ Summary of the messages, extending the previous summary, and the ids of the messages it replaces """
+
+    # Create our summarization prompt
+    if summary:
+
+        # If a summary already exists, add it to the prompt
+        summary_message = (
+            f"This is summary of the conversation to date: {summary}\n\n"
+            "Extend the summary by taking into account the new messages above:"
+        )
+
+    else:
+        # If no summary exists, just create a new one
+        summary_message = "Create a summary of the conversation above:"
+
+    # Add prompt to our history
+    response = model.invoke(messages + [HumanMessage(content=summary_message)])
+
+    # All but the most recent messages are covered by the summary from now on
+    return response.content, [m.id for m in messages[:-KEEP_MESSAGES]]
+
+class BackgroundSummaries:
+    """Summaries made off the response path, at most one per conversation thread.
+
+    A summary started after one turn is merged by the thread's next turn if it
+    is finished by then, or by a later turn if not, so a turn never waits for
+    it. Pending summaries live in this process; one lost to a restart is
+    simply started again once the thread is over budget.
+    """
+
+    def __init__(self, max_workers=2, max_threads=1024):
+        self.max_threads = max_threads
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="summarize")
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, thread_id, messages, summary):
+        with self._lock:
+            if thread_id in self._futures:
+                return
+            self._futures[thread_id] = self._executor.submit(summarize, messages, summary)
+            # Summaries of threads that never come back are dropped, oldest first
+            while len(self._futures) > self.max_threads:
+                self._futures.popitem(last=False)
+
+    def take(self, thread_id):
+        """The thread's finished (summary, replaced ids), or None if there is none yet."""
+        with self._lock:
+            future = self._futures.get(thread_id)
+            if future is None or not future.done():
+                return None
+            del self._futures[thread_id]
+        try:
+            return future.result()
+        except Exception:
+            logger.exception("Background summary for thread %s failed", thread_id)
+            return None
+
+background_summaries = BackgroundSummaries()
+
+def summary_update(summary, summarized_ids):
+    # Delete the summarized messages and add our summary to the state
+    return {"summary": summary, "messages": [RemoveMessage(id=i) for i in summarized_ids]}
+
+# Merge a summary finished since the last turn before the model sees the conversation
+def merge_summary(state: State, config: RunnableConfig):
+
+    result = background_summaries.take(config.get("configurable", {}).get("thread_id"))
+    if result is None:
+        return {}
+    summary, summarized_ids = result
+
+    # Messages were edited or the thread was rewound since the summary started; it no longer fits
+    if not set(summarized_ids) <= {m.id for m in state["messages"]}:
+        return {}
+    return summary_update(summary, summarized_ids)
+
 # Define the logic to call the model
 def call_model(state: State):
     
@@ -38,48 +132,38 @@ def should_continue(state: State):
     
     messages = state["messages"]
     
-    # If there are more than six messages, then we summarize the conversation
-    if len(messages) > 6:
+    # If the messages are over the token budget, then we summarize the conversation
+    if len(messages) > KEEP_MESSAGES and count_tokens(get_buffer_string(messages), model.model_name) > SUMMARY_TOKEN_BUDGET:
         return "summarize_conversation"
     
     # Otherwise we can just end
     return END
 
-def summarize_conversation(state: State):
-    
+def summarize_conversation(state: State, config: RunnableConfig):
+
     # First get the summary if it exists
     summary = state.get("summary", "")
 
-    # Create our summarization prompt 
-    if summary:
-        
-        # If a summary already exists, add it to the prompt
-        summary_message = (
-            f"This is summary of the conversation to date: {summary}\n\n"
-            "Extend the summary by taking into account the new messages above:"
-        )
-        
-    else:
-        # If no summary exists, just create a new one
-        summary_message = "Create a summary of the conversation above:"
+    # Without a thread there is no next turn to merge into, so summarize now
+    thread_id = config.get("configurable", {}).get("thread_id")
+    if thread_id is None:
+        return summary_update(*summarize(state["messages"], summary))
 
-    # Add prompt to our history
-    messages = state["messages"] + [HumanMessage(content=summary_message)]
-    response = model.invoke(messages)
-    
-    # Delete all but the 2 most recent messages and add our summary to the state 
-    delete_messages = [RemoveMessage(id=m.id) for m in state["messages"][:-2]]
-    return {"summary": response.content, "messages": delete_messages}
+    # Otherwise the reply goes out now and the next turn merges the summary
+    background_summaries.start(thread_id, state["messages"], summary)
+    return {}
 
 # Define a new graph
 workflow = StateGraph(State)
+workflow.add_node(merge_summary)
 workflow.add_node("conversation", call_model)
 workflow.add_node(summarize_conversation)
 
-# Set the entrypoint as conversation
-workflow.add_edge(START, "conversation")
+# Set the entrypoint as conversation, after merging any finished summary
+workflow.add_edge(START, "merge_summary")
+workflow.add_edge("merge_summary", "conversation")
 workflow.add_conditional_edges("conversation", should_continue)
 workflow.add_edge("summarize_conversation", END)
 
 # Compile
-graph = workflow.compile()
\ No newline at end of file
+graph = workflow.compile(checkpointer=shared_checkpointer())
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextvars import ContextVar
+
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+from langchain_core.tracers.context import register_configure_hook
+
+# Cached responses older than this are requested again (seconds)
+DEFAULT_TTL = 30 * 24 * 3600
+# Longest a duplicate request waits on an identical call that neither answers nor fails (seconds)
+INFLIGHT_TIMEOUT = 120
+
+# Message fields that differ between runs without changing the prompt
+VOLATILE_FIELDS = {"id", "response_metadata", "usage_metadata"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    generations TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def canonical_prompt(prompt):
+    """Serialized messages with ids and provider metadata stripped, keys sorted."""
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    for message in messages if isinstance(messages, list) else []:
+        kwargs = message.get("kwargs") if isinstance(message, dict) else None
+        if isinstance(kwargs, dict):
+            for field in VOLATILE_FIELDS:
+                kwargs.pop(field, None)
+    return json.dumps(messages, sort_keys=True)
+
+
+class _Flight:
+    def __init__(self, timeout, run_id):
+        self.deadline = time.monotonic() + timeout
+        self.run_id = run_id
+        self.done = threading.Event()
+        self.generations = None
+
+
+# The chat model run whose cache lookup comes next in this context, set by _FlightReleaser
+_current_run = ContextVar("llm_cache_run", default=None)
+_caches = weakref.WeakSet()
+
+
+class _FlightReleaser(BaseCallbackHandler):
+    """Releases the callers waiting on a cached chat model call as soon as the call fails.
+
+    Registered for every run, so models only need cache=LLMCache(...).
+    """
+
+    run_inline = True
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        # Runs in the model call's own context, just before it looks up the cache
+        _current_run.set(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        for cache in list(_caches):
+            cache.release(run_id)
+
+
+register_configure_hook(ContextVar("llm_cache_releaser", default=_FlightReleaser()), inheritable=True)
+
+
+class LLMCache(BaseCache):
+    """Exact-match chat model cache, passed to a model as ChatOpenAI(cache=...).
+
+    Responses are keyed by the model and its parameters (including bound tools
+    and structured output schemas) and the canonicalized messages, and kept in
+    SQLite so they are shared by every process using the same file. A lookup
+    that finds the same request already in flight waits for its response
+    instead of making a second call, so identical prompts from parallel Send()
+    branches cost one call. When that call fails (or, with ainvoke, is
+    cancelled) the waiting callers are released at once and the first of
+    them makes the call itself; the in-flight deadline only bounds the wait
+    on a call that hangs.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, inflight_timeout=INFLIGHT_TIMEOUT):
+        self.path = path
+        self.ttl = ttl
+        self.inflight_timeout = inflight_timeout
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        _caches.add(self)
+
+    @staticmethod
+    def key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\0{canonical_prompt(prompt)}".encode()).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        return self._lookup(self.key(prompt, llm_string), _current_run.get())[0]
+
+    async def alookup(self, prompt, llm_string):
+        key = self.key(prompt, llm_string)
+        generations, flight = await asyncio.to_thread(self._lookup, key, _current_run.get())
+        if flight is not None:
+            # A cancelled call never reports an error; its flight ends with the task making the call
+            asyncio.current_task().add_done_callback(lambda task: self._land(key, flight))
+        return generations
+
+    def _lookup(self, key, run_id):
+        """(generations, None) from the cache or an identical call, or (None, flight) if this caller makes the call."""
+        while True:
+            with self._lock:
+                generations = self._load(key)
+                if generations is not None:
+                    self.hits += 1
+                    return generations, None
+                flight = self._inflight.get(key)
+                if flight is None:
+                    # This caller makes the request; update() or release() lets anyone waiting on it go
+                    flight = self._inflight[key] = _Flight(self.inflight_timeout, run_id)
+                    self.misses += 1
+                    return None, flight
+
+            if flight.done.wait(max(0, flight.deadline - time.monotonic())) and flight.generations is not None:
+                with self._lock:
+                    self.deduplicated += 1
+                # Callers may modify the messages they get back, so each gets its own copy
+                return [generation.model_copy(deep=True) for generation in flight.generations], None
+            # The call failed, or is past its deadline: take it over
+            self._land(key, flight)
+
+    def release(self, run_id):
+        """Let the callers waiting on the calls of a failed chat model run make their own."""
+        with self._lock:
+            flights = [(key, flight) for key, flight in self._inflight.items() if flight.run_id == run_id]
+        for key, flight in flights:
+            self._land(key, flight)
+
+    def _land(self, key, flight):
+        with self._lock:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        flight.done.set()
+
+    def update(self, prompt, llm_string, return_val):
+        key = self.key(prompt, llm_string)
+        data = json.dumps([
+            {"message": message_to_dict(generation.message), "generation_info": generation.generation_info}
+            for generation in return_val
+        ])
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO llm_cache (key, generations, created_at) VALUES (?, ?, ?)',
+                    (key, data, time.time())
+                )
+            flight = self._inflight.pop(key, None)
+        if flight is not None:
+            flight.generations = return_val
+            flight.done.set()
+
+    def clear(self, **kwargs):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM llm_cache')
+
+    def _load(self, key):
+        row = self._conn.execute(
+            'SELECT generations FROM llm_cache WHERE key = ? AND created_at >= ?', (key, time.time() - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        return [
+            ChatGeneration(message=messages_from_dict([item["message"]])[0], generation_info=item["generation_info"])
+            for item in json.loads(row[0])
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'deduplicated': self.deduplicated}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def shared_llm_cache():
+    """The process-wide cache at $LLM_CACHE_DB, or None (no caching) when it is unset.
+
+    Only pass it to models called with temperature=0: a cached answer is
+    replayed for every identical prompt.
+    """
+    global _cache
+    path = os.environ.get('LLM_CACHE_DB')
+    if not path:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            _cache = LLMCache(path, ttl=float(os.environ.get('LLM_CACHE_TTL', DEFAULT_TTL)))
+        return _cache
@@ -0,0 +1,43 @@
+import functools
+import logging
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Characters per token assumed when a model has no tokenizer
+CHARS_PER_TOKEN = 4
+
+
+@functools.cache
+def token_encoding(model_name):
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except Exception as error:
+        # Unknown model, or the encoding could not be downloaded
+        logger.warning("No tokenizer for %s (%r), estimating %d characters per token",
+                       model_name, error, CHARS_PER_TOKEN)
+        return None
+
+
+def count_tokens(text, model_name):
+    encoding = token_encoding(model_name)
+    return len(text) // CHARS_PER_TOKEN if encoding is None else len(encoding.encode(text))
+
+
+def truncate_tokens(text, max_tokens, model_name):
+    """Cut text to at most max_tokens tokens, at a sentence end where possible."""
+    encoding = token_encoding(model_name)
+    if encoding is None:
+        if len(text) <= max_tokens * CHARS_PER_TOKEN:
+            return text
+        truncated = text[:max_tokens * CHARS_PER_TOKEN]
+    else:
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        truncated = encoding.decode(tokens[:max_tokens])
+    sentence_end = truncated.rfind(". ")
+    if sentence_end > len(truncated) // 2:
+        truncated = truncated[:sentence_end + 1]
+    return truncated + " ..."
@@ -0,0 +1,224 @@
+"""Checkpoint write/read latency and database growth per turn.
+
+Runs the module-2 chatbot and one research assistant interview against fake
+models, one turn at a time on a single thread, with each checkpointer:
+
+    sqlite         SqliteSaver (AsyncSqliteSaver for the async interview graph)
+    batched        BatchedSqliteSaver without compression
+    batched+zlib   BatchedSqliteSaver
+
+Write time is what the graph waits for in put()/put_writes() per turn, read
+time is one get_state() after the turn, and bytes are the stored checkpoint,
+metadata and write blobs added by the turn. Run from the module-4 directory:
+
+    python benchmarks/bench_checkpoints.py --turns 40
+"""
+import argparse
+import asyncio
+import inspect
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKDIR = tempfile.mkdtemp(prefix='bench_checkpoints_')
+os.environ.setdefault('OPENAI_API_KEY', 'fake')
+os.environ['LLM_CACHE_DB'] = os.path.join(WORKDIR, 'llm_cache.db')
+os.environ['RETRIEVAL_CACHE_DB'] = os.path.join(WORKDIR, 'retrieval_cache.db')
+os.environ.pop('CHECKPOINT_DB', None)
+sys.path.insert(0, os.path.join(HERE, '..', 'studio'))
+sys.path.insert(1, os.path.join(HERE, '..', '..', 'module-2', 'studio'))
+
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+from langgraph.checkpoint.sqlite import SqliteSaver  # noqa: E402
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver  # noqa: E402
+
+import chatbot  # noqa: E402
+import research_assistant  # noqa: E402
+from checkpointer import BatchedSqliteSaver  # noqa: E402
+
+
+class FakeChatModel(BaseChatModel):
+    reply_chars: int = 800
+    model_name: str = 'gpt-4o'
+
+    @property
+    def _llm_type(self):
+        return 'fake-checkpoint-bench'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        words = ('lorem ipsum dolor sit amet ' * (self.reply_chars // 27 + 1))[:self.reply_chars]
+        message = AIMessage(content=f'{uuid.uuid4().hex} {words}', id=str(uuid.uuid4()))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def with_structured_output(self, schema, **kwargs):
+        return FakeStructured()
+
+
+class FakeStructured:
+    def invoke(self, messages, *args, **kwargs):
+        return research_assistant.SearchQuery(search_query=f'query {uuid.uuid4().hex[:8]}')
+
+
+class Timings:
+    """Wraps a saver's write methods and adds up the time callers spend in them."""
+
+    def __init__(self, saver):
+        self.seconds = 0.0
+        for name in ('put', 'put_writes', 'aput', 'aput_writes'):
+            setattr(saver, name, self.timed(getattr(saver, name)))
+
+    def timed(self, method):
+        if inspect.iscoroutinefunction(method):
+            async def atimed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    self.seconds += time.perf_counter() - start
+            return atimed
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - start
+        return timed
+
+
+def stored_bytes(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(
+            """
+            SELECT (SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) FROM checkpoints)
+                 + (SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes)
+            """
+        ).fetchone()[0]
+
+
+@contextmanager
+def sync_saver(kind, path):
+    if kind == 'sqlite':
+        with SqliteSaver.from_conn_string(path) as saver:
+            yield saver
+    else:
+        with BatchedSqliteSaver.from_conn_string(path, compress=kind == 'batched+zlib') as saver:
+            yield saver
+
+
+@asynccontextmanager
+async def async_saver(kind, path):
+    if kind == 'sqlite':
+        async with AsyncSqliteSaver.from_conn_string(path) as saver:
+            yield saver
+    else:
+        with BatchedSqliteSaver.from_conn_string(path, compress=kind == 'batched+zlib') as saver:
+            yield saver
+
+
+def flush(saver):
+    if isinstance(saver, BatchedSqliteSaver):
+        saver.flush()
+
+
+class Results:
+    def __init__(self, kind):
+        self.kind = kind
+        self.writes = []
+        self.reads = []
+        self.sizes = [0]
+
+    def add(self, write, read, size):
+        self.writes.append(write)
+        self.reads.append(read)
+        self.sizes.append(size)
+
+    def row(self, window):
+        growth = [b - a for a, b in zip(self.sizes, self.sizes[1:])]
+        middle = len(growth) // 2
+        return (f"{self.kind:<13} write {statistics.mean(self.writes) * 1000:7.2f} ms/turn  "
+                f"read p50 {statistics.median(self.reads) * 1000:6.2f} ms  "
+                f"growth first {statistics.mean(growth[:window]) / 1024:7.1f}  "
+                f"middle {statistics.mean(growth[middle:middle + window]) / 1024:7.1f}  "
+                f"last {statistics.mean(growth[-window:]) / 1024:7.1f} KiB/turn  "
+                f"total {self.sizes[-1] / 1024:8.1f} KiB")
+
+
+def bench_chatbot(kind, turns, reply_chars):
+    chatbot.model = FakeChatModel(reply_chars=reply_chars)
+    path = os.path.join(WORKDIR, f'chatbot-{kind}.db')
+    results = Results(kind)
+    with sync_saver(kind, path) as saver:
+        timings = Timings(saver)
+        graph = chatbot.workflow.compile(checkpointer=saver)
+        config = {"configurable": {"thread_id": "bench"}}
+        for turn in range(turns):
+            before = timings.seconds
+            graph.invoke({"messages": [HumanMessage(f"message {turn}: " + 'x' * 200)]}, config)
+            write = timings.seconds - before
+            start = time.perf_counter()
+            graph.get_state(config)
+            read = time.perf_counter() - start
+            flush(saver)
+            results.add(write, read, stored_bytes(path))
+    return results
+
+
+async def bench_interview(kind, turns, reply_chars, doc_chars):
+    research_assistant.llm = FakeChatModel(reply_chars=reply_chars)
+
+    async def search(query):
+        docs = [research_assistant.context_document(f'{query}/{i}', 'y' * doc_chars) for i in range(2)]
+        return docs, False
+
+    research_assistant.SEARCH_SOURCES = {'tavily': search}
+    analyst = research_assistant.Analyst(affiliation='Lab', name='Ana', role='Researcher', description='Checkpoints')
+    path = os.path.join(WORKDIR, f'interview-{kind}.db')
+    results = Results(kind)
+    async with async_saver(kind, path) as saver:
+        timings = Timings(saver)
+        graph = research_assistant.interview_builder.compile(checkpointer=saver, interrupt_after=['answer_question'])
+        config = {"configurable": {"thread_id": "bench"}}
+        payload = {"analyst": analyst, "messages": [HumanMessage("So you said you were writing an article?")],
+                   "max_num_turns": turns + 1}
+        for _ in range(turns):
+            before = timings.seconds
+            await graph.ainvoke(payload, config)
+            payload = None
+            write = timings.seconds - before
+            start = time.perf_counter()
+            await graph.aget_state(config)
+            read = time.perf_counter() - start
+            flush(saver)
+            results.add(write, read, stored_bytes(path))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--turns', type=int, default=40)
+    parser.add_argument('--reply-chars', type=int, default=800)
+    parser.add_argument('--doc-chars', type=int, default=4000)
+    parser.add_argument('--savers', nargs='+', default=['sqlite', 'batched', 'batched+zlib'])
+    args = parser.parse_args()
+    window = max(1, min(5, args.turns // 4))
+
+    print(f"chatbot, {args.turns} turns")
+    for kind in args.savers:
+        print(bench_chatbot(kind, args.turns, args.reply_chars).row(window))
+
+    print(f"research assistant interview, {args.turns} turns")
+    for kind in args.savers:
+        print(asyncio.run(bench_interview(kind, args.turns, args.reply_chars, args.doc_chars)).row(window))
+
+
+if __name__ == '__main__':
+    main()
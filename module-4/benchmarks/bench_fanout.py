@@ -0,0 +1,138 @@
+"""Throughput of a Send() fan-out against a fake rate-limited chat model.
+
+The fake provider answers after `--latency` seconds and rejects requests beyond
+`--provider-rps` per second with a 429, which the branch retries after a
+backoff, the way the OpenAI client does. Each row runs `--branches` branches,
+first as plain Sends and then through a FanoutScheduler with the given
+concurrency and a token bucket a little under the provider limit. Run from the
+module-4 directory:
+
+    python benchmarks/bench_fanout.py --branches 60 --provider-rps 20
+"""
+import argparse
+import asyncio
+import collections
+import operator
+import os
+import sys
+import threading
+import time
+from typing import Annotated
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.types import Send
+from langgraph.graph import END, START, StateGraph
+from typing_extensions import TypedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'studio'))
+from fanout import FanoutScheduler, TokenBucket  # noqa: E402
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class RateLimitedProvider:
+    """Accepts at most `rps` requests in any one-second window."""
+
+    def __init__(self, rps):
+        self.rps = rps
+        self.rejected = 0
+        self.accepted = 0
+        self._window = collections.deque()
+        self._lock = threading.Lock()
+
+    def admit(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._window and self._window[0] <= now - 1:
+                self._window.popleft()
+            if len(self._window) >= self.rps:
+                self.rejected += 1
+                raise RateLimitError('429 Too Many Requests')
+            self._window.append(now)
+            self.accepted += 1
+
+
+class FakeChatModel(BaseChatModel):
+    provider: RateLimitedProvider
+    latency: float = 0.2
+
+    @property
+    def _llm_type(self):
+        return 'fake-rate-limited'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.provider.admit()
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content='joke'))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.provider.admit()
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content='joke'))])
+
+
+class State(TypedDict):
+    subjects: list
+    jokes: Annotated[list, operator.add]
+
+
+def build_graph(model, scheduler=None, retries=6):
+    async def generate_joke(state):
+        for attempt in range(retries + 1):
+            try:
+                response = await model.ainvoke(f"Generate a joke about {state['subject']}")
+                return {"jokes": [response.content]}
+            except RateLimitError:
+                if attempt == retries:
+                    return {"jokes": []}
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    def continue_to_jokes(state):
+        payloads = [{"subject": s} for s in state["subjects"]]
+        if scheduler is None:
+            return [Send("generate_joke", payload) for payload in payloads]
+        return scheduler.sends("generate_joke", payloads)
+
+    builder = StateGraph(State)
+    builder.add_node("generate_joke", scheduler.limit(generate_joke) if scheduler else generate_joke)
+    builder.add_conditional_edges(START, continue_to_jokes, ["generate_joke"])
+    builder.add_edge("generate_joke", END)
+    return builder.compile()
+
+
+def run(graph, provider, branches):
+    start = time.perf_counter()
+    result = asyncio.run(graph.ainvoke({"subjects": [f"subject {i}" for i in range(branches)]}))
+    elapsed = time.perf_counter() - start
+    return elapsed, len(result["jokes"]), provider.rejected
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--branches', type=int, default=60)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--provider-rps', type=float, default=20)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    provider = RateLimitedProvider(args.provider_rps)
+    elapsed, done, rejected = run(build_graph(FakeChatModel(provider=provider, latency=args.latency)),
+                                  provider, args.branches)
+    print(f"unbounded        {done}/{args.branches} done in {elapsed:6.2f} s  "
+          f"({done / elapsed:5.1f}/s)  429s={rejected}")
+
+    for concurrency in args.concurrency:
+        provider = RateLimitedProvider(args.provider_rps)
+        bucket = TokenBucket(args.provider_rps * 0.9, max_bucket_size=1, check_every_n_seconds=0.01)
+        model = FakeChatModel(provider=provider, latency=args.latency, rate_limiter=bucket)
+        elapsed, done, rejected = run(build_graph(model, FanoutScheduler(concurrency)), provider, args.branches)
+        print(f"concurrency={concurrency:<3}  {done}/{args.branches} done in {elapsed:6.2f} s  "
+              f"({done / elapsed:5.1f}/s)  429s={rejected}")
+
+
+if __name__ == '__main__':
+    main()
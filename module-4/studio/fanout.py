@@ -0,0 +1,216 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_core.runnables import Runnable, RunnableLambda
+from langgraph.types import Send
+
+# Send() branches of one fan-out node allowed to run at once
+MAX_CONCURRENCY = 4
+# Requests per second per provider, overridden by e.g. TAVILY_RATE_LIMIT.
+# Callers wait for a token instead of running into 429s.
+DEFAULT_PROVIDER_RATES = {"llm": 5.0, "tavily": 2.0, "wikipedia": 5.0}
+PROVIDER_RATES = {
+    provider: float(os.environ.get(f"{provider.upper()}_RATE_LIMIT", rate))
+    for provider, rate in DEFAULT_PROVIDER_RATES.items()
+}
+
+
+class TokenBucket(BaseRateLimiter):
+    """Token bucket rate limiter, starting full, that can also tell whether a token is free."""
+
+    def __init__(self, requests_per_second, max_bucket_size=1.0, check_every_n_seconds=0.05):
+        self.requests_per_second = requests_per_second
+        self.max_bucket_size = max_bucket_size
+        self.check_every_n_seconds = check_every_n_seconds
+        self._tokens = max_bucket_size
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._last) * self.requests_per_second, self.max_bucket_size)
+        self._last = now
+
+    def _consume(self):
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def has_token(self):
+        """Whether a request could start now without waiting, checked without taking the token."""
+        with self._lock:
+            self._refill()
+            return self._tokens >= 1
+
+    def acquire(self, *, blocking=True):
+        if not blocking:
+            return self._consume()
+        while not self._consume():
+            time.sleep(self.check_every_n_seconds)
+        return True
+
+    async def aacquire(self, *, blocking=True):
+        if not blocking:
+            return self._consume()
+        while not self._consume():
+            await asyncio.sleep(self.check_every_n_seconds)
+        return True
+
+
+rate_limiters = {
+    provider: TokenBucket(rate, max_bucket_size=max(1.0, rate))
+    for provider, rate in PROVIDER_RATES.items()
+}
+
+
+class _Waiter:
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+class PriorityLimiter:
+    """Semaphore admitting waiters by priority (lowest first), then in arrival order.
+
+    Usable from threads and from asyncio tasks at the same time, since LangGraph
+    runs sync nodes on worker threads even when the graph is awaited.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, priority, wake):
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return None
+            waiter = _Waiter(wake)
+            heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+            return waiter
+
+    def acquire(self, priority=0):
+        event = threading.Event()
+        if self._try_acquire(priority, event.set) is not None:
+            event.wait()
+
+    async def aacquire(self, priority=0):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._try_acquire(priority, wake)
+        if waiter is None:
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.granted
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if not waiter.cancelled:
+                    # The slot passes straight to the waiter, so `active` is unchanged
+                    waiter.granted = True
+                    break
+            else:
+                self.active -= 1
+                return
+        waiter.wake()
+
+    @contextmanager
+    def slot(self, priority=0):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, priority=0):
+        await self.aacquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class FanoutScheduler:
+    """Runs the Send() branches of a fan-out at most `max_concurrency` at a time.
+
+    Branches are tagged with a priority by sends() and wait for a slot in
+    limit(), so a large fan-out queues instead of starting every branch, and
+    every provider call behind it, at once.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY):
+        self.slots = PriorityLimiter(max_concurrency)
+
+    @staticmethod
+    def sends(node, states, priority=None):
+        """One Send per state, tagged with a priority (lower runs first, default: list order)."""
+        states = list(states)
+        priorities = [priority(state) for state in states] if priority else range(len(states))
+        ordered = sorted(zip(priorities, states), key=lambda item: item[0])
+        return [Send(node, {**state, "priority": order}) for order, state in ordered]
+
+    def limit(self, node, name=None):
+        """Wrap a node function or compiled graph so each call holds a slot while it runs.
+
+        A wrapped compiled graph runs as one opaque node, hidden from Studio's
+        graph view and get_state(subgraphs=True); limit its nodes instead to keep
+        it a subgraph.
+        """
+        if isinstance(node, Runnable):
+            def call(state, config):
+                with self.slots.slot(state.get("priority", 0)):
+                    return node.invoke(state, config)
+
+            async def acall(state, config):
+                async with self.slots.aslot(state.get("priority", 0)):
+                    return await node.ainvoke(state, config)
+
+            return RunnableLambda(call, afunc=acall, name=name or node.get_name())
+
+        if inspect.iscoroutinefunction(node):
+            async def acall(state):
+                async with self.slots.aslot(state.get("priority", 0)):
+                    return await node(state)
+
+            return RunnableLambda(acall, name=name or node.__name__)
+
+        def call(state):
+            with self.slots.slot(state.get("priority", 0)):
+                return node(state)
+
+        # Awaited graphs run sync nodes on the default executor; a thread blocked waiting for a slot
+        # there could starve the async nodes holding the slots, so wait on the loop and only then
+        # take a thread
+        async def acall(state):
+            async with self.slots.aslot(state.get("priority", 0)):
+                return await asyncio.to_thread(node, state)
+
+        return RunnableLambda(call, afunc=acall, name=name or node.__name__)
@@ -6,16 +6,18 @@ from pydantic import BaseModel
 
 from langchain_openai import ChatOpenAI 
 
-from langgraph.constants import Send
 from langgraph.graph import END, StateGraph, START
 
+from fanout import FanoutScheduler, rate_limiters
+from llm_cache import shared_llm_cache
+
 # Prompts we will use
 subjects_prompt = """Generate a list of 3 sub-topics that are all related to this overall topic: {topic}."""
 joke_prompt = """Generate a joke about {subject}"""
 best_joke_prompt = """Below are a bunch of jokes about {topic}. Select the best one! Return the ID of the best one, starting 0 as the ID for the first joke. Jokes: \n\n  {jokes}"""
 
 # LLM
-model = ChatOpenAI(model="gpt-4o", temperature=0) 
+model = ChatOpenAI(model="gpt-4o", temperature=0, cache=shared_llm_cache(), rate_limiter=rate_limiters["llm"])
 
 # Define the state
 class Subjects(BaseModel):
@@ -37,6 +39,7 @@ def generate_topics(state: OverallState):
 
 class JokeState(TypedDict):
     subject: str
+    priority: int
 
 class Joke(BaseModel):
     joke: str
@@ -52,13 +55,15 @@ def best_joke(state: OverallState):
     response = model.with_structured_output(BestJoke).invoke(prompt)
     return {"best_selected_joke": state["jokes"][response.id]}
 
+joke_scheduler = FanoutScheduler()
+
 def continue_to_jokes(state: OverallState):
-    return [Send("generate_joke", {"subject": s}) for s in state["subjects"]]
+    return joke_scheduler.sends("generate_joke", [{"subject": s} for s in state["subjects"]])
 
 # Construct the graph: here we put everything together to construct our graph
 graph_builder = StateGraph(OverallState)
 graph_builder.add_node("generate_topics", generate_topics)
-graph_builder.add_node("generate_joke", generate_joke)
+graph_builder.add_node("generate_joke", joke_scheduler.limit(generate_joke))
 graph_builder.add_node("best_joke", best_joke)
 graph_builder.add_edge(START, "generate_topics")
 graph_builder.add_conditional_edges("generate_topics", continue_to_jokes, ["generate_joke"])
@@ -12,12 +12,17 @@ from langchain_openai import ChatOpenAI
 
 from langgraph.graph import StateGraph, START, END
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0) 
+from fanout import rate_limiters
+from llm_cache import shared_llm_cache
+from retrieval_cache import add_counts, cache_stats, cached_search, to_documents, to_records
+
+llm = ChatOpenAI(model="gpt-4o", temperature=0, cache=shared_llm_cache(), rate_limiter=rate_limiters["llm"])
 
 class State(TypedDict):
     question: str
     answer: str
     context: Annotated[list, operator.add]
+    cache_stats: Annotated[dict, add_counts]
 
 def search_web(state):
     
@@ -25,7 +30,7 @@ def search_web(state):
 
     # Search
     tavily_search = TavilySearchResults(max_results=3)
-    search_docs = tavily_search.invoke(state['question'])
+    search_docs, hit = cached_search("tavily", state['question'], tavily_search.invoke, rate_limiters["tavily"])
 
      # Format
     formatted_search_docs = "\n\n---\n\n".join(
@@ -35,15 +40,17 @@ def search_web(state):
         ]
     )
 
-    return {"context": [formatted_search_docs]} 
+    return {"context": [formatted_search_docs], "cache_stats": cache_stats("tavily", hit)}
 
 def search_wikipedia(state):
     
     """ Retrieve docs from wikipedia """
 
     # Search
-    search_docs = WikipediaLoader(query=state['question'], 
-                                  load_max_docs=2).load()
+    records, hit = cached_search("wikipedia", state['question'],
+                                 lambda query: to_records(WikipediaLoader(query=query, load_max_docs=2).load()),
+                                 rate_limiters["wikipedia"])
+    search_docs = to_documents(records)
 
      # Format
     formatted_search_docs = "\n\n---\n\n".join(
@@ -53,7 +60,7 @@ def search_wikipedia(state):
         ]
     )
 
-    return {"context": [formatted_search_docs]} 
+    return {"context": [formatted_search_docs], "cache_stats": cache_stats("wikipedia", hit)}
 
 def generate_answer(state):
     
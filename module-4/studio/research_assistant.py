@@ -1,19 +1,28 @@
-import operator
+import asyncio
+import logging
 from pydantic import BaseModel, Field
 from typing import Annotated, List
 from typing_extensions import TypedDict
 
 from langchain_community.document_loaders import WikipediaLoader
 from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, get_buffer_string
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 
-from langgraph.constants import Send
-from langgraph.graph import END, MessagesState, START, StateGraph
+from langgraph.graph import END, START, StateGraph
+
+from checkpointer import DeltaMessagesState, delta_channel, shared_checkpointer
+from fanout import FanoutScheduler, rate_limiters
+from llm_cache import shared_llm_cache
+from retrieval_cache import acached_search, add_counts, cache_stats, to_documents, to_records
+from tokens import count_tokens, truncate_tokens
+from turns import add_turns, loop_done, turn, turn_count
+
+logger = logging.getLogger(__name__)
 
 ### LLM
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0) 
+llm = ChatOpenAI(model="gpt-4o", temperature=0, cache=shared_llm_cache(), rate_limiter=rate_limiters["llm"])
 
 ### Schema 
 
@@ -45,12 +54,54 @@ class GenerateAnalystsState(TypedDict):
     human_analyst_feedback: str # Human feedback
     analysts: List[Analyst] # Analyst asking questions
 
-class InterviewState(MessagesState):
+# Retrieved documents an interview keeps, most recently retrieved last; older ones are dropped
+MAX_CONTEXT_DOCUMENTS = 12
+# Tokens of context in each expert answer prompt, and in the section writer prompt
+ANSWER_CONTEXT_TOKENS = 3000
+SECTION_CONTEXT_TOKENS = 6000
+# Most recent messages sent to the LLM each turn, besides the opening message
+MESSAGE_WINDOW = 6
+
+def merge_context(left, right):
+
+    """ Reducer for retrieved documents: one entry per URL or source, bounded in number """
+
+    merged = {doc["key"]: doc for doc in left or []}
+    for doc in right or []:
+        # A document retrieved again moves to the end, as the most recent
+        merged.pop(doc["key"], None)
+        merged[doc["key"]] = doc
+    return list(merged.values())[-MAX_CONTEXT_DOCUMENTS:]
+
+def format_context(documents, max_tokens):
+
+    """ Most recently retrieved documents that fit in max_tokens, in retrieval order """
+
+    selected = []
+    for doc in reversed(documents):
+        if doc["tokens"] <= max_tokens:
+            max_tokens -= doc["tokens"]
+            selected.append(doc["text"])
+        elif not selected:
+            # The newest document alone is over budget: keep its beginning
+            selected.append(truncate_tokens(doc["text"], max_tokens, llm.model_name))
+            break
+    return "\n\n---\n\n".join(reversed(selected))
+
+def recent_messages(messages):
+    if len(messages) <= MESSAGE_WINDOW + 1:
+        return messages
+    return messages[:1] + messages[-MESSAGE_WINDOW:]
+
+class InterviewState(DeltaMessagesState):
     max_num_turns: int # Number turns of conversation
-    context: Annotated[list, operator.add] # Source docs
+    context: Annotated[list, merge_context] # Source docs, deduplicated by URL or source
+    search_query: str # Search query for the current turn
+    cache_stats: Annotated[dict, add_counts] # Retrieval cache hits and misses
     analyst: Analyst # Analyst asking questions
-    interview: str # Interview transcript
+    turns: Annotated[dict, add_turns] # Expert answers so far, and whether the analyst ended the interview
     sections: list # Final key we duplicate in outer state for Send() API
+    priority: int # Order in which queued interviews start, lowest first
 
 class SearchQuery(BaseModel):
     search_query: str = Field(None, description="Search query for retrieval.")
@@ -60,7 +111,10 @@ class ResearchGraphState(TypedDict):
     max_analysts: int # Number of analysts
     human_analyst_feedback: str # Human feedback
     analysts: List[Analyst] # Analyst asking questions
-    sections: Annotated[list, operator.add] # Send() API key
+    sections: Annotated[list, delta_channel()] # Send() API key
+    cache_stats: Annotated[dict, add_counts] # Retrieval cache hits and misses across interviews
+    formatted_sections: str # All sections, joined once for the report writer
+    section_digests: str # Compact digest of each section for the introduction and conclusion
     introduction: str # Introduction for the final report
     content: str # Content for the final report
     conclusion: str # Conclusion for the final report
@@ -138,7 +192,7 @@ def generate_question(state: InterviewState):
 
     # Generate question 
     system_message = question_instructions.format(goals=analyst.persona)
-    question = llm.invoke([SystemMessage(content=system_message)]+messages)
+    question = llm.invoke([SystemMessage(content=system_message)]+recent_messages(messages))
         
     # Write messages to state
     return {"messages": [question]}
@@ -154,51 +208,108 @@ Pay particular attention to the final question posed by the analyst.
 
 Convert this final question into a well-structured web search query""")
 
-def search_web(state: InterviewState):
-    
-    """ Retrieve docs from web search """
+def write_search_query(state: InterviewState):
 
-    # Search
-    tavily_search = TavilySearchResults(max_results=3)
+    """ Write one search query per turn, shared by all retrievers """
 
-    # Search query
     structured_llm = llm.with_structured_output(SearchQuery)
-    search_query = structured_llm.invoke([search_instructions]+state['messages'])
-    
-    # Search
-    search_docs = tavily_search.invoke(search_query.search_query)
-
-     # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document href="{doc["url"]}"/>\n{doc["content"]}\n</Document>'
-            for doc in search_docs
-        ]
-    )
+    search_query = structured_llm.invoke([search_instructions]+recent_messages(state['messages']))
+    return {"search_query": search_query.search_query}
 
-    return {"context": [formatted_search_docs]} 
+def context_document(key, text):
+    return {"key": key, "text": text, "tokens": count_tokens(text, llm.model_name)}
 
-def search_wikipedia(state: InterviewState):
-    
-    """ Retrieve docs from wikipedia """
+async def search_web(query: str):
 
-    # Search query
-    structured_llm = llm.with_structured_output(SearchQuery)
-    search_query = structured_llm.invoke([search_instructions]+state['messages'])
-    
-    # Search
-    search_docs = WikipediaLoader(query=search_query.search_query, 
-                                  load_max_docs=2).load()
+    """ Retrieve docs from web search, returning (formatted docs, cache hit) """
+
+    tavily_search = TavilySearchResults(max_results=3)
+    search_docs, hit = await acached_search("tavily", query, tavily_search.ainvoke, rate_limiters["tavily"])
+
+    # Format
+    return [
+        context_document(doc["url"], f'<Document href="{doc["url"]}"/>\n{doc["content"]}\n</Document>')
+        for doc in search_docs
+    ], hit
+
+async def load_wikipedia(query: str):
+    return to_records(await WikipediaLoader(query=query, load_max_docs=2).aload())
+
+async def search_wikipedia(query: str):
 
-     # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
+    """ Retrieve docs from wikipedia, returning (formatted docs, cache hit) """
+
+    records, hit = await acached_search("wikipedia", query, load_wikipedia, rate_limiters["wikipedia"])
+    search_docs = to_documents(records)
+
+    # Format
+    return [
+        context_document(
+            doc.metadata["source"],
             f'<Document source="{doc.metadata["source"]}" page="{doc.metadata.get("page", "")}"/>\n{doc.page_content}\n</Document>'
-            for doc in search_docs
-        ]
+        )
+        for doc in search_docs
+    ], hit
+
+# Retrievers run concurrently for each turn; a source that misses its timeout (seconds) is left out of the context
+SEARCH_SOURCES = {
+    "tavily": search_web,
+    "wikipedia": search_wikipedia,
+}
+SEARCH_TIMEOUTS = {"tavily": 10.0, "wikipedia": 8.0}
+# Re-issue a request still outstanding after this many seconds and keep whichever answers first.
+# Off for Tavily, where every request is billed.
+HEDGE_AFTER = {"tavily": None, "wikipedia": 2.0}
+
+async def hedged(retriever, query, hedge_after=None, rate_limiter=None):
+
+    """ Run a retriever, starting a duplicate request if the first is slow """
+
+    # The duplicate is a second provider request and takes its own rate limiter token, so it is
+    # only started while a token is free. Cancelling the slower request stops waiting for it, but
+    # a blocking call underneath (WikipediaLoader runs in a worker thread) still runs to the end.
+    first = asyncio.ensure_future(retriever(query))
+    tasks = {first}
+    try:
+        if hedge_after is not None:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done and (rate_limiter is None or rate_limiter.has_token()):
+                tasks.add(asyncio.ensure_future(retriever(query)))
+        # Take the first request that succeeds
+        while True:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+            if not tasks:
+                return done.pop().result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def search(state: InterviewState):
+
+    """ Retrieve docs from all sources in parallel, dropping slow or failing ones """
+
+    query = state["search_query"]
+    names = list(SEARCH_SOURCES)
+    results = await asyncio.gather(
+        *[asyncio.wait_for(hedged(SEARCH_SOURCES[name], query, HEDGE_AFTER.get(name), rate_limiters.get(name)),
+                           SEARCH_TIMEOUTS.get(name))
+          for name in names],
+        return_exceptions=True,
     )
 
-    return {"context": [formatted_search_docs]} 
+    context = []
+    stats = {}
+    for name, result in zip(names, results):
+        if isinstance(result, BaseException):
+            logger.warning("Dropping %s search results for %r: %r", name, query, result)
+        else:
+            docs, hit = result
+            context.extend(docs)
+            stats = add_counts(stats, cache_stats(name, hit))
+    return {"context": context, "cache_stats": stats}
 
 # Generate expert answer
 answer_instructions = """You are an expert being interviewed by an analyst.
@@ -236,55 +347,31 @@ def generate_answer(state: InterviewState):
     # Get state
     analyst = state["analyst"]
     messages = state["messages"]
-    context = state["context"]
+    context = format_context(state["context"], ANSWER_CONTEXT_TOKENS)
 
     # Answer question
     system_message = answer_instructions.format(goals=analyst.persona, context=context)
-    answer = llm.invoke([SystemMessage(content=system_message)]+messages)
+    answer = llm.invoke([SystemMessage(content=system_message)]+recent_messages(messages))
             
     # Name the message as coming from the expert
     answer.name = "expert"
-    
-    # Append it to state
-    return {"messages": [answer]}
 
-def save_interview(state: InterviewState):
-    
-    """ Save interviews """
-
-    # Get messages
-    messages = state["messages"]
+    # The analyst closes the interview with this phrase
+    done = "Thank you so much for your help" in messages[-1].content
     
-    # Convert interview to a string
-    interview = get_buffer_string(messages)
-    
-    # Save to interviews key
-    return {"interview": interview}
+    # Append it to state
+    return {"messages": [answer], "turns": turn(done=done)}
 
-def route_messages(state: InterviewState, 
-                   name: str = "expert"):
+def route_messages(state: InterviewState):
 
     """ Route between question and answer """
     
-    # Get messages
-    messages = state["messages"]
     max_num_turns = state.get('max_num_turns',2)
 
-    # Check the number of expert answers 
-    num_responses = len(
-        [m for m in messages if isinstance(m, AIMessage) and m.name == name]
-    )
-
-    # End if expert has answered more than the max turns
-    if num_responses >= max_num_turns:
-        return 'save_interview'
-
-    # This router is run after each question - answer pair 
-    # Get the last question asked to check if it signals the end of discussion
-    last_question = messages[-2]
-    
-    if "Thank you so much for your help" in last_question.content:
-        return 'save_interview'
+    # End if expert has answered the max turns, or the last question ended the interview.
+    # generate_answer keeps both in the turns counter, so this does not depend on the transcript length.
+    if turn_count(state) >= max_num_turns or loop_done(state):
+        return 'write_section'
     return "ask_question"
 
 # Write a summary (section of the final report) of the interview
@@ -344,40 +431,42 @@ def write_section(state: InterviewState):
     """ Node to write a section """
 
     # Get state
-    interview = state["interview"]
-    context = state["context"]
+    context = format_context(state["context"], SECTION_CONTEXT_TOKENS)
     analyst = state["analyst"]
    
-    # Write section using either the gathered source docs from interview (context) or the interview itself (interview)
+    # Write section from the source docs gathered during the interview
     system_message = section_writer_instructions.format(focus=analyst.description)
     section = llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content=f"Use this source to write your section: {context}")]) 
                 
     # Append it to state
     return {"sections": [section.content]}
 
-# Add nodes and edges 
+interview_scheduler = FanoutScheduler()
+
+# Add nodes and edges. Each step holds a scheduler slot while it runs, so queued interviews
+# wait between steps, earliest first; limiting the steps rather than the compiled interview
+# keeps it a subgraph that Studio and get_state(subgraphs=True) can look into.
 interview_builder = StateGraph(InterviewState)
-interview_builder.add_node("ask_question", generate_question)
-interview_builder.add_node("search_web", search_web)
-interview_builder.add_node("search_wikipedia", search_wikipedia)
-interview_builder.add_node("answer_question", generate_answer)
-interview_builder.add_node("save_interview", save_interview)
-interview_builder.add_node("write_section", write_section)
+interview_builder.add_node("ask_question", interview_scheduler.limit(generate_question))
+interview_builder.add_node("write_search_query", interview_scheduler.limit(write_search_query))
+interview_builder.add_node("search", interview_scheduler.limit(search))
+interview_builder.add_node("answer_question", interview_scheduler.limit(generate_answer))
+interview_builder.add_node("write_section", interview_scheduler.limit(write_section))
 
 # Flow
 interview_builder.add_edge(START, "ask_question")
-interview_builder.add_edge("ask_question", "search_web")
-interview_builder.add_edge("ask_question", "search_wikipedia")
-interview_builder.add_edge("search_web", "answer_question")
-interview_builder.add_edge("search_wikipedia", "answer_question")
-interview_builder.add_conditional_edges("answer_question", route_messages,['ask_question','save_interview'])
-interview_builder.add_edge("save_interview", "write_section")
+interview_builder.add_edge("ask_question", "write_search_query")
+interview_builder.add_edge("write_search_query", "search")
+interview_builder.add_edge("search", "answer_question")
+interview_builder.add_conditional_edges("answer_question", route_messages,['ask_question','write_section'])
 interview_builder.add_edge("write_section", END)
 
 def initiate_all_interviews(state: ResearchGraphState):
 
     """ Conditional edge to initiate all interviews via Send() API or return to create_analysts """    
 
+    # Interview steps beyond the scheduler's concurrency limit queue until a slot frees up
+
     # Check if human feedback
     human_analyst_feedback=state.get('human_analyst_feedback','approve')
     if human_analyst_feedback.lower() != 'approve':
@@ -387,11 +476,11 @@ def initiate_all_interviews(state: ResearchGraphState):
     # Otherwise kick off interviews in parallel via Send() API
     else:
         topic = state["topic"]
-        return [Send("conduct_interview", {"analyst": analyst,
-                                           "messages": [HumanMessage(
-                                               content=f"So you said you were writing an article on {topic}?"
-                                           )
-                                                       ]}) for analyst in state["analysts"]]
+        return interview_scheduler.sends("conduct_interview", [{"analyst": analyst,
+                                                                "messages": [HumanMessage(
+                                                                    content=f"So you said you were writing an article on {topic}?"
+                                                                )
+                                                                            ]} for analyst in state["analysts"]])
 
 # Write a report based on the interviews
 report_writer_instructions = """You are a technical writer creating a report on this overall topic: 
@@ -428,26 +517,40 @@ Here are the memos from your analysts to build your report from:
 
 {context}"""
 
-def write_report(state: ResearchGraphState):
+# Token budget for all section digests together, split evenly between sections
+DIGEST_TOKEN_BUDGET = 1500
+# Tokens each digest gets however many sections there are
+MIN_DIGEST_TOKENS = 60
 
-    """ Node to write the final report body """
+def section_digest(section, max_tokens):
+
+    """ Title and opening of a section's summary, without its sources """
+
+    text = section.split("\n### Sources", 1)[0].replace("### Summary\n", "")
+    return truncate_tokens(text.strip(), max_tokens, llm.model_name)
+
+def prepare_sections(state: ResearchGraphState):
+
+    """ Format the sections once for the report writer, and digest them for the introduction and conclusion """
 
-    # Full set of sections
     sections = state["sections"]
-    topic = state["topic"]
+    per_section = max(MIN_DIGEST_TOKENS, DIGEST_TOKEN_BUDGET // max(1, len(sections)))
+    return {"formatted_sections": "\n\n".join(sections),
+            "section_digests": "\n\n".join(section_digest(section, per_section) for section in sections)}
 
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-    
-    # Summarize the sections into a final report
-    system_message = report_writer_instructions.format(topic=topic, context=formatted_str_sections)    
+def write_report(state: ResearchGraphState):
+
+    """ Node to write the final report body """
+
+    # Summarize the full sections into a final report
+    system_message = report_writer_instructions.format(topic=state["topic"], context=state["formatted_sections"])
     report = llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content=f"Write a report based upon these memos.")]) 
     return {"content": report.content}
 
 # Write the introduction or conclusion
 intro_conclusion_instructions = """You are a technical writer finishing a report on {topic}
 
-You will be given all of the sections of the report.
+You will be given a digest of each section of the report.
 
 You job is to write a crisp and compelling introduction or conclusion section.
 
@@ -465,22 +568,14 @@ For your introduction, use ## Introduction as the section header.
 
 For your conclusion, use ## Conclusion as the section header.
 
-Here are the sections to reflect on for writing: {formatted_str_sections}"""
+Here are the section digests to reflect on for writing: {section_digests}"""
 
 def write_introduction(state: ResearchGraphState):
 
     """ Node to write the introduction """
 
-    # Full set of sections
-    sections = state["sections"]
-    topic = state["topic"]
-
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-    
-    # Summarize the sections into a final report
-    
-    instructions = intro_conclusion_instructions.format(topic=topic, formatted_str_sections=formatted_str_sections)    
+    # The digests are enough to preview or recap the sections
+    instructions = intro_conclusion_instructions.format(topic=state["topic"], section_digests=state["section_digests"])
     intro = llm.invoke([instructions]+[HumanMessage(content=f"Write the report introduction")]) 
     return {"introduction": intro.content}
 
@@ -488,45 +583,115 @@ def write_conclusion(state: ResearchGraphState):
 
     """ Node to write the conclusion """
 
-    # Full set of sections
-    sections = state["sections"]
-    topic = state["topic"]
-
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-    
-    # Summarize the sections into a final report
-    
-    instructions = intro_conclusion_instructions.format(topic=topic, formatted_str_sections=formatted_str_sections)    
+    # The digests are enough to preview or recap the sections
+    instructions = intro_conclusion_instructions.format(topic=state["topic"], section_digests=state["section_digests"])
     conclusion = llm.invoke([instructions]+[HumanMessage(content=f"Write the report conclusion")]) 
     return {"conclusion": conclusion.content}
 
+# Report parts in reading order, keyed by the node that writes them
+REPORT_PARTS = {"write_introduction": "introduction", "write_report": "content", "write_conclusion": "conclusion"}
+REPORT_SEPARATOR = "\n\n---\n\n"
+SOURCES_MARKER = "\n## Sources\n"
+
+class ReportAssembler:
+
+    """ Assemble the final report from its parts while their text is still arriving
+
+    The report reads introduction, content, conclusion, then the sources split off
+    the end of the content. Text is released as soon as everything before it in the
+    report is final, so the introduction shows from its first token while the body
+    and conclusion are held back until the parts before them are complete.
+    """
+
+    def __init__(self):
+        self.parts = {part: "" for part in REPORT_PARTS.values()}
+        self.done = set()
+        self.emitted = 0
+
+    def feed(self, part, text):
+        """ Add streamed text to a part and return the report text that became ready """
+        self.parts[part] += text
+        return self._release()
+
+    def finish(self, part, text=None):
+        """ Mark a part complete, optionally replacing it with its full text """
+        if text is not None:
+            self.parts[part] = text
+        self.done.add(part)
+        return self._release()
+
+    def report(self):
+        intro = self.parts["introduction"]
+        if "introduction" not in self.done:
+            return intro
+
+        content = self.parts["content"]
+        # Drop the "## Insights" title, but wait until we know the content starts with it
+        if "## Insights".startswith(content) and "content" not in self.done:
+            return intro
+        content = content.removeprefix("## Insights")
+        body, marker, sources = content.partition(SOURCES_MARKER)
+        if "content" not in self.done:
+            # Hold back a tail that could be the start of the sources marker
+            stable = body if marker else body[:max(0, len(body) - len(SOURCES_MARKER) + 1)]
+            return intro + REPORT_SEPARATOR + stable
+
+        report = intro + REPORT_SEPARATOR + body + REPORT_SEPARATOR + self.parts["conclusion"]
+        if "conclusion" not in self.done:
+            return report
+        if marker:
+            report += "\n\n## Sources\n" + sources
+        return report
+
+    def _release(self):
+        report = self.report()
+        ready = report[self.emitted:]
+        self.emitted = len(report)
+        return ready
+
+async def stream_report(graph, input, config=None):
+
+    """ Yield the final report text as it is generated
+
+    Runs the graph with LangGraph's "messages" stream mode, which streams the LLM
+    tokens of each node, and feeds the report-writing nodes' tokens through a
+    ReportAssembler. Time to first output is the first-token latency of the
+    introduction rather than the time to write all three parts.
+    """
+
+    assembler = ReportAssembler()
+    async for mode, chunk in graph.astream(input, config, stream_mode=["messages", "updates"]):
+        ready = ""
+        if mode == "messages":
+            message, metadata = chunk
+            part = REPORT_PARTS.get(metadata.get("langgraph_node"))
+            if part and isinstance(message.content, str):
+                ready = assembler.feed(part, message.content)
+        else:
+            for node, update in chunk.items():
+                if node in REPORT_PARTS:
+                    # The full text covers tokens that were not streamed, e.g. on a cache hit
+                    part = REPORT_PARTS[node]
+                    ready += assembler.finish(part, update[part])
+        if ready:
+            yield ready
+
 def finalize_report(state: ResearchGraphState):
 
     """ The is the "reduce" step where we gather all the sections, combine them, and reflect on them to write the intro/conclusion """
 
-    # Save full final report
-    content = state["content"]
-    if content.startswith("## Insights"):
-        content = content.strip("## Insights")
-    if "## Sources" in content:
-        try:
-            content, sources = content.split("\n## Sources\n")
-        except:
-            sources = None
-    else:
-        sources = None
-
-    final_report = state["introduction"] + "\n\n---\n\n" + content + "\n\n---\n\n" + state["conclusion"]
-    if sources is not None:
-        final_report += "\n\n## Sources\n" + sources
-    return {"final_report": final_report}
+    # Save full final report, assembled the same way stream_report() shows it
+    assembler = ReportAssembler()
+    for part in REPORT_PARTS.values():
+        assembler.finish(part, state[part])
+    return {"final_report": assembler.report()}
 
 # Add nodes and edges 
 builder = StateGraph(ResearchGraphState)
 builder.add_node("create_analysts", create_analysts)
 builder.add_node("human_feedback", human_feedback)
 builder.add_node("conduct_interview", interview_builder.compile())
+builder.add_node("prepare_sections", prepare_sections)
 builder.add_node("write_report",write_report)
 builder.add_node("write_introduction",write_introduction)
 builder.add_node("write_conclusion",write_conclusion)
@@ -536,11 +701,12 @@ builder.add_node("finalize_report",finalize_report)
 builder.add_edge(START, "create_analysts")
 builder.add_edge("create_analysts", "human_feedback")
 builder.add_conditional_edges("human_feedback", initiate_all_interviews, ["create_analysts", "conduct_interview"])
-builder.add_edge("conduct_interview", "write_report")
-builder.add_edge("conduct_interview", "write_introduction")
-builder.add_edge("conduct_interview", "write_conclusion")
+builder.add_edge("conduct_interview", "prepare_sections")
+builder.add_edge("prepare_sections", "write_report")
+builder.add_edge("prepare_sections", "write_introduction")
+builder.add_edge("prepare_sections", "write_conclusion")
 builder.add_edge(["write_conclusion", "write_report", "write_introduction"], "finalize_report")
 builder.add_edge("finalize_report", END)
 
 # Compile
-graph = builder.compile(interrupt_before=['human_feedback'])
\ No newline at end of file
+graph = builder.compile(interrupt_before=['human_feedback'], checkpointer=shared_checkpointer())
\ No newline at end of file
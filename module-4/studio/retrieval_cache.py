@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from langchain_core.documents import Document
+
+# Cached search results older than this are fetched again (seconds)
+DEFAULT_TTL = 7 * 24 * 3600
+# Compressed documents kept before the least recently used queries are evicted (bytes)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    digest TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    key TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    query TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS queries_used_at ON queries (used_at);
+"""
+
+
+def normalize_query(query):
+    return " ".join(query.casefold().split())
+
+
+class RetrievalCache:
+    """Search results on disk, shared by every graph and process using the same file.
+
+    Results are stored once per distinct content (zlib-compressed JSON, addressed
+    by its hash) and looked up by source and normalized query. Sources should be
+    named so that different retrieval settings do not share entries.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    @staticmethod
+    def key(source, query):
+        return hashlib.sha256(f"{source}\0{normalize_query(query)}".encode()).hexdigest()
+
+    def get(self, source, query):
+        key = self.key(source, query)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                """
+                SELECT q.stored_at, d.data FROM queries q JOIN documents d ON d.digest = q.digest
+                WHERE q.key = ?
+                """,
+                (key,)
+            ).fetchone()
+            if row is None or row[0] + self.ttl < now:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE queries SET used_at = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return json.loads(zlib.decompress(row[1]))
+
+    def put(self, source, query, docs):
+        raw = json.dumps(docs, sort_keys=True, default=str).encode()
+        digest = hashlib.blake2b(raw, digest_size=20).hexdigest()
+        data = zlib.compress(raw, 6)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO documents (digest, data, size) VALUES (?, ?, ?)',
+                (digest, data, len(data))
+            )
+            self._conn.execute(
+                """
+                INSERT INTO queries (key, source, query, digest, stored_at, used_at) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    digest = excluded.digest, stored_at = excluded.stored_at, used_at = excluded.used_at
+                """,
+                (self.key(source, query), source, normalize_query(query), digest, now, now)
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM documents').fetchone()[0]
+        while total > self.max_bytes:
+            oldest = self._conn.execute('SELECT key FROM queries ORDER BY used_at LIMIT 32').fetchall()
+            if not oldest:
+                break
+            self._conn.executemany('DELETE FROM queries WHERE key = ?', oldest)
+            self._conn.execute('DELETE FROM documents WHERE digest NOT IN (SELECT digest FROM queries)')
+            total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM documents').fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                'SELECT (SELECT COUNT(*) FROM queries), (SELECT COALESCE(SUM(size), 0) FROM documents)'
+            ).fetchone()
+            return {'entries': entries, 'bytes': size, 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            path = os.environ.get('RETRIEVAL_CACHE_DB',
+                                  os.path.join(os.path.expanduser('~'), '.cache', 'retrieval_cache.db'))
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            _cache = RetrievalCache(
+                path,
+                ttl=float(os.environ.get('RETRIEVAL_CACHE_TTL', DEFAULT_TTL)),
+                max_bytes=int(os.environ.get('RETRIEVAL_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+            )
+        return _cache
+
+
+class SearchError(Exception):
+    """A search tool returned something other than results, e.g. Tavily's repr of an HTTP error."""
+
+
+def cacheable(source, query, docs):
+    """Whether docs should be cached: a non-empty list of result dicts. Raises SearchError if they aren't results."""
+    if not isinstance(docs, list) or not all(isinstance(doc, dict) for doc in docs):
+        raise SearchError(f"{source} search for {query!r} failed: {docs!r}"[:500])
+    # An empty result may be a passing outage; look again next time
+    return bool(docs)
+
+
+def cached_search(source, query, fetch, rate_limiter=None):
+    """Return (docs, hit), calling fetch(query) only on a cache miss, after taking a rate limiter token."""
+    cache = get_retrieval_cache()
+    docs = cache.get(source, query)
+    if docs is not None:
+        return docs, True
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    docs = fetch(query)
+    if cacheable(source, query, docs):
+        cache.put(source, query, docs)
+    return docs, False
+
+
+async def acached_search(source, query, fetch, rate_limiter=None):
+    """cached_search() for async fetch functions; SQLite work runs off the event loop."""
+    cache = await asyncio.to_thread(get_retrieval_cache)
+    docs = await asyncio.to_thread(cache.get, source, query)
+    if docs is not None:
+        return docs, True
+    if rate_limiter is not None:
+        await rate_limiter.aacquire()
+    docs = await fetch(query)
+    if cacheable(source, query, docs):
+        await asyncio.to_thread(cache.put, source, query, docs)
+    return docs, False
+
+
+def to_records(documents):
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+
+
+def to_documents(records):
+    return [Document(**record) for record in records]
+
+
+def cache_stats(source, hit):
+    """Per-run hit and miss counts, merged across nodes with add_counts."""
+    return {f"{source}_hits" if hit else f"{source}_misses": 1}
+
+
+def add_counts(left, right):
+    merged = dict(left or {})
+    for name, count in (right or {}).items():
+        merged[name] = merged.get(name, 0) + count
+    return merged
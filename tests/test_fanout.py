@@ -0,0 +1,119 @@
+"""FanoutScheduler against the research assistant graph, with a fake chat model and sources.
+
+Run from the repository root with `python -m pytest tests`.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+WORKDIR = tempfile.mkdtemp(prefix='test_fanout_')
+os.environ.setdefault('OPENAI_API_KEY', 'fake')
+os.environ['LLM_CACHE_DB'] = os.path.join(WORKDIR, 'llm_cache.db')
+os.environ['RETRIEVAL_CACHE_DB'] = os.path.join(WORKDIR, 'retrieval_cache.db')
+os.environ.pop('CHECKPOINT_DB', None)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'module-4', 'studio'))
+
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+
+import research_assistant  # noqa: E402
+from fanout import TokenBucket  # noqa: E402
+
+ANALYSTS = 12
+EXECUTOR_WORKERS = 2
+
+
+class FakeChatModel(BaseChatModel):
+    n_analysts: int = ANALYSTS
+    model_name: str = 'gpt-4o'
+
+    @property
+    def _llm_type(self):
+        return 'fake-fanout-test'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = AIMessage(content=f'{uuid.uuid4().hex} Thank you so much for your help!')
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def with_structured_output(self, schema, **kwargs):
+        return FakeStructured(schema, self.n_analysts)
+
+
+class FakeStructured:
+    def __init__(self, schema, n_analysts):
+        self.schema = schema
+        self.n_analysts = n_analysts
+
+    def invoke(self, messages, *args, **kwargs):
+        if self.schema is research_assistant.Perspectives:
+            return research_assistant.Perspectives(analysts=[
+                research_assistant.Analyst(affiliation='Lab', name=f'Analyst {i}', role='Researcher',
+                                           description='Fan-out')
+                for i in range(self.n_analysts)
+            ])
+        return research_assistant.SearchQuery(search_query=f'query {uuid.uuid4().hex[:8]}')
+
+
+async def slow_source(query):
+    # A blocking client call, like WikipediaLoader, on the default executor
+    await asyncio.to_thread(time.sleep, 0.2)
+    return [research_assistant.context_document(query, 'document')], False
+
+
+def run_research(timeout):
+    """Run the full graph on a loop with a small default executor; (finished, state)."""
+    result = {}
+
+    def main():
+        loop = asyncio.new_event_loop()
+        loop.set_default_executor(ThreadPoolExecutor(EXECUTOR_WORKERS))
+        graph = research_assistant.builder.compile()
+        try:
+            result['state'] = loop.run_until_complete(graph.ainvoke({'topic': 'fan-out', 'max_analysts': ANALYSTS}))
+        except BaseException as error:
+            result['error'] = error
+
+    # A deadlocked run never returns, so it runs on a daemon thread we can walk away from
+    thread = threading.Thread(target=main, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        # Let every waiter in so the executor threads can exit with the test process
+        slots = research_assistant.interview_scheduler.slots
+        with slots._lock:
+            slots.limit = float('inf')
+            waiters, slots._waiters = slots._waiters, []
+        for _, _, waiter in waiters:
+            waiter.granted = True
+            waiter.wake()
+        thread.join()
+        return False, None
+    if 'error' in result:
+        raise result['error']
+    return not thread.is_alive(), result.get('state')
+
+
+def test_more_interviews_than_executor_workers_finish(monkeypatch):
+    monkeypatch.setattr(research_assistant, 'llm', FakeChatModel())
+    monkeypatch.setattr(research_assistant, 'SEARCH_SOURCES', {'slow': slow_source})
+
+    finished, state = run_research(timeout=60)
+
+    assert finished, 'research graph deadlocked'
+    assert len(state['sections']) == ANALYSTS
+
+
+def test_token_bucket_reports_free_tokens_without_taking_them():
+    bucket = TokenBucket(0.5, max_bucket_size=2)
+    assert bucket.has_token()
+    assert bucket.has_token()
+    assert bucket.acquire(blocking=False)
+    assert bucket.acquire(blocking=False)
+    assert not bucket.has_token()
+    assert not bucket.acquire(blocking=False)
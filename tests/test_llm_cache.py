@@ -0,0 +1,141 @@
+"""LLMCache request deduplication, against a fake chat model.
+
+Run from the repository root with `python -m pytest tests`.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'module-4', 'studio'))
+
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+
+from llm_cache import LLMCache  # noqa: E402
+
+# Long enough that a test waiting on it would time out first
+INFLIGHT_TIMEOUT = 60
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers after `delay` seconds, failing the first `failures` calls."""
+
+    delay: float = 0.0
+    failures: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return 'fake-llm-cache-test'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        call = self.calls
+        time.sleep(self.delay)
+        if call <= self.failures:
+            raise RuntimeError(f'call {call} failed')
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f'answer {call}'))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.delay)
+        if call <= self.failures:
+            raise RuntimeError(f'call {call} failed')
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f'answer {call}'))])
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMCache(str(tmp_path / 'llm_cache.db'), inflight_timeout=INFLIGHT_TIMEOUT)
+
+
+def timed(call, *args):
+    start = time.monotonic()
+    result = call(*args)
+    return result, time.monotonic() - start
+
+
+def test_identical_calls_share_one_request(cache):
+    model = FakeChatModel(delay=0.3, cache=cache)
+    results = [None, None]
+
+    def ask(i):
+        results[i] = model.invoke('hello').content
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert model.calls == 1
+    assert results == ['answer 1', 'answer 1']
+    assert cache.stats() == {'hits': 0, 'misses': 1, 'deduplicated': 1}
+
+
+def test_retry_after_failure_does_not_wait(cache):
+    model = FakeChatModel(failures=1, cache=cache)
+    with pytest.raises(RuntimeError):
+        model.invoke('hello')
+
+    answer, elapsed = timed(model.invoke, 'hello')
+    assert answer.content == 'answer 2'
+    assert elapsed < 5
+
+
+def test_failure_releases_waiting_callers(cache):
+    model = FakeChatModel(delay=0.3, failures=1, cache=cache)
+    outcomes = {}
+
+    def ask(name):
+        start = time.monotonic()
+        try:
+            outcomes[name] = model.invoke('hello').content, time.monotonic() - start
+        except RuntimeError:
+            outcomes[name] = 'failed', time.monotonic() - start
+
+    first = threading.Thread(target=ask, args=('first',))
+    first.start()
+    time.sleep(0.1)
+    second = threading.Thread(target=ask, args=('second',))
+    second.start()
+    first.join()
+    second.join()
+
+    assert outcomes['first'][0] == 'failed'
+    # The waiting caller made its own call once the first one failed
+    assert outcomes['second'][0] == 'answer 2'
+    assert outcomes['second'][1] < 5
+    assert model.calls == 2
+
+
+def test_async_failure_and_cancellation_release_the_call(cache):
+    model = FakeChatModel(delay=0.3, failures=1, cache=cache)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await model.ainvoke('hello')
+        retried, elapsed = await timed_async(model.ainvoke('hello'))
+        assert retried.content == 'answer 2'
+        assert elapsed < 5
+
+        # A call cancelled by a timeout never reports an error
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(model.ainvoke('other'), 0.1)
+        answer, elapsed = await timed_async(model.ainvoke('other'))
+        assert answer.content == 'answer 4'
+        assert elapsed < 5
+
+    asyncio.run(run())
+
+
+async def timed_async(coroutine):
+    start = time.monotonic()
+    result = await coroutine
+    return result, time.monotonic() - start
@@ -0,0 +1,53 @@
+"""What the retrieval cache keeps, against fake search tools.
+
+Run from the repository root with `python -m pytest tests`.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'module-4', 'studio'))
+
+import retrieval_cache  # noqa: E402
+from retrieval_cache import RetrievalCache, SearchError, cached_search  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    cache = RetrievalCache(str(tmp_path / 'retrieval_cache.db'))
+    monkeypatch.setattr(retrieval_cache, 'get_retrieval_cache', lambda: cache)
+    return cache
+
+
+class Tool:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self, query):
+        self.calls += 1
+        return self.results.pop(0)
+
+
+def test_results_are_cached():
+    tool = Tool([{'url': 'u', 'content': 'c'}])
+    assert cached_search('tavily', 'q', tool) == ([{'url': 'u', 'content': 'c'}], False)
+    assert cached_search('tavily', 'q', tool) == ([{'url': 'u', 'content': 'c'}], True)
+    assert tool.calls == 1
+
+
+def test_error_strings_raise_and_are_not_cached():
+    # TavilySearchResults returns repr(error) instead of raising
+    tool = Tool("HTTPError('429 Client Error: Too Many Requests')", [{'url': 'u', 'content': 'c'}])
+    with pytest.raises(SearchError):
+        cached_search('tavily', 'q', tool)
+    assert cached_search('tavily', 'q', tool) == ([{'url': 'u', 'content': 'c'}], False)
+    assert tool.calls == 2
+
+
+def test_empty_results_are_not_cached():
+    tool = Tool([], [])
+    cached_search('wikipedia', 'q', tool)
+    cached_search('wikipedia', 'q', tool)
+    assert tool.calls == 2
@@ -0,0 +1,30 @@
+"""Helper modules copied into several studio directories must stay identical.
+
+Each module-*/studio directory is deployed on its own (langgraph.json
+dependencies: ["."]), so a helper used by graphs in more than one of them
+is copied into each rather than imported from a shared package. module-4
+holds the reference copy; after editing it, copy it over the others.
+"""
+import filecmp
+import os
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+REFERENCE = 'module-4'
+
+SHARED_MODULES = {
+    'llm_cache.py': ['module-2'],
+    'checkpointer.py': ['module-1', 'module-2'],
+    'turns.py': ['module-1'],
+    'tokens.py': ['module-2'],
+}
+
+
+@pytest.mark.parametrize('name,module', [
+    (name, module) for name, modules in SHARED_MODULES.items() for module in modules
+])
+def test_copies_match_reference(name, module):
+    reference = os.path.join(ROOT, REFERENCE, 'studio', name)
+    copy = os.path.join(ROOT, module, 'studio', name)
+    assert filecmp.cmp(reference, copy, shallow=False), f'{module}/studio/{name} differs from {REFERENCE}/studio/{name}'